@@ -7,47 +7,58 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_absolute_error, r2_score
 import json
+import os
+import pickle
+import tempfile
 import warnings
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+
+from storage import apri_storage
+from registro_lru import RegistroLRU
+from anomalie import rileva_anomalie
+from feature_store import get_feature_store
 warnings.filterwarnings('ignore')
 
+# Modelli persistiti (sovrascrivibili da ambiente)
+MODELLI_DIR_DEFAULT = os.getenv('MODELLI_DIR', 'modelli')
+SOGLIA_DRIFT_DEFAULT = float(os.getenv('MODELLI_SOGLIA_DRIFT', '0.05'))
+
+# Versione del formato su disco: cambiarla invalida i modelli salvati
+FORMATO_MODELLO = 2
+
 class SpeseAI:
     """Sistema AI per predizioni e analisi delle spese"""
     
-    def __init__(self, csv_file: str = "spese.csv", config_file: str = "config.json"):
+    def __init__(self, csv_file: str = "spese.csv", config_file: str = "config.json",
+                 backend: Optional[str] = None, user_id: Optional[int] = None):
         self.csv_file = csv_file
         self.config_file = config_file
+        self.user_id = user_id
         
-        # Modelli
-        self.model_totale = RandomForestRegressor(n_estimators=50, random_state=42)
+        # Modelli (scikit-learn viene importato solo al primo uso)
+        self.model_totale = None
         self.models_categoria = {}
         
-        # Encoders
-        self.label_encoder = LabelEncoder()
+        # Codici categoria usati in training (stabili, dal feature store)
+        self.codici_categoria: Dict[str, int] = {}
+        
+        # Dataset e feature temporali condivisi con SpeseManager e SpeseAnalytics
+        self._storage = apri_storage(csv_file, backend, user_id)
+        self._cache = self._storage.cache
+        self._features = get_feature_store(self._cache)
+        
+        # Modello persistito: file, metadati e mtime dell'ultima lettura
+        cartella = "globale" if user_id is None else str(user_id)
+        self.modello_file = os.path.join(MODELLI_DIR_DEFAULT, cartella, "spesa_totale.pkl")
+        self.modello_info: Optional[Dict] = None
+        self._modello_mtime = None
         
     def _load_and_prepare_data(self) -> pd.DataFrame:
-        """Carica e prepara dati per ML"""
+        """Dati con feature temporali e categoria codificata (calcolate una volta per versione)"""
         try:
-            df = pd.read_csv(self.csv_file)
-            df['data'] = pd.to_datetime(df['data'])
-            
-            # Features temporali
-            df['anno'] = df['data'].dt.year
-            df['mese'] = df['data'].dt.month
-            df['giorno'] = df['data'].dt.day
-            df['giorno_settimana'] = df['data'].dt.dayofweek
-            df['giorno_anno'] = df['data'].dt.dayofyear
-            
-            # Encode categoria
-            if 'categoria' in df.columns:
-                df['categoria_encoded'] = self.label_encoder.fit_transform(df['categoria'])
-            
+            df = self._features.dataframe()
+            self.codici_categoria = dict(self._features.codici_categoria)
             return df
             
         except Exception as e:
@@ -61,6 +72,7 @@ class SpeseAI:
         Returns:
             Dict con metriche di performance del modello
         """
+        impronta = self.impronta_dati()
         df = self._load_and_prepare_data()
         
         if len(df) < 10:  # Dati insufficienti
@@ -82,6 +94,11 @@ class SpeseAI:
         y = df_mensile['importo']
         
         # Train model
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import mean_absolute_error, r2_score
+        self.model_totale = RandomForestRegressor(n_estimators=50, random_state=42)
+        
         if len(X) > 3:
             X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
             
@@ -92,7 +109,7 @@ class SpeseAI:
             mae = mean_absolute_error(y_test, y_pred)
             r2 = r2_score(y_test, y_pred)
             
-            return {
+            metriche = {
                 "success": True,
                 "mae": mae,
                 "r2": r2,
@@ -102,13 +119,105 @@ class SpeseAI:
         else:
             # Troppi pochi dati per split, usa tutti per training
             self.model_totale.fit(X, y)
-            return {
+            metriche = {
                 "success": True,
                 "mae": "N/A (dati limitati)",
                 "r2": "N/A (dati limitati)", 
                 "samples_train": len(X),
                 "samples_test": 0
             }
+        
+        self.salva_modello(metriche, impronta)
+        return metriche
+    
+    def impronta_dati(self) -> Dict[Tuple[int, int], float]:
+        """
+        Totale per (anno, mese) chiuso dal rollup: ciò da cui dipende il modello, senza caricare lo storico.
+        
+        Il mese in corso è escluso: quasi ogni inserimento ne sposta il totale oltre
+        la soglia, e riaddestrerebbe il modello a ogni transazione. Si riaddestra
+        quando il mese si chiude o quando cambia un mese passato.
+        """
+        rollup = self._storage.rollup_mensile()
+        if rollup.empty:
+            return {}
+        oggi = datetime.now()
+        totali = rollup.groupby(['anno', 'mese'])['somma'].sum()
+        return {(int(anno), int(mese)): float(totale) for (anno, mese), totale in totali.items()
+                if (int(anno), int(mese)) < (oggi.year, oggi.month)}
+    
+    @staticmethod
+    def cambiamento_materiale(vecchia: Dict, nuova: Dict, soglia: float = SOGLIA_DRIFT_DEFAULT) -> bool:
+        """True se cambiano i mesi o il totale di un mese varia oltre la soglia relativa"""
+        if vecchia.keys() != nuova.keys():
+            return True
+        return any(abs(nuova[k] - vecchia[k]) > soglia * max(abs(vecchia[k]), 1.0) for k in nuova)
+    
+    def salva_modello(self, metriche: Dict, impronta: Dict):
+        """Serializza modello, codici categoria, metriche e impronta dei dati (scrittura atomica)"""
+        self.modello_info = {
+            'formato': FORMATO_MODELLO,
+            'addestrato_il': datetime.now().isoformat(timespec='seconds'),
+            'impronta': impronta,
+            'metriche': metriche,
+            'modello': self.model_totale,
+            'codici_categoria': self.codici_categoria,
+        }
+        cartella = os.path.dirname(self.modello_file)
+        os.makedirs(cartella, exist_ok=True)
+        # File temporaneo unico: due addestramenti concorrenti (anche in processi diversi)
+        # non si sovrascrivono a vicenda, e os.replace pubblica sempre un file intero
+        fd, tmp = tempfile.mkstemp(dir=cartella, prefix=f"{os.path.basename(self.modello_file)}.", suffix='.tmp')
+        try:
+            os.fchmod(fd, 0o644)  # mkstemp crea 0600: stessi permessi di un open() normale
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(self.modello_info, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.modello_file)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._modello_mtime = os.stat(self.modello_file).st_mtime_ns
+    
+    def carica_modello(self) -> Optional[Dict]:
+        """Metadati del modello su disco (riletto solo se il file è cambiato), None se assente"""
+        try:
+            mtime = os.stat(self.modello_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        
+        if mtime != self._modello_mtime:
+            try:
+                with open(self.modello_file, 'rb') as f:
+                    info = pickle.load(f)
+            except Exception as e:
+                print(f"⚠️ Modello illeggibile, da riaddestrare: {e}")
+                return None
+            if info.get('formato') != FORMATO_MODELLO:
+                return None
+            self.modello_info = info
+            self.model_totale = info['modello']
+            self.codici_categoria = info['codici_categoria']
+            self._modello_mtime = mtime
+        return self.modello_info
+    
+    def modello_da_aggiornare(self) -> bool:
+        info = self.carica_modello()
+        return info is None or self.cambiamento_materiale(info['impronta'], self.impronta_dati())
+    
+    def aggiorna_modello(self, forza: bool = False) -> Dict:
+        """Riaddestra solo se i dati sono cambiati in modo materiale; restituisce le metriche"""
+        if not forza and not self.modello_da_aggiornare():
+            return self.modello_info['metriche']
+        return self.train_modello_spesa_totale()
+    
+    def previsione(self) -> Optional[Tuple[Dict, Dict]]:
+        """Sola inferenza con il modello salvato: (metriche, predizione), None se non c'è un modello"""
+        info = self.carica_modello()
+        if info is None:
+            return None
+        return info['metriche'], self.predici_spesa_mese_prossimo()
     
     def predici_spesa_mese_prossimo(self) -> Dict:
         """
@@ -117,6 +226,9 @@ class SpeseAI:
         Returns:
             Dict con predizione e confidence interval
         """
+        if self.model_totale is None:
+            return {"errore": "Modello non addestrato"}
+        
         try:
             # Prossimo mese
             prossimo_mese = datetime.now() + timedelta(days=30)
@@ -212,7 +324,7 @@ class SpeseAI:
             
             # Analisi per categoria
             oggi = datetime.now()
-            df_mese = df[(df['data'].dt.month == oggi.month) & (df['data'].dt.year == oggi.year)]
+            df_mese = df[(df['mese'] == oggi.month) & (df['anno'] == oggi.year)]
             
             spese_categoria = df_mese.groupby('categoria')['importo'].sum()
             
@@ -259,49 +371,43 @@ class SpeseAI:
         Returns:
             Lista di spese anomale
         """
-        df = self._load_and_prepare_data()
-        
-        if df.empty:
-            return []
-        
-        anomalie = []
-        
         try:
-            # Per ogni categoria, trova outliers
-            for categoria in df['categoria'].unique():
-                df_cat = df[df['categoria'] == categoria]
-                
-                if len(df_cat) < 3:  # Servono almeno 3 dati
-                    continue
-                
-                mean_cat = df_cat['importo'].mean()
-                std_cat = df_cat['importo'].std()
-                
-                # Soglia anomalia
-                soglia_sup = mean_cat + (soglia * std_cat)
-                
-                # Trova anomalie
-                outliers = df_cat[df_cat['importo'] > soglia_sup]
-                
-                for _, row in outliers.iterrows():
-                    anomalie.append({
-                        'data': row['data'].strftime('%Y-%m-%d'),
-                        'nome': row['nome_spesa'],
-                        'categoria': row['categoria'],
-                        'importo': row['importo'],
-                        'media_categoria': mean_cat,
-                        'differenza': row['importo'] - mean_cat
-                    })
-            
-            # Ordina per importo decrescente
-            anomalie.sort(key=lambda x: x['importo'], reverse=True)
-            
-            return anomalie[:10]  # Max 10 anomalie
+            # Statistiche per categoria in un solo groupby/transform
+            return rileva_anomalie(self._cache.get_dataframe(), soglia, limite=10)
             
         except Exception as e:
             print(f"❌ Errore detection anomalie: {e}")
             return []
 
+# Istanze riusate dentro ogni processo worker (LRU sugli utenti)
+_istanze_worker: RegistroLRU[SpeseAI] = RegistroLRU()
+
+def _ai_worker(user_id: Optional[int], csv_file: str, config_file: str) -> SpeseAI:
+    return _istanze_worker.ottieni((user_id, csv_file, config_file),
+                                   lambda: SpeseAI(csv_file, config_file, user_id=user_id))
+
+def addestra_e_predici(user_id: Optional[int] = None,
+                       csv_file: str = "spese.csv",
+                       config_file: str = "config.json") -> Tuple[Dict, Dict]:
+    """
+    Entry point per i worker del process pool: training (solo se i dati sono
+    cambiati rispetto al modello salvato) + predizione
+    
+    Returns:
+        (metriche training, predizione); predizione vuota se il training fallisce
+    """
+    ai = _ai_worker(user_id, csv_file, config_file)
+    training = ai.aggiorna_modello()
+    if 'errore' in training:
+        return training, {}
+    return training, ai.predici_spesa_mese_prossimo()
+
+def aggiorna_modello_utente(user_id: Optional[int] = None,
+                            csv_file: str = "spese.csv",
+                            config_file: str = "config.json") -> Dict:
+    """Entry point per il riaddestramento in background: riaddestra solo se i dati sono cambiati"""
+    return _ai_worker(user_id, csv_file, config_file).aggiorna_modello()
+
 # Test sistema AI
 if __name__ == "__main__":
     print("🤖 Test Sistema AI...")
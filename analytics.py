@@ -1,36 +1,118 @@
 #!/usr/bin/env python3
 """
 📊 Sistema Analytics e Grafici per Spese
-🎨 Matplotlib + Plotly per visualizzazioni
+🎨 Matplotlib + Seaborn per visualizzazioni
 """
 
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import io
-import base64
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import json
 import os
+import threading
+from collections import OrderedDict
 
-# Configurazione matplotlib per salvare immagini
-plt.switch_backend('Agg')  # Backend non-interattivo per Telegram
-sns.set_style("whitegrid")
+from storage import apri_storage
+from registro_lru import RegistroLRU
+from feature_store import get_feature_store
+
+_plt = None
+
+def _pyplot():
+    """matplotlib/seaborn importati al primo grafico: il bot non li carica all'avvio"""
+    global _plt
+    if _plt is None:
+        import matplotlib
+        matplotlib.use('Agg')  # Backend non-interattivo per Telegram
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        sns.set_style("whitegrid")
+        _plt = plt
+    return _plt
+
+# Limite della cache dei grafici renderizzati (MB, sovrascrivibile da ambiente)
+GRAFICI_CACHE_MB_DEFAULT = float(os.getenv('GRAFICI_CACHE_MB', '32'))
+
+# Profili di rendering: lato massimo in pixel, dpi, formato, qualità (JPEG/WebP) e budget in byte
+PROFILI_RENDERING = {
+    # Anteprima in chat: Telegram ricomprime comunque le foto oltre 1280px
+    'telegram-preview': {'lato_max': 1280, 'dpi': 150, 'formato': 'jpeg', 'qualita': 85, 'max_byte': 250 * 1024},
+    # Come l'anteprima, in WebP (Pillow): a parità di lato circa un terzo dei byte del JPEG
+    'webp-preview': {'lato_max': 1280, 'dpi': 150, 'formato': 'webp', 'qualita': 80, 'max_byte': 150 * 1024},
+    # Report completo su file: qualità piena
+    'full-report': {'lato_max': None, 'dpi': 300, 'formato': 'png', 'qualita': None, 'max_byte': None},
+}
+PROFILO_DEFAULT = os.getenv('GRAFICI_PROFILO', 'telegram-preview')
+if PROFILO_DEFAULT not in PROFILI_RENDERING:
+    raise ValueError(f"GRAFICI_PROFILO non valido: {PROFILO_DEFAULT!r} "
+                     f"(profili: {', '.join(PROFILI_RENDERING)})")
+
+# Misure di rendering per profilo in questo processo: grafici, secondi, byte
+misure_rendering: Dict[str, Dict[str, float]] = {}
+
+class CacheGrafici:
+    """
+    Grafici già renderizzati, condivisi da tutti gli utenti del processo.
+    
+    LRU limitata in byte totali: la chiave contiene utente, grafico, periodo,
+    firma dei dati da cui dipende e profilo, quindi una voce non va mai
+    invalidata esplicitamente (le chiavi vecchie escono per LRU).
+    """
+    
+    def __init__(self, max_byte: Optional[int] = None):
+        self.max_byte = max_byte or int(GRAFICI_CACHE_MB_DEFAULT * 1024 * 1024)
+        self._voci: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._byte = 0
+        self._lock = threading.Lock()
+        
+        # Contatori
+        self.hit = 0
+        self.miss = 0
+    
+    def get(self, chiave: tuple) -> Optional[bytes]:
+        with self._lock:
+            dati = self._voci.get(chiave)
+            if dati is None:
+                self.miss += 1
+                return None
+            self._voci.move_to_end(chiave)
+            self.hit += 1
+            return dati
+    
+    def put(self, chiave: tuple, dati: bytes):
+        if len(dati) > self.max_byte:
+            return
+        with self._lock:
+            vecchi = self._voci.pop(chiave, None)
+            if vecchi is not None:
+                self._byte -= len(vecchi)
+            self._voci[chiave] = dati
+            self._byte += len(dati)
+            while self._byte > self.max_byte:
+                _, uscito = self._voci.popitem(last=False)
+                self._byte -= len(uscito)
+
+cache_grafici = CacheGrafici()
 
 class SpeseAnalytics:
     """Gestore analytics e grafici per spese"""
     
-    def __init__(self, csv_file: str = "spese.csv", config_file: str = "config.json"):
+    def __init__(self, csv_file: str = "spese.csv", config_file: str = "config.json",
+                 backend: Optional[str] = None, user_id: Optional[int] = None):
         self.csv_file = csv_file
         self.config_file = config_file
+        self.user_id = user_id
         
         # Carica configurazione
         with open(config_file, 'r') as f:
             self.config = json.load(f)
+        
+        # Dataset condiviso + feature temporali calcolate una volta per versione
+        self._storage = apri_storage(csv_file, backend, user_id)
+        self._cache = self._storage.cache
+        self._features = get_feature_store(self._cache)
             
         # Colori per categorie
         self.colori_categorie = {
@@ -45,23 +127,61 @@ class SpeseAnalytics:
         }
     
     def _load_data(self) -> pd.DataFrame:
-        """Carica e prepara i dati"""
+        """Carica i dati con le colonne derivate (anno_mese, mese_nome, ...) dal feature store"""
         try:
-            df = pd.read_csv(self.csv_file)
-            df['data'] = pd.to_datetime(df['data'])
-            df['anno_mese'] = df['data'].dt.to_period('M')
-            df['mese_nome'] = df['data'].dt.strftime('%B %Y')
-            return df
+            return self._features.dataframe()
         except Exception as e:
             print(f"❌ Errore caricamento dati: {e}")
             return pd.DataFrame()
     
-    def grafico_torta_categorie(self, mese: int = None, anno: int = None, save_path: str = "grafico_torta.png") -> str:
+    @staticmethod
+    def _esporta(fig, save_path: Optional[str] = None, profilo: str = PROFILO_DEFAULT):
+        """
+        Esporta la figura secondo il profilo e la chiude.
+        
+        Oltre il budget in byte si abbassa prima la qualità (JPEG/WebP), poi la
+        risoluzione. Restituisce i bytes, oppure il path se è indicato save_path.
+        """
+        config = PROFILI_RENDERING[profilo]
+        inizio = time.perf_counter()
+        
+        dpi = config['dpi']
+        if config['lato_max']:
+            dpi = min(dpi, config['lato_max'] / max(fig.get_size_inches()))
+        qualita = config['qualita']
+        
+        try:
+            while True:
+                buffer = io.BytesIO()
+                opzioni = {'pil_kwargs': {'quality': qualita}} if qualita else {}
+                fig.savefig(buffer, format=config['formato'], dpi=dpi, bbox_inches='tight', **opzioni)
+                dati = buffer.getvalue()
+                if not config['max_byte'] or len(dati) <= config['max_byte'] or dpi < 50:
+                    break
+                if qualita and qualita > 50:
+                    qualita -= 15
+                else:
+                    dpi *= 0.8
+        finally:
+            _pyplot().close(fig)
+        
+        misura = misure_rendering.setdefault(profilo, {'grafici': 0, 'secondi': 0.0, 'byte': 0})
+        misura['grafici'] += 1
+        misura['secondi'] += time.perf_counter() - inizio
+        misura['byte'] += len(dati)
+        
+        if save_path:
+            with open(save_path, 'wb') as f:
+                f.write(dati)
+            return save_path
+        return dati
+    
+    def grafico_torta_categorie(self, mese: int = None, anno: int = None, save_path: Optional[str] = None, profilo: str = PROFILO_DEFAULT):
         """
         Crea grafico a torta per spese per categoria
         
         Returns:
-            Path del file immagine salvato
+            Immagine in memoria (bytes, formato del profilo), oppure il path se è indicato save_path
         """
         df = self._load_data()
         
@@ -83,6 +203,7 @@ class SpeseAnalytics:
         categorie = df.groupby('categoria')['importo'].sum()
         
         # Crea grafico
+        plt = _pyplot()
         fig, ax = plt.subplots(figsize=(10, 8))
         
         colors = [self.colori_categorie.get(cat, '#95A5A6') for cat in categorie.index]
@@ -104,12 +225,9 @@ class SpeseAnalytics:
         ax.set_title(f'💰 Spese per Categoria - {periodo}', fontsize=16, fontweight='bold')
         
         plt.tight_layout()
-        plt.savefig(save_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        return save_path
+        return self._esporta(fig, save_path, profilo)
     
-    def grafico_trend_mensile(self, save_path: str = "trend_mensile.png") -> str:
+    def grafico_trend_mensile(self, save_path: Optional[str] = None, profilo: str = PROFILO_DEFAULT):
         """Grafico trend spese mensili"""
         df = self._load_data()
         
@@ -121,6 +239,7 @@ class SpeseAnalytics:
         trend_mensile['mese_str'] = trend_mensile['anno_mese'].astype(str)
         
         # Crea grafico
+        plt = _pyplot()
         fig, ax = plt.subplots(figsize=(12, 6))
         
         ax.plot(
@@ -150,12 +269,9 @@ class SpeseAnalytics:
         ax.grid(True, alpha=0.3)
         
         plt.tight_layout()
-        plt.savefig(save_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        return save_path
+        return self._esporta(fig, save_path, profilo)
     
-    def grafico_budget_vs_reale(self, mese: int = None, anno: int = None, save_path: str = "budget_vs_reale.png") -> str:
+    def grafico_budget_vs_reale(self, mese: int = None, anno: int = None, save_path: Optional[str] = None, profilo: str = PROFILO_DEFAULT):
         """Grafico confronto budget vs spese reali"""
         df = self._load_data()
         
@@ -185,6 +301,7 @@ class SpeseAnalytics:
         x = range(len(categorie))
         width = 0.35
         
+        plt = _pyplot()
         fig, ax = plt.subplots(figsize=(14, 8))
         
         bars1 = ax.bar([i - width/2 for i in x], budget_values, width, 
@@ -216,12 +333,9 @@ class SpeseAnalytics:
         ax.grid(True, alpha=0.3, axis='y')
         
         plt.tight_layout()
-        plt.savefig(save_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        return save_path
+        return self._esporta(fig, save_path, profilo)
     
-    def grafico_spese_settimanali(self, save_path: str = "spese_settimanali.png") -> str:
+    def grafico_spese_settimanali(self, save_path: Optional[str] = None, profilo: str = PROFILO_DEFAULT):
         """Grafico spese per giorno della settimana"""
         df = self._load_data()
         
@@ -246,6 +360,7 @@ class SpeseAnalytics:
         spese_giorno = df_recente.groupby('giorno_ita')['importo'].sum().reindex(giorni_ita, fill_value=0)
         
         # Crea grafico
+        plt = _pyplot()
         fig, ax = plt.subplots(figsize=(12, 6))
         
         colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD', '#98D8C8']
@@ -267,10 +382,55 @@ class SpeseAnalytics:
         
         plt.xticks(rotation=45)
         plt.tight_layout()
-        plt.savefig(save_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        return self._esporta(fig, save_path, profilo)
+    
+    def _cartella_grafici(self) -> str:
+        # Una cartella per utente
+        cartella = "grafici" if self.user_id is None else os.path.join("grafici", str(self.user_id))
+        os.makedirs(cartella, exist_ok=True)
+        return cartella
+    
+    def genera_grafico(self, nome: str, profilo: str = PROFILO_DEFAULT) -> Optional[bytes]:
+        """Immagine in memoria di un grafico del report ('torta', 'trend', 'budget', 'settimana')"""
+        metodo, _ = GRAFICI_REPORT[nome]
+        return getattr(self, metodo)(profilo=profilo)
+    
+    def chiave_grafico(self, nome: str, profilo: str = PROFILO_DEFAULT) -> tuple:
+        """
+        Chiave di cache di un grafico: (utente, grafico, periodo, firma dati, profilo).
         
-        return save_path
+        La firma copre solo gli aggregati da cui il grafico dipende: le celle del
+        rollup del mese (torta, budget + config budget), tutto il rollup (trend),
+        la versione del dataset per la finestra mobile di 30 giorni (settimana).
+        """
+        oggi = datetime.now()
+        rollup = self._storage.rollup_mensile()
+        
+        if nome in ('torta', 'budget'):
+            periodo = (oggi.year, oggi.month)
+            celle = rollup[(rollup['anno'] == oggi.year) & (rollup['mese'] == oggi.month)]
+            firma = (len(celle), int(pd.util.hash_pandas_object(celle, index=False).sum()))
+            if nome == 'budget':
+                firma += (json.dumps(self.config.get('budget_mensile', {}), sort_keys=True),)
+        elif nome == 'trend':
+            periodo = 'tutto'
+            firma = (len(rollup), int(pd.util.hash_pandas_object(rollup, index=False).sum()))
+        else:
+            periodo = oggi.strftime('%Y-%m-%d')
+            firma = (self._cache.snapshot()[0],)
+        
+        return (self.user_id, nome, periodo, firma, profilo)
+    
+    def chiavi_report(self, profilo: str = PROFILO_DEFAULT) -> Dict[str, tuple]:
+        """Chiavi di cache di tutti i grafici del report"""
+        return {nome: self.chiave_grafico(nome, profilo) for nome in GRAFICI_REPORT}
+    
+    def grafico_da_cache(self, chiave: tuple) -> Optional[bytes]:
+        """Immagine memorizzata (b'' se il grafico non aveva dati), None se da renderizzare"""
+        return cache_grafici.get(chiave)
+    
+    def memorizza_grafico(self, chiave: tuple, dati: bytes):
+        cache_grafici.put(chiave, dati)
     
     def genera_report_completo(self) -> Dict[str, str]:
         """
@@ -282,14 +442,10 @@ class SpeseAnalytics:
         grafici = {}
         
         try:
-            # Crea directory per i grafici
-            os.makedirs("grafici", exist_ok=True)
-            
-            # Genera grafici
-            grafici['torta'] = self.grafico_torta_categorie(save_path="grafici/torta_categorie.png")
-            grafici['trend'] = self.grafico_trend_mensile(save_path="grafici/trend_mensile.png")
-            grafici['budget'] = self.grafico_budget_vs_reale(save_path="grafici/budget_vs_reale.png")
-            grafici['settimana'] = self.grafico_spese_settimanali(save_path="grafici/spese_settimanali.png")
+            for nome, (metodo, file_name) in GRAFICI_REPORT.items():
+                grafici[nome] = getattr(self, metodo)(
+                    save_path=os.path.join(self._cartella_grafici(), file_name), profilo='full-report'
+                )
             
             # Rimuovi valori None
             grafici = {k: v for k, v in grafici.items() if v is not None}
@@ -299,6 +455,42 @@ class SpeseAnalytics:
         
         return grafici
 
+# Grafici del report completo: nome → (metodo, file)
+GRAFICI_REPORT = {
+    'torta': ('grafico_torta_categorie', 'torta_categorie.png'),
+    'trend': ('grafico_trend_mensile', 'trend_mensile.png'),
+    'budget': ('grafico_budget_vs_reale', 'budget_vs_reale.png'),
+    'settimana': ('grafico_spese_settimanali', 'spese_settimanali.png'),
+}
+
+# Istanze riusate dentro ogni processo worker (dataset e config restano in memoria, LRU sugli utenti)
+_istanze_worker: RegistroLRU['SpeseAnalytics'] = RegistroLRU()
+
+def _analytics_worker(user_id: Optional[int], csv_file: str, config_file: str) -> 'SpeseAnalytics':
+    return _istanze_worker.ottieni((user_id, csv_file, config_file),
+                                   lambda: SpeseAnalytics(csv_file, config_file, user_id=user_id))
+
+def genera_grafico_utente(nome: str,
+                          user_id: Optional[int] = None,
+                          csv_file: str = "spese.csv",
+                          config_file: str = "config.json",
+                          profilo: str = PROFILO_DEFAULT) -> Tuple[Optional[bytes], float]:
+    """
+    Entry point per i worker del process pool: immagine in memoria di un grafico di un utente.
+    
+    Restituisce anche i secondi di lavoro nel worker: le metriche del processo
+    worker non sono esposte, le registra il chiamante (RENDERING_SECONDI/BYTE).
+    """
+    inizio = time.perf_counter()
+    dati = _analytics_worker(user_id, csv_file, config_file).genera_grafico(nome, profilo)
+    return dati, time.perf_counter() - inizio
+
+def genera_report_utente(user_id: Optional[int] = None,
+                         csv_file: str = "spese.csv",
+                         config_file: str = "config.json") -> Dict[str, str]:
+    """Entry point per i worker del process pool: report completo di un utente"""
+    return _analytics_worker(user_id, csv_file, config_file).genera_report_completo()
+
 # Test del sistema
 if __name__ == "__main__":
     print("🧪 Test Analytics...")
@@ -312,4 +504,13 @@ if __name__ == "__main__":
     for nome, path in grafici.items():
         print(f"  - {nome}: {path}")
     
+    # Confronto dei profili: tempo di rendering e dimensione per grafico
+    for profilo in PROFILI_RENDERING:
+        for nome in GRAFICI_REPORT:
+            analytics.genera_grafico(nome, profilo)
+        misura = misure_rendering.get(profilo)
+        if misura:
+            print(f"🎨 {profilo}: {misura['secondi'] / misura['grafici'] * 1000:.0f} ms, "
+                  f"{misura['byte'] / misura['grafici'] / 1024:.0f} KB per grafico")
+    
     print("✅ Test completato!")
\ No newline at end of file
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+🚨 Rilevamento Anomalie nelle Spese
+📐 Statistiche per categoria aggiornate in streaming (Welford) e scansione storica vettoriale
+"""
+
+import math
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# Configurazione (sovrascrivibile da ambiente)
+SOGLIA_DEFAULT = float(os.getenv('ANOMALIE_SOGLIA', '2.0'))  # deviazioni standard sopra la media
+MIN_CAMPIONI = 3
+
+
+def rileva_anomalie(df: pd.DataFrame, soglia: float = SOGLIA_DEFAULT, limite: Optional[int] = 10) -> List[Dict]:
+    """
+    Transazioni con importo oltre media + soglia * std della propria categoria.
+
+    Media e deviazione standard (campionaria) di ogni categoria sono calcolate
+    in un solo groupby/transform; le categorie con meno di MIN_CAMPIONI
+    transazioni sono ignorate. Risultato ordinato per importo decrescente.
+    """
+    if df.empty:
+        return []
+
+    importi = df['importo']
+    gruppi = importi.groupby(df['categoria'])
+    media = gruppi.transform('mean')
+    std = gruppi.transform('std')
+    conteggio = gruppi.transform('size')
+
+    selezione = (conteggio >= MIN_CAMPIONI) & (importi > media + soglia * std)
+    outliers = pd.DataFrame({
+        'data': df.loc[selezione, 'data'].dt.strftime('%Y-%m-%d'),
+        'nome': df.loc[selezione, 'nome_transazione'],
+        'categoria': df.loc[selezione, 'categoria'],
+        'importo': importi[selezione],
+        'media_categoria': media[selezione],
+        'differenza': importi[selezione] - media[selezione],
+    }).sort_values('importo', ascending=False, kind='stable')
+
+    if limite is not None:
+        outliers = outliers.head(limite)
+    return outliers.to_dict('records')
+
+
+class StatisticheCategorie:
+    """
+    Conteggio, media e varianza degli importi per categoria, in O(1) per insert.
+
+    Lo stato è quello di Welford (n, media, M2), ricostruibile in blocco da un
+    DataFrame. valuta() applica lo stesso criterio di rileva_anomalie() alle
+    statistiche correnti, quindi una transazione segnalata all'inserimento
+    compare anche nella scansione storica.
+    """
+
+    def __init__(self):
+        self._stato: Dict[str, list] = {}  # categoria → [n, media, M2]
+        self._lock = threading.Lock()
+
+    def aggiorna(self, record: dict):
+        """Incorpora l'importo di una transazione"""
+        importo = float(record['importo'])
+        with self._lock:
+            stato = self._stato.setdefault(record['categoria'], [0, 0.0, 0.0])
+            stato[0] += 1
+            delta = importo - stato[1]
+            stato[1] += delta / stato[0]
+            stato[2] += delta * (importo - stato[1])
+
+    def ricostruisci(self, df: pd.DataFrame):
+        """Ricalcola lo stato di tutte le categorie da un dataset completo"""
+        stato = {}
+        if not df.empty:
+            aggregati = df.groupby('categoria')['importo'].agg(['size', 'mean', 'var'])
+            for categoria, n, media, varianza in aggregati.itertuples(name=None):
+                m2 = varianza * (n - 1) if n > 1 else 0.0
+                stato[categoria] = [int(n), float(media), float(m2)]
+        with self._lock:
+            self._stato = stato
+
+    def statistiche(self, categoria: str) -> Tuple[int, float, float]:
+        """(n, media, deviazione standard campionaria) della categoria"""
+        with self._lock:
+            n, media, m2 = self._stato.get(categoria, (0, 0.0, 0.0))
+        return n, media, math.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+
+    def valuta(self, categoria: str, importo: float, soglia: float = SOGLIA_DEFAULT) -> Optional[Dict]:
+        """Dettagli dell'anomalia se l'importo supera media + soglia * std, altrimenti None"""
+        n, media, std = self.statistiche(categoria)
+        if n < MIN_CAMPIONI or importo <= media + soglia * std:
+            return None
+        return {
+            'categoria': categoria,
+            'importo': importo,
+            'media_categoria': media,
+            'deviazioni': (importo - media) / std if std > 0 else math.inf,
+            'rapporto': importo / media if media > 0 else math.inf,
+        }
+
+
+# Test rapido: python anomalie.py
+if __name__ == "__main__":
+    import time
+
+    import numpy as np
+
+    rng = np.random.default_rng(42)
+    n = 200000
+    df = pd.DataFrame({
+        'data': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 730, n), unit='D'),
+        'nome_transazione': 'spesa',
+        'categoria': rng.choice(['Casa', 'Alimentari', 'Svago', 'Trasporti'], n),
+        'importo': rng.lognormal(3, 0.5, n).round(2),
+    })
+
+    inizio = time.perf_counter()
+    anomalie = rileva_anomalie(df)
+    print(f"📊 Scansione vettoriale di {n} transazioni: {(time.perf_counter() - inizio) * 1000:.1f} ms, "
+          f"top anomalia {anomalie[0]['categoria']} €{anomalie[0]['importo']:.2f}")
+
+    # Welford in streaming coincide con il calcolo in blocco
+    streaming = StatisticheCategorie()
+    inizio = time.perf_counter()
+    for record in df[['categoria', 'importo']].to_dict('records'):
+        streaming.aggiorna(record)
+    durata = (time.perf_counter() - inizio) / n * 1e6
+    blocco = StatisticheCategorie()
+    blocco.ricostruisci(df)
+    for categoria in ('Casa', 'Svago'):
+        s, b = streaming.statistiche(categoria), blocco.statistiche(categoria)
+        print(f"  - {categoria}: streaming n={s[0]} μ={s[1]:.4f} σ={s[2]:.4f} | blocco μ={b[1]:.4f} σ={b[2]:.4f}")
+    print(f"⚡ Aggiornamento medio: {durata:.2f} µs")
+
+    for importo in (25.0, 400.0):
+        print(f"  - Svago €{importo:.0f}: {streaming.valuta('Svago', importo)}")
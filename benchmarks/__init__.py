@@ -0,0 +1,4 @@
+"""
+⏱️ Benchmark del Finance AI Bot
+Ogni modulo si esegue con: python -m benchmarks.<nome>
+"""
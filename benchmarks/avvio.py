@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+🚀 Benchmark del Tempo di Avvio
+📦 Costo di import per modulo (python -X importtime) e dipendenze pesanti caricate
+
+Uso: python -m benchmarks.avvio [--modulo financebot_final] [--ripetizioni 5] [--top 15]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+RADICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dipendenze che non devono essere caricate all'avvio del bot
+PESANTI = ['matplotlib', 'seaborn', 'plotly', 'scipy', 'sklearn', 'openai']
+
+_RIGA = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+
+def _esegui(codice: str, cartella: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    # Cartella di lavoro temporanea: l'import del bot crea log e cache nella cwd
+    comando = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', codice]
+    env = dict(os.environ, PYTHONPATH=RADICE)
+    return subprocess.run(comando, cwd=cartella, env=env, capture_output=True, text=True, check=True)
+
+
+def misura_import(modulo: str, cartella: str) -> List[Tuple[int, str, int, int]]:
+    """Righe di -X importtime come (profondità, modulo, self µs, cumulativo µs)"""
+    risultato = _esegui(f"import {modulo}", cartella, importtime=True)
+    righe = []
+    for riga in risultato.stderr.splitlines():
+        match = _RIGA.match(riga)
+        if match:
+            self_us, cumulativo_us, rientro, nome = match.groups()
+            righe.append((len(rientro) // 2, nome, int(self_us), int(cumulativo_us)))
+    return righe
+
+
+def moduli_caricati(modulo: str, cartella: str) -> List[str]:
+    codice = (f"import sys, {modulo}; "
+              f"print(','.join(m for m in {PESANTI!r} if m in sys.modules))")
+    return [m for m in _esegui(codice, cartella).stdout.strip().split(',') if m]
+
+
+def tempo_avvio(modulo: str, cartella: str, ripetizioni: int) -> Dict[str, float]:
+    """Tempo a parete di un interprete che importa il modulo (min/mediana su N avvii)"""
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        _esegui(f"import {modulo}", cartella)
+        tempi.append(time.perf_counter() - inizio)
+    tempi.sort()
+    return {'min': tempi[0], 'mediana': tempi[len(tempi) // 2]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo di avvio e costo di import per modulo")
+    parser.add_argument('--modulo', default='financebot_final')
+    parser.add_argument('--ripetizioni', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cartella:
+        righe = misura_import(args.modulo, cartella)
+        pesanti = moduli_caricati(args.modulo, cartella)
+        avvio = tempo_avvio(args.modulo, cartella, args.ripetizioni)
+
+    radice = next((r for r in righe if r[1] == args.modulo), None)
+    print(f"🚀 Avvio di '{args.modulo}': min {avvio['min'] * 1000:.0f} ms, "
+          f"mediana {avvio['mediana'] * 1000:.0f} ms ({args.ripetizioni} avvii)")
+    if radice:
+        print(f"📦 Import cumulativo: {radice[3] / 1000:.0f} ms")
+
+    # Dipendenze dirette del modulo (profondità 1 sotto la radice), più costose prima
+    dirette = sorted((r for r in righe if r[0] == 1), key=lambda r: r[3], reverse=True)
+    print(f"\n{'modulo':<32}{'cumulativo ms':>15}{'self ms':>10}")
+    for _, nome, self_us, cumulativo_us in dirette[:args.top]:
+        print(f"{nome:<32}{cumulativo_us / 1000:>15.1f}{self_us / 1000:>10.1f}")
+
+    print(f"\n🐘 Dipendenze pesanti caricate all'avvio: {', '.join(pesanti) or 'nessuna'}")
+
+
+if __name__ == "__main__":
+    main()
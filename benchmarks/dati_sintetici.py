@@ -0,0 +1,133 @@
+"""
+🧪 Ledger Sintetico Deterministico
+📅 Categorie realistiche, stagionalità, mix spese/ricavi e più utenti, riproducibili da seed
+"""
+
+import os
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from dataset_cache import COLONNE
+from storage import percorso_partizione
+
+# (categoria, frequenza relativa, importo tipico €, trend mensile, ampiezza stagionale, mese di picco, descrizioni)
+PROFILO_SPESE = [
+    ('Alimentari', 0.26, 32.0, 0.003, 0.08, 12, ['Esselunga', 'Coop', 'Lidl', 'Conad', 'panetteria', 'frutta e verdura']),
+    ('Ristorazione', 0.22, 16.0, 0.004, 0.20, 7, ['pizzeria', 'caffè al bar', 'sushi', 'pranzo', 'aperitivo', 'Glovo']),
+    ('Trasporti', 0.16, 28.0, 0.002, 0.25, 8, ['benzina', 'treno', 'parcheggio', 'metro', 'Telepass', 'taxi']),
+    ('Svago', 0.10, 24.0, 0.000, 0.40, 8, ['cinema', 'Netflix', 'palestra', 'concerto', 'libri', 'museo']),
+    ('Casa', 0.09, 110.0, 0.005, 0.15, 1, ['affitto', 'bolletta luce', 'bolletta gas', 'internet', 'Ikea']),
+    ('Abbigliamento', 0.06, 55.0, -0.002, 0.50, 11, ['scarpe', 'Zara', 'giacca', 'maglietta', 'Decathlon']),
+    ('Salute', 0.05, 38.0, 0.000, 0.10, 2, ['farmacia', 'dentista', 'visita medica', 'analisi']),
+    ('Varie', 0.06, 20.0, 0.000, 0.00, 1, ['regalo', 'Amazon', 'ferramenta', 'posta']),
+]
+
+# (categoria, frequenza relativa, importo tipico €, descrizioni)
+PROFILO_RICAVI = [
+    ('Stipendio', 0.55, 2300.0, ['stipendio', 'busta paga']),
+    ('Freelance', 0.20, 450.0, ['consulenza', 'fattura cliente']),
+    ('Vendite', 0.15, 60.0, ['venduto su Vinted', 'vendita usato']),
+    ('Famiglia', 0.10, 100.0, ['regalo nonna', 'paghetta']),
+]
+
+
+def _primo_mese(mesi: int, inizio: Optional[Tuple[int, int]]) -> pd.Timestamp:
+    if inizio:
+        return pd.Timestamp(year=inizio[0], month=inizio[1], day=1)
+    # Default: il ledger termina con il mese corrente (budget e statistiche hanno dati)
+    oggi = datetime.now()
+    return pd.Timestamp(year=oggi.year, month=oggi.month, day=1) - pd.DateOffset(months=mesi - 1)
+
+
+def _estrai(rng: np.random.Generator, profilo: list, n: int, giorni: int, primo: pd.Timestamp,
+            indice_freq: int, indice_importo: int, indice_descr: int) -> Dict[str, np.ndarray]:
+    """Categoria, data, descrizione e importo tipico di n transazioni (tutto vettoriale)"""
+    frequenze = np.array([p[indice_freq] for p in profilo])
+    categorie = rng.choice(len(profilo), size=n, p=frequenze / frequenze.sum())
+
+    # Descrizioni: tabella piatta, offset per categoria + indice casuale nel gruppo
+    descrizioni = np.array([d for p in profilo for d in p[indice_descr]], dtype=object)
+    quanti = np.array([len(p[indice_descr]) for p in profilo])
+    offset = np.concatenate([[0], np.cumsum(quanti)[:-1]])
+    scelte = offset[categorie] + (rng.random(n) * quanti[categorie]).astype(np.int64)
+
+    date = primo + pd.to_timedelta(rng.integers(0, giorni, size=n), unit='D')
+    return {
+        'categoria': np.array([p[0] for p in profilo], dtype=object)[categorie],
+        'indici': categorie,
+        'data': date,
+        'nome_transazione': descrizioni[scelte],
+        'tipico': np.array([p[indice_importo] for p in profilo])[categorie],
+    }
+
+
+def genera_ledger(n_transazioni: int, mesi: int = 24, inizio: Optional[Tuple[int, int]] = None,
+                  quota_ricavi: float = 0.04, utenti: int = 1, seed: int = 42) -> pd.DataFrame:
+    """
+    Ledger di n transazioni su `mesi` mesi (di default fino al mese corrente).
+
+    Gli importi sono lognormali attorno all'importo tipico della categoria,
+    con un trend mensile composto e una stagionalità annuale con picco nel
+    mese indicato dal profilo. Con utenti > 1 si aggiunge la colonna
+    'user_id', con attività distribuita come una legge di Zipf (pochi utenti
+    molto attivi, molti occasionali). Stesso seed e stesso `inizio`, stesso ledger.
+    """
+    rng = np.random.default_rng(seed)
+    primo = _primo_mese(mesi, inizio)
+    giorni = (primo + pd.DateOffset(months=mesi) - primo).days
+
+    n_ricavi = int(n_transazioni * quota_ricavi)
+    n_spese = n_transazioni - n_ricavi
+
+    spese = _estrai(rng, PROFILO_SPESE, n_spese, giorni, primo, 1, 2, 6)
+    mese_relativo = (spese['data'].year - primo.year) * 12 + spese['data'].month - primo.month
+    trend = np.array([p[3] for p in PROFILO_SPESE])[spese['indici']]
+    ampiezza = np.array([p[4] for p in PROFILO_SPESE])[spese['indici']]
+    picco = np.array([p[5] for p in PROFILO_SPESE])[spese['indici']]
+    fattore = (1 + trend) ** mese_relativo * (1 + ampiezza * np.cos(2 * np.pi * (spese['data'].month - picco) / 12))
+    importi_spese = spese['tipico'] * fattore * rng.lognormal(-0.125, 0.5, size=n_spese)
+
+    ricavi = _estrai(rng, PROFILO_RICAVI, n_ricavi, giorni, primo, 1, 2, 3)
+    importi_ricavi = ricavi['tipico'] * rng.lognormal(-0.02, 0.2, size=n_ricavi)
+
+    ledger = pd.DataFrame({
+        'data': np.concatenate([spese['data'].values, ricavi['data'].values]),
+        'nome_transazione': np.concatenate([spese['nome_transazione'], ricavi['nome_transazione']]),
+        'categoria': np.concatenate([spese['categoria'], ricavi['categoria']]),
+        'importo': np.maximum(0.5, np.concatenate([importi_spese, importi_ricavi])).round(2),
+        'tipo': np.repeat(['spesa', 'ricavo'], [n_spese, n_ricavi]),
+        'note': '',
+    })
+    if utenti > 1:
+        pesi = 1.0 / np.arange(1, utenti + 1) ** 1.1
+        ledger['user_id'] = rng.choice(np.arange(1, utenti + 1), size=n_transazioni, p=pesi / pesi.sum())
+
+    ledger = ledger.sort_values('data', kind='stable').reset_index(drop=True)
+    ledger['data'] = ledger['data'].dt.strftime('%Y-%m-%d')
+    return ledger[COLONNE + (['user_id'] if utenti > 1 else [])]
+
+
+def salva_ledger(ledger: pd.DataFrame, csv_file: str) -> Dict[Optional[int], str]:
+    """
+    Scrive il ledger nel formato dello storage CSV.
+
+    Con la colonna 'user_id' scrive una partizione per utente
+    (spese_utenti/<user_id>.csv), altrimenti il solo file indicato.
+
+    Returns:
+        Dict user_id → percorso (None per il ledger globale)
+    """
+    if 'user_id' not in ledger.columns:
+        ledger.to_csv(csv_file, index=False)
+        return {None: csv_file}
+
+    percorsi = {}
+    for user_id, righe in ledger.groupby('user_id', sort=True):
+        percorso = percorso_partizione(csv_file, int(user_id))
+        os.makedirs(os.path.dirname(percorso), exist_ok=True)
+        righe[COLONNE].to_csv(percorso, index=False)
+        percorsi[int(user_id)] = percorso
+    return percorsi
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+📏 Benchmark di Storage, Analytics e AI al crescere dei dati
+⏱️ Tempo e picco di memoria per operazione, su ledger sintetici di varie dimensioni
+
+Uso: python -m benchmarks.ledger [--taglie 10k,100k,1M] [--backend csv|sqlite] [--utenti 1]
+                                 [--operazioni verifica_budget,...] [--json risultati.json]
+                                 [--confronta baseline.json --tolleranza 0.25]
+
+Ogni taglia gira in un processo separato: le cache process-wide di una taglia
+non falsano la memoria della successiva. Le operazioni partono a regime
+(dataset, rollup e feature store già costruiti, librerie già importate: il costo
+di avvio è in benchmarks.avvio), tranne 'caricamento' che misura la lettura a
+freddo. Il tempo è misurato senza tracemalloc, il picco di memoria con una
+seconda esecuzione tracciata.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+MB = 1024 * 1024
+
+OPERAZIONI = ['caricamento', 'aggiungi_transazione', 'verifica_budget', 'get_statistiche_generali',
+              'genera_report_completo', 'train_modello_spesa_totale', 'detecta_anomalie']
+
+
+def _taglia(testo: str) -> int:
+    """'10k' → 10000, '1M' → 1000000"""
+    moltiplicatori = {'k': 1000, 'm': 1000000}
+    testo = testo.strip().lower()
+    if testo[-1] in moltiplicatori:
+        return int(float(testo[:-1]) * moltiplicatori[testo[-1]])
+    return int(testo)
+
+
+def _misura(funzione: Callable, ripetizioni: int = 1, prepara: Optional[Callable] = None) -> Dict[str, float]:
+    """Tempo medio (senza tracing) e picco di memoria allocata (esecuzione tracciata)"""
+    if prepara:
+        prepara()
+    inizio = time.perf_counter()
+    for _ in range(ripetizioni):
+        funzione()
+    durata = (time.perf_counter() - inizio) / ripetizioni
+
+    if prepara:
+        prepara()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        for _ in range(ripetizioni):
+            funzione()
+        picco = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return {'secondi': durata, 'picco_mb': picco / MB}
+
+
+def _esegui_taglia(n: int, args: dict) -> List[Dict]:
+    """Genera il ledger di n transazioni ed esegue le operazioni (nel processo figlio)"""
+    with tempfile.TemporaryDirectory() as cartella:
+        # Modelli, grafici, config e backup finiscono nella cartella temporanea
+        os.chdir(cartella)
+        sys.path.insert(0, args['radice'])
+
+        from benchmarks.dati_sintetici import genera_ledger, salva_ledger
+        from spese_manager import SpeseManager
+        from analytics import SpeseAnalytics, _pyplot
+        from ai_predictor import SpeseAI
+        from feature_store import get_feature_store
+        import sklearn.ensemble  # noqa: F401 (import a carico di benchmarks.avvio)
+        _pyplot()
+
+        ledger = genera_ledger(n, mesi=args['mesi'], utenti=args['utenti'], seed=args['seed'])
+        percorsi = salva_ledger(ledger, 'spese.csv')
+        del ledger
+
+        # Con più utenti si misura la partizione più grande (il caso peggiore)
+        user_id = max(percorsi, key=lambda u: os.path.getsize(percorsi[u]))
+        if args['backend'] == 'sqlite':
+            # Il CSV della partizione viene migrato come utente legacy (0)
+            csv_file, user_id = percorsi[user_id], 0
+        else:
+            csv_file = 'spese.csv'
+
+        kwargs = {'backend': args['backend'], 'user_id': user_id}
+        manager = SpeseManager(csv_file, 'config.json', 'backup', **kwargs)
+        righe = {'n': len(manager.get_dataframe())}
+
+        def caricamento():
+            righe['n'] = len(manager.get_dataframe())
+
+        analytics = ai = None
+        risultati = []
+        for operazione in args['operazioni']:
+            ripetizioni, prepara = 1, None
+            if operazione == 'caricamento':
+                funzione, prepara = caricamento, manager.storage.cache.invalida
+            elif operazione == 'aggiungi_transazione':
+                ripetizioni = args['inserimenti']
+                funzione = lambda: manager.aggiungi_transazione('benchmark', 'Varie', 9.99, note='benchmark')
+            elif operazione in ('verifica_budget', 'get_statistiche_generali'):
+                funzione = getattr(manager, operazione)
+            elif operazione == 'genera_report_completo':
+                analytics = analytics or SpeseAnalytics(csv_file, 'config.json', **kwargs)
+                funzione = analytics.genera_report_completo
+            else:
+                ai = ai or SpeseAI(csv_file, 'config.json', **kwargs)
+                funzione = getattr(ai, operazione)
+
+            # Stato a regime: dataset, rollup e feature store (il caricamento li invalida)
+            manager.storage.rollup_mensile()
+            get_feature_store(manager.storage.cache).dataframe()
+            misura = _misura(funzione, ripetizioni, prepara)
+            risultati.append({'taglia': n, 'righe': righe['n'], 'operazione': operazione,
+                              'ripetizioni': ripetizioni, **misura})
+        return risultati
+
+
+def _regressioni(risultati: List[Dict], baseline: List[Dict], tolleranza: float) -> List[str]:
+    """Operazioni più lente o più pesanti della baseline oltre la tolleranza relativa"""
+    riferimento = {(r['taglia'], r['operazione']): r for r in baseline}
+    regressioni = []
+    for r in risultati:
+        base = riferimento.get((r['taglia'], r['operazione']))
+        if base is None:
+            continue
+        for metrica in ('secondi', 'picco_mb'):
+            # Sotto 1 ms / 1 MB le variazioni sono rumore
+            minimo = 0.001 if metrica == 'secondi' else 1.0
+            if r[metrica] > max(base[metrica], minimo) * (1 + tolleranza):
+                regressioni.append(f"{r['operazione']} @ {r['taglia']}: {metrica} "
+                                   f"{base[metrica]:.4g} → {r[metrica]:.4g}")
+    return regressioni
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo e memoria di storage, analytics e AI per taglia del ledger")
+    parser.add_argument('--taglie', default='10k,100k,1M')
+    parser.add_argument('--backend', default='csv', choices=['csv', 'sqlite'])
+    parser.add_argument('--utenti', type=int, default=1)
+    parser.add_argument('--mesi', type=int, default=24)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--inserimenti', type=int, default=200)
+    parser.add_argument('--operazioni', default=','.join(OPERAZIONI))
+    parser.add_argument('--json', help="salva i risultati in questo file")
+    parser.add_argument('--confronta', help="baseline JSON di un'esecuzione precedente")
+    parser.add_argument('--tolleranza', type=float, default=0.25)
+    args = parser.parse_args()
+
+    operazioni = [o.strip() for o in args.operazioni.split(',') if o.strip()]
+    sconosciute = set(operazioni) - set(OPERAZIONI)
+    if sconosciute:
+        parser.error(f"operazioni sconosciute: {', '.join(sorted(sconosciute))}")
+
+    parametri = {'radice': os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                 'backend': args.backend, 'utenti': args.utenti, 'mesi': args.mesi, 'seed': args.seed,
+                 'inserimenti': args.inserimenti, 'operazioni': operazioni}
+
+    print(f"📏 Backend {args.backend}, {args.utenti} utenti, {args.mesi} mesi (seed {args.seed})\n")
+    print(f"{'taglia':>10}{'righe':>10}  {'operazione':<28}{'ms':>12}{'picco MB':>11}")
+
+    risultati = []
+    contesto = multiprocessing.get_context('spawn')
+    for taglia in args.taglie.split(','):
+        with contesto.Pool(1) as pool:
+            righe = pool.apply(_esegui_taglia, (_taglia(taglia), parametri))
+        for r in righe:
+            print(f"{r['taglia']:>10}{r['righe']:>10}  {r['operazione']:<28}"
+                  f"{r['secondi'] * 1000:>12.2f}{r['picco_mb']:>11.1f}")
+        risultati.extend(righe)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(risultati, f, indent=2)
+        print(f"\n💾 Risultati salvati in {args.json}")
+
+    if args.confronta:
+        with open(args.confronta) as f:
+            regressioni = _regressioni(risultati, json.load(f), args.tolleranza)
+        if regressioni:
+            print(f"\n🚨 Regressioni oltre il {args.tolleranza:.0%}:")
+            for riga in regressioni:
+                print(f"  - {riga}")
+            sys.exit(1)
+        print(f"\n✅ Nessuna regressione oltre il {args.tolleranza:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+🔮 Benchmark delle Previsioni: Holt online vs RandomForest
+📉 Backtest walk-forward sul totale mensile delle spese e costo di aggiornamento
+
+Uso: python -m benchmarks.previsioni [--transazioni 20000] [--mesi 36] [--min-mesi 6]
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.dati_sintetici import genera_ledger
+from previsioni_online import TOTALE, PrevisoreOnline
+from rollup import RollupMensile
+
+
+def _mensile_rf(storico: pd.DataFrame) -> pd.DataFrame:
+    """Stesse feature mensili di SpeseAI.train_modello_spesa_totale"""
+    df = storico.copy()
+    df['anno'] = df['data'].dt.year
+    df['mese'] = df['data'].dt.month
+    df['giorno_settimana'] = df['data'].dt.dayofweek
+    df['categoria_encoded'] = df['categoria'].astype('category').cat.codes
+    return df.groupby(['anno', 'mese']).agg({
+        'importo': 'sum',
+        'giorno_settimana': 'mean',
+        'categoria_encoded': lambda x: x.mode().iloc[0],
+    }).reset_index()
+
+
+def previsione_rf(storico: pd.DataFrame, anno: int, mese: int) -> float:
+    from sklearn.ensemble import RandomForestRegressor
+    mensile = _mensile_rf(storico)
+    modello = RandomForestRegressor(n_estimators=50, random_state=42)
+    modello.fit(mensile[['anno', 'mese', 'giorno_settimana', 'categoria_encoded']].values,
+                mensile['importo'].values)
+    # Feature di inferenza come SpeseAI.predici_spesa_mese_prossimo
+    return float(modello.predict(np.array([[anno, mese, 3, 0]]))[0])
+
+
+def previsione_holt(storico: pd.DataFrame, anno: int, mese: int) -> float:
+    rollup = RollupMensile()
+    rollup.ricostruisci(storico)
+    previsore = PrevisoreOnline()
+    previsore.ricostruisci(rollup.to_dataframe(), oggi=datetime(anno, mese, 1))
+    return previsore.previsione((anno, mese), oggi=datetime(anno, mese, 1)).get(TOTALE, 0.0)
+
+
+def backtest(ledger: pd.DataFrame, min_mesi: int):
+    """Per ogni mese dopo i primi min_mesi: previsione con i soli mesi precedenti"""
+    spese = ledger[ledger['tipo'] == 'spesa'].copy()
+    spese['data'] = pd.to_datetime(spese['data'])
+    periodi = spese['data'].dt.to_period('M')
+    reali = spese.groupby(periodi)['importo'].sum()
+
+    errori = {'holt': [], 'rf': []}
+    tempi = {'holt': 0.0, 'rf': 0.0}
+    for periodo in reali.index[min_mesi:]:
+        storico = spese[periodi < periodo]
+        for nome, funzione in (('holt', previsione_holt), ('rf', previsione_rf)):
+            inizio = time.perf_counter()
+            stima = funzione(storico, periodo.year, periodo.month)
+            tempi[nome] += time.perf_counter() - inizio
+            errori[nome].append(abs(stima - reali[periodo]))
+
+    mesi = len(reali) - min_mesi
+    return ({nome: float(np.mean(e)) for nome, e in errori.items()},
+            {nome: t / mesi for nome, t in tempi.items()}, float(reali.mean()), mesi)
+
+
+def costo_aggiornamento(ledger: pd.DataFrame, ripetizioni: int = 20000) -> float:
+    """µs per transazione inserita nel previsore già costruito (il RF va riaddestrato)"""
+    spese = ledger[ledger['tipo'] == 'spesa']
+    rollup = RollupMensile()
+    rollup.ricostruisci(spese.assign(data=pd.to_datetime(spese['data'])))
+    ultimo = pd.Timestamp(spese['data'].iloc[-1])
+    oggi = datetime(ultimo.year, ultimo.month, 28)
+
+    previsore = PrevisoreOnline()
+    previsore.ricostruisci(rollup.to_dataframe(), oggi=oggi)
+    record = {'data': oggi.strftime('%Y-%m-%d'), 'categoria': 'Svago', 'importo': 12.0, 'tipo': 'spesa'}
+    inizio = time.perf_counter()
+    for _ in range(ripetizioni):
+        previsore.aggiorna(record, oggi)
+    return (time.perf_counter() - inizio) / ripetizioni * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Holt online vs RandomForest sul totale mensile")
+    parser.add_argument('--transazioni', type=int, default=20000)
+    parser.add_argument('--mesi', type=int, default=36)
+    parser.add_argument('--min-mesi', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    ledger = genera_ledger(args.transazioni, mesi=args.mesi, seed=args.seed)
+    mae, tempi, media, mesi = backtest(ledger, args.min_mesi)
+
+    print(f"🔮 Backtest su {mesi} mesi ({args.transazioni} transazioni, spesa media €{media:.0f}/mese)\n")
+    print(f"{'modello':<14}{'MAE €':>10}{'MAE %':>8}{'ms per previsione':>20}")
+    for nome, etichetta in (('holt', 'Holt online'), ('rf', 'RandomForest')):
+        print(f"{etichetta:<14}{mae[nome]:>10.1f}{mae[nome] / media * 100:>7.1f}%{tempi[nome] * 1000:>20.1f}")
+
+    print(f"\n⚡ Aggiornamento Holt per transazione: {costo_aggiornamento(ledger):.2f} µs "
+          f"(RandomForest: riaddestramento completo)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+🪝 Harness del Webhook Telegram
+📮 POST di update sintetici al server di health: ack/s, latenza di risposta e di consegna
+
+Uso: python -m benchmarks.webhook [--update 2000] [--concorrenza 16] [--testo "caffè 2.50"]
+                                  [--url http://localhost:10000/telegram --segreto ...]
+
+Senza --url avvia in locale il server di health del bot (HealthCheckHandler,
+stessa classe usata in produzione) con un RicevitoreWebhook collegato a
+un'Application offline: misura anche il tempo fino all'arrivo dell'update
+nella update_queue. Con --url invia a un'istanza già avviata con
+TELEGRAM_MODALITA=webhook (le risposte del bot a chat inesistenti falliranno:
+usare --chat con una chat reale per il giro completo).
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import secrets
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+def update_sintetico(update_id: int, chat_id: int, testo: str) -> bytes:
+    """Update Telegram minimo con un messaggio di testo privato"""
+    return json.dumps({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': 'Benchmark'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Benchmark'},
+            'text': testo,
+        },
+    }).encode('utf-8')
+
+
+def _invia(url: str, segreto: str, corpi: List[Tuple[int, bytes]], inviati: Dict[int, float],
+           risultati: list):
+    """Invia una sequenza di update (un worker); registra status e latenza dell'ack"""
+    parti = urlsplit(url)
+    intestazioni = {'Content-Type': 'application/json'}
+    if segreto:
+        intestazioni['X-Telegram-Bot-Api-Secret-Token'] = segreto
+    for update_id, corpo in corpi:
+        connessione = http.client.HTTPConnection(parti.hostname, parti.port or 80, timeout=10)
+        inizio = time.perf_counter()
+        inviati[update_id] = inizio
+        try:
+            connessione.request('POST', parti.path or '/', body=corpo, headers=intestazioni)
+            status = connessione.getresponse().status
+        except OSError as e:
+            status = type(e).__name__
+        finally:
+            connessione.close()
+        risultati.append((status, time.perf_counter() - inizio))
+
+
+def invia_tutti(url: str, segreto: str, n: int, concorrenza: int, chat_id: int, testo: str,
+                inviati: Optional[Dict[int, float]] = None) -> Tuple[list, float]:
+    """Distribuisce n update su `concorrenza` worker; restituisce (status, latenza) e durata"""
+    inviati = inviati if inviati is not None else {}
+    corpi = [(i, update_sintetico(i, chat_id, testo)) for i in range(1, n + 1)]
+    risultati: list = []
+    inizio = time.perf_counter()
+    with ThreadPoolExecutor(concorrenza) as pool:
+        for k in range(concorrenza):
+            pool.submit(_invia, url, segreto, corpi[k::concorrenza], inviati, risultati)
+    return risultati, time.perf_counter() - inizio
+
+
+def _percentili(valori: List[float]) -> str:
+    if len(valori) < 2:
+        return 'n/d'
+    q = statistics.quantiles(valori, n=100)
+    return f"p50 {q[49] * 1000:.2f} ms, p95 {q[94] * 1000:.2f} ms, p99 {q[98] * 1000:.2f} ms"
+
+
+def _riepilogo(risultati: list, durata: float):
+    esiti = Counter(status for status, _ in risultati)
+    latenze = [latenza for status, latenza in risultati if status == 200]
+    print(f"📮 {len(risultati)} POST in {durata:.2f} s: {len(latenze) / durata:.0f} ack/s")
+    print(f"   Status: {dict(esiti)}")
+    print(f"   Latenza ack: {_percentili(latenze)}")
+
+
+async def _locale(args) -> None:
+    """Server di health in locale + Application offline; conta gli update consegnati"""
+    from http.server import ThreadingHTTPServer
+    from telegram.ext import Application
+
+    from financebot_final import HealthCheckHandler
+    from webhook import RicevitoreWebhook
+
+    app = Application.builder().token('123456:BENCHMARK').updater(None).build()
+    ricevitore = RicevitoreWebhook(segreto=args.segreto or secrets.token_urlsafe(32))
+    ricevitore.collega(app, asyncio.get_running_loop())
+    HealthCheckHandler.ricevitore = ricevitore
+    HealthCheckHandler.log_message = lambda *a: None
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), HealthCheckHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}{ricevitore.percorso}"
+    print(f"🪝 Server locale su {url}\n")
+
+    inviati: Dict[int, float] = {}
+    consegne: List[float] = []
+
+    async def consuma():
+        while True:
+            update = await app.update_queue.get()
+            consegne.append(time.perf_counter() - inviati[update.update_id])
+
+    consumatore = asyncio.create_task(consuma())
+    try:
+        risultati, durata = await asyncio.to_thread(
+            invia_tutti, url, ricevitore.segreto, args.update, args.concorrenza, args.chat, args.testo, inviati)
+        while len(consegne) < ricevitore.ricevuti:
+            await asyncio.sleep(0.01)
+    finally:
+        consumatore.cancel()
+        server.shutdown()
+        ricevitore.scollega()
+
+    _riepilogo(risultati, durata)
+    print(f"   Consegna in update_queue: {_percentili(consegne)} "
+          f"({len(consegne)} update, {ricevitore.rifiutati} rifiutati)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST di update Telegram sintetici al webhook del bot")
+    parser.add_argument('--url', help="webhook di un'istanza avviata (default: server locale)")
+    parser.add_argument('--segreto', default=os.getenv('WEBHOOK_SECRET', ''))
+    parser.add_argument('--update', type=int, default=2000)
+    parser.add_argument('--concorrenza', type=int, default=16)
+    parser.add_argument('--chat', type=int, default=424242)
+    parser.add_argument('--testo', default='caffè 2.50')
+    args = parser.parse_args()
+
+    if args.url:
+        risultati, durata = invia_tutti(args.url, args.segreto, args.update, args.concorrenza,
+                                        args.chat, args.testo)
+        _riepilogo(risultati, durata)
+        return
+
+    # Il bot crea config, cache e partizioni nella cartella corrente: lavoriamo in una temporanea
+    radice = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as cartella:
+        os.chdir(cartella)
+        sys.path.insert(0, radice)
+        asyncio.run(_locale(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+🏷️ Cache Persistente delle Categorizzazioni
+⚡ (tipo, descrizione normalizzata) → categoria, LRU limitata e salvata su disco
+"""
+
+import json
+import os
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Configurazione (sovrascrivibile da ambiente)
+CACHE_FILE_DEFAULT = os.getenv('CATEGORIE_CACHE_FILE', 'cache_categorie.json')
+CAPACITA_DEFAULT = int(os.getenv('CATEGORIE_CACHE_MAX', '10000'))
+
+
+def normalizza_descrizione(descrizione: str) -> str:
+    """Chiave canonica di una descrizione (minuscolo, spazi compattati)"""
+    return ' '.join(str(descrizione).lower().split())
+
+
+class CacheCategorie:
+    """
+    Memoria delle categorie già assegnate, consultata prima di OpenAI.
+
+    Le voci sono in un OrderedDict in ordine LRU (al massimo `capacita`);
+    ogni `salva_ogni` modifiche il contenuto viene riscritto su disco in
+    modo atomico, e ricaricato al riavvio. semina_da_ledger() importa le
+    coppie descrizione/categoria già presenti nello storico.
+    """
+
+    def __init__(self,
+                 cache_file: Optional[str] = None,
+                 capacita: Optional[int] = None,
+                 salva_ogni: int = 50):
+        self.cache_file = cache_file if cache_file is not None else CACHE_FILE_DEFAULT
+        self.capacita = capacita or CAPACITA_DEFAULT
+        self.salva_ogni = salva_ogni
+
+        self._voci: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._salva_lock = threading.Lock()  # un salvataggio alla volta sullo stesso .tmp
+        self._modifiche = 0
+
+        # Incrementata ad ogni voce nuova o cambiata (per il riaddestramento)
+        self.generazione = 0
+
+        # Contatori
+        self.hit = 0
+        self.miss = 0
+
+        self._carica()
+
+    def __len__(self) -> int:
+        return len(self._voci)
+
+    def _carica(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                dati = json.load(f)
+            for tipo, descrizione, categoria in dati.get('voci', []):
+                self._voci[(tipo, descrizione)] = categoria
+            while len(self._voci) > self.capacita:
+                self._voci.popitem(last=False)
+            logger.info(f"🏷️ Cache categorie caricata: {len(self._voci)} voci")
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Cache categorie illeggibile, riparto da zero: {e}")
+            self._voci.clear()
+
+    def salva(self):
+        """Scrive la cache su disco (tmp + rename: mai un file a metà)"""
+        if not self.cache_file:
+            return
+        with self._salva_lock:
+            with self._lock:
+                voci = [[tipo, descrizione, categoria] for (tipo, descrizione), categoria in self._voci.items()]
+                self._modifiche = 0
+
+            tmp = f"{self.cache_file}.tmp"
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump({'voci': voci}, f, ensure_ascii=False)
+                os.replace(tmp, self.cache_file)
+            except OSError as e:
+                logger.warning(f"Errore salvataggio cache categorie: {e}")
+
+    @property
+    def da_salvare(self) -> bool:
+        """Almeno `salva_ogni` modifiche dall'ultimo salvataggio"""
+        return bool(self.cache_file) and self._modifiche >= self.salva_ogni
+
+    def get(self, descrizione: str, tipo: str) -> Optional[str]:
+        chiave = (tipo, normalizza_descrizione(descrizione))
+        with self._lock:
+            categoria = self._voci.get(chiave)
+            if categoria is None:
+                self.miss += 1
+                return None
+            self._voci.move_to_end(chiave)
+            self.hit += 1
+            return categoria
+
+    def set(self, descrizione: str, tipo: str, categoria: str, salva: bool = True):
+        """
+        Registra una categoria. Con salva=False non scrive mai su disco: il
+        chiamante (es. dall'event loop) salva da sé quando da_salvare è vero.
+        """
+        chiave = (tipo, normalizza_descrizione(descrizione))
+        with self._lock:
+            if self._voci.get(chiave) == categoria:
+                self._voci.move_to_end(chiave)
+                return
+            self._voci[chiave] = categoria
+            self._voci.move_to_end(chiave)
+            if len(self._voci) > self.capacita:
+                self._voci.popitem(last=False)
+            self._modifiche += 1
+            self.generazione += 1
+
+        if salva and self.da_salvare:
+            self.salva()
+
+    def semina_da_ledger(self, df: pd.DataFrame) -> int:
+        """
+        Importa le categorie dello storico (vince la transazione più recente).
+        Le voci già in cache non vengono toccate. Restituisce le voci aggiunte.
+        """
+        if df is None or df.empty:
+            return 0
+
+        tipo = df['tipo'].fillna('spesa') if 'tipo' in df.columns else 'spesa'
+        storico = pd.DataFrame({
+            'tipo': tipo,
+            'descrizione': df['nome_transazione'].astype(str).map(normalizza_descrizione),
+            'categoria': df['categoria'],
+        }).dropna(subset=['categoria'])
+        storico = storico[storico['descrizione'] != ''].drop_duplicates(['tipo', 'descrizione'], keep='last')
+
+        aggiunte = 0
+        with self._lock:
+            for t, descrizione, categoria in storico.itertuples(index=False):
+                chiave = (t, descrizione)
+                if chiave not in self._voci and len(self._voci) < self.capacita:
+                    self._voci[chiave] = categoria
+                    aggiunte += 1
+            self._modifiche += aggiunte
+            self.generazione += aggiunte
+
+        if aggiunte:
+            logger.info(f"🏷️ Cache categorie: {aggiunte} voci dallo storico")
+        return aggiunte
+
+    def voci(self) -> List[Tuple[str, str, str]]:
+        """Copia delle voci come (tipo, descrizione normalizzata, categoria)"""
+        with self._lock:
+            return [(tipo, descrizione, categoria) for (tipo, descrizione), categoria in self._voci.items()]
+
+    def statistiche(self) -> Dict[str, float]:
+        totale = self.hit + self.miss
+        return {
+            'voci': len(self._voci),
+            'hit': self.hit,
+            'miss': self.miss,
+            'hit_rate': self.hit / totale if totale else 0.0,
+        }
+
+
+# Test rapido: python cache_categorie.py
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as cartella:
+        percorso = os.path.join(cartella, 'cache.json')
+        cache = CacheCategorie(percorso, capacita=3)
+        cache.semina_da_ledger(pd.DataFrame({
+            'nome_transazione': ['Caffè', 'benzina', 'caffè  '],
+            'categoria': ['Ristorazione', 'Trasporti', 'Ristorazione'],
+            'tipo': ['spesa', 'spesa', 'spesa'],
+        }))
+        cache.set('Stipendio', 'ricavo', 'Stipendio')
+        cache.set('spesa coop', 'spesa', 'Alimentari')  # supera la capacità: esce la voce meno recente
+        cache.salva()
+
+        riaperta = CacheCategorie(percorso, capacita=3)
+        print(f"📦 Voci dopo il riavvio: {len(riaperta)}")
+        print(f"  - 'Benzina' → {riaperta.get('Benzina', 'spesa')} (atteso None: sfrattata)")
+        print(f"  - 'CAFFÈ' → {riaperta.get('CAFFÈ', 'spesa')}")
+        print(f"  - 'Spesa  Coop' → {riaperta.get('Spesa  Coop', 'spesa')}")
+
+        n = 100000
+        inizio = time.perf_counter()
+        for _ in range(n):
+            riaperta.get('caffè', 'spesa')
+        print(f"⚡ Lookup medio: {(time.perf_counter() - inizio) / n * 1e6:.2f} µs")
+        print(f"📊 {riaperta.statistiche()}")
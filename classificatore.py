@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+🧠 Classificatore Locale delle Categorie
+🔤 TF-IDF su n-grammi di caratteri + regressione logistica, addestrato sullo storico
+"""
+
+import os
+import threading
+import time
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from cache_categorie import normalizza_descrizione
+
+logger = logging.getLogger(__name__)
+
+# Configurazione (sovrascrivibile da ambiente)
+SOGLIA_DEFAULT = float(os.getenv('CLASSIFICATORE_SOGLIA', '0.6'))
+INTERVALLO_DEFAULT = float(os.getenv('CLASSIFICATORE_INTERVALLO', '300'))
+MIN_ESEMPI_DEFAULT = int(os.getenv('CLASSIFICATORE_MIN_ESEMPI', '20'))
+
+
+class _Modello:
+    """Vettorizzatore + pesi di un singolo tipo (spesa/ricavo)"""
+
+    def __init__(self, vettorizzatore, classificatore):
+        self.vettorizzatore = vettorizzatore
+        self.classi = classificatore.classes_
+        # Pesi densi: la predizione è un prodotto sparso-denso, senza la validazione di sklearn
+        if len(self.classi) == 2:
+            self.pesi = np.hstack([-classificatore.coef_.T, classificatore.coef_.T]) / 2
+            self.bias = np.array([-classificatore.intercept_[0], classificatore.intercept_[0]]) / 2
+        else:
+            self.pesi = classificatore.coef_.T
+            self.bias = classificatore.intercept_
+
+    def predici(self, descrizione: str) -> Tuple[str, float]:
+        punteggi = (self.vettorizzatore.transform([descrizione]) @ self.pesi)[0] + self.bias
+        punteggi = np.exp(punteggi - punteggi.max())
+        probabilita = punteggi / punteggi.sum()
+        migliore = int(probabilita.argmax())
+        return str(self.classi[migliore]), float(probabilita[migliore])
+
+    def predici_molti(self, descrizioni: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Categoria e probabilità di più descrizioni con un solo prodotto matriciale"""
+        punteggi = np.asarray(self.vettorizzatore.transform(descrizioni) @ self.pesi) + self.bias
+        punteggi = np.exp(punteggi - punteggi.max(axis=1, keepdims=True))
+        probabilita = punteggi / punteggi.sum(axis=1, keepdims=True)
+        migliori = probabilita.argmax(axis=1)
+        return self.classi[migliori], probabilita[np.arange(len(migliori)), migliori]
+
+
+class ClassificatoreLocale:
+    """
+    Tier di categorizzazione in-process tra la cache e OpenAI.
+
+    Un modello per tipo, addestrato sulle coppie descrizione → categoria
+    (storico del ledger e risposte OpenAI già validate). predici() restituisce
+    la categoria solo se la probabilità supera `soglia`, altrimenti None.
+    avvia() riaddestra in un thread di background ogni `intervallo` secondi,
+    solo se la sorgente è cambiata; i modelli vengono sostituiti in blocco.
+    """
+
+    def __init__(self,
+                 soglia: Optional[float] = None,
+                 min_esempi: Optional[int] = None):
+        self.soglia = soglia if soglia is not None else SOGLIA_DEFAULT
+        self.min_esempi = min_esempi or MIN_ESEMPI_DEFAULT
+
+        self._modelli: Dict[str, _Modello] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        # Contatori
+        self.predizioni = 0
+        self.sicure = 0
+        self.addestramenti = 0
+
+    def addestra(self, esempi: Iterable[Tuple[str, str, str]]) -> Dict[str, int]:
+        """Addestra da (tipo, descrizione, categoria); restituisce gli esempi usati per tipo"""
+        # scikit-learn solo quando si addestra (thread di background), non all'avvio del bot
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        per_tipo: Dict[str, Tuple[list, list]] = {}
+        for tipo, descrizione, categoria in esempi:
+            testi, etichette = per_tipo.setdefault(tipo, ([], []))
+            testi.append(normalizza_descrizione(descrizione))
+            etichette.append(categoria)
+
+        modelli: Dict[str, _Modello] = {}
+        usati: Dict[str, int] = {}
+        for tipo, (testi, etichette) in per_tipo.items():
+            if len(testi) < self.min_esempi or len(set(etichette)) < 2:
+                continue
+            vettorizzatore = TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4), sublinear_tf=True)
+            X = vettorizzatore.fit_transform(testi)
+            classificatore = LogisticRegression(C=10.0, max_iter=1000)
+            classificatore.fit(X, etichette)
+            modelli[tipo] = _Modello(vettorizzatore, classificatore)
+            usati[tipo] = len(testi)
+
+        self._modelli = modelli  # scambio atomico: i lettori vedono il vecchio o il nuovo
+        self.addestramenti += 1
+        logger.info(f"🧠 Classificatore locale addestrato: {usati or 'esempi insufficienti'}")
+        return usati
+
+    def predici(self, descrizione: str, tipo: str) -> Optional[str]:
+        """Categoria se il modello è abbastanza sicuro, altrimenti None"""
+        modello = self._modelli.get(tipo)
+        if modello is None:
+            return None
+
+        self.predizioni += 1
+        categoria, probabilita = modello.predici(normalizza_descrizione(descrizione))
+        if probabilita < self.soglia:
+            return None
+        self.sicure += 1
+        return categoria
+
+    def predici_molti(self, descrizioni: List[str], tipo: str) -> List[Optional[str]]:
+        """Come predici() su una lista (import massivi): None dove il modello non è sicuro"""
+        modello = self._modelli.get(tipo)
+        if modello is None or not descrizioni:
+            return [None] * len(descrizioni)
+
+        categorie, probabilita = modello.predici_molti([normalizza_descrizione(d) for d in descrizioni])
+        sicure = probabilita >= self.soglia
+        self.predizioni += len(descrizioni)
+        self.sicure += int(sicure.sum())
+        return [str(c) if ok else None for c, ok in zip(categorie, sicure)]
+
+    def avvia(self,
+              sorgente: Callable[[], Iterable[Tuple[str, str, str]]],
+              generazione: Callable[[], int],
+              intervallo: Optional[float] = None):
+        """Riaddestramento periodico in background quando `generazione()` cambia"""
+        if self._thread is not None:
+            return
+        attesa = intervallo if intervallo is not None else INTERVALLO_DEFAULT
+
+        def ciclo():
+            ultima = None
+            while True:
+                corrente = generazione()
+                if corrente != ultima:
+                    try:
+                        self.addestra(sorgente())
+                        ultima = corrente
+                    except Exception as e:
+                        logger.warning(f"Errore addestramento classificatore: {e}")
+                if self._stop.wait(attesa):
+                    return
+
+        self._thread = threading.Thread(target=ciclo, name='classificatore', daemon=True)
+        self._thread.start()
+
+    def ferma(self):
+        self._stop.set()
+
+
+# Test rapido: python classificatore.py
+if __name__ == "__main__":
+    esempi = [('spesa', d, c) for d, c in [
+        ('benzina', 'Trasporti'), ('benzina eni', 'Trasporti'), ('treno milano', 'Trasporti'),
+        ('biglietto bus', 'Trasporti'), ('parcheggio', 'Trasporti'), ('taxi', 'Trasporti'),
+        ('spesa coop', 'Alimentari'), ('esselunga', 'Alimentari'), ('supermercato', 'Alimentari'),
+        ('pane e latte', 'Alimentari'), ('spesa conad', 'Alimentari'), ('frutta', 'Alimentari'),
+        ('caffè', 'Ristorazione'), ('caffè bar', 'Ristorazione'), ('pizza', 'Ristorazione'),
+        ('pizzeria', 'Ristorazione'), ('ristorante', 'Ristorazione'), ('aperitivo bar', 'Ristorazione'),
+        ('farmacia', 'Salute'), ('visita medica', 'Salute'), ('medicine', 'Salute'),
+        ('bolletta luce', 'Casa'), ('affitto', 'Casa'), ('bolletta gas', 'Casa'),
+    ]]
+    classificatore = ClassificatoreLocale()
+    classificatore.addestra(esempi)
+
+    for descrizione in ['Benzina Q8', 'spesa alla coop', 'caffè al bar', 'bolletta acqua', 'regalo zia']:
+        print(f"  - {descrizione}: {classificatore.predici(descrizione, 'spesa')}")
+
+    n = 2000
+    inizio = time.perf_counter()
+    for _ in range(n):
+        classificatore.predici('caffè al bar', 'spesa')
+    print(f"⚡ Predizione media: {(time.perf_counter() - inizio) / n * 1000:.3f} ms")
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+🗃️ Cache Condivisa del Dataset Transazioni
+⚡ Un solo caricamento del CSV per processo, aggiornato in modo incrementale
+"""
+
+import pandas as pd
+import io
+import os
+import sqlite3
+import threading
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from metriche import CARICAMENTO_SECONDI
+from registro_lru import RegistroLRU
+
+logger = logging.getLogger(__name__)
+
+# Schema del ledger (ordine delle colonne su disco)
+COLONNE = ['data', 'nome_transazione', 'categoria', 'importo', 'tipo', 'note']
+
+
+def converti_date(df: pd.DataFrame, origine: str) -> Tuple[pd.DataFrame, int]:
+    """
+    Converte la colonna data (ISO 8601, YYYY-MM-DD come la scrive il bot)
+
+    Le righe con data illeggibile restano su disco (la compattazione le
+    conserva) ma non entrano nel dataset: una sola riga corrotta non deve
+    rendere inutilizzabile tutto lo storico. Restituisce (frame, scartate).
+    """
+    date = pd.to_datetime(df['data'], errors='coerce', format='ISO8601')
+    illeggibili = date.isna()
+    scartate = int(illeggibili.sum())
+    if scartate:
+        esempio = df.loc[illeggibili, 'data'].iloc[0]
+        logger.warning(f"⚠️ {origine}: {scartate} righe con data illeggibile ignorate (es. {esempio!r})")
+    df = df.assign(data=date)
+    return (df[~illeggibili].reset_index(drop=True) if scartate else df), scartate
+
+
+class DatasetCache:
+    """
+    Copia in memoria del ledger condivisa da SpeseManager, SpeseAnalytics e SpeseAI.
+
+    Il file viene letto una volta sola; gli inserimenti fatti dal processo
+    vengono accodati senza rileggere il disco (registra_append), mentre le
+    modifiche esterne vengono rilevate confrontando inode/dimensione/mtime:
+    se il file è solo cresciuto si legge la coda, altrimenti si ricarica tutto.
+    """
+
+    def __init__(self, csv_file: str):
+        self.csv_file = csv_file
+        self._lock = threading.RLock()
+
+        self._df: Optional[pd.DataFrame] = None
+        self._pendenti: List[dict] = []
+        self._offset = 0  # byte del file già incorporati
+        self._stamp: Optional[Tuple[int, int, int]] = None
+
+        # Incrementata ad ogni variazione dei dati
+        self.versione = 0
+        self.letture_disco = 0
+        # Incrementata solo quando il dataset viene ricaricato da zero
+        self.ricariche = 0
+        # Righe con data illeggibile escluse dal dataset corrente
+        self.date_scartate = 0
+
+    @staticmethod
+    def _stat(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _prepara(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Normalizza tipi e colonne di un frame letto dal CSV"""
+        if 'nome_spesa' in df.columns and 'nome_transazione' not in df.columns:
+            df = df.rename(columns={'nome_spesa': 'nome_transazione'})
+        if 'tipo' not in df.columns:
+            df['tipo'] = 'spesa'
+        df, scartate = converti_date(df, self.csv_file)
+        self.date_scartate += scartate
+        df['importo'] = pd.to_numeric(df['importo'], errors='coerce')
+        return df
+
+    def _carica_tutto(self, stamp: Optional[Tuple[int, int, int]]):
+        self.date_scartate = 0
+        if stamp is None:
+            self._df = pd.DataFrame(columns=COLONNE).astype({'data': 'datetime64[ns]'})
+            self._offset = 0
+        else:
+            with CARICAMENTO_SECONDI.tempo('completa'):
+                self._df = self._prepara(pd.read_csv(self.csv_file))
+            self._offset = stamp[1]
+            self.letture_disco += 1
+
+        self._pendenti = []
+        self._stamp = stamp
+        self.versione += 1
+        self.ricariche += 1
+        logger.debug(f"🗃️ Dataset caricato da {self.csv_file}: {len(self._df)} records")
+
+    def _carica_coda(self, stamp: Tuple[int, int, int]):
+        """Incorpora solo i byte aggiunti in coda da un altro processo"""
+        inizio = time.perf_counter()
+        with open(self.csv_file, 'rb') as f:
+            f.seek(self._offset)
+            coda = f.read(stamp[1] - self._offset)
+
+        # Solo righe complete: una scrittura in corso verrà letta al prossimo giro
+        fine = coda.rfind(b'\n') + 1
+        if fine > 0:
+            nuovi = pd.read_csv(io.BytesIO(coda[:fine]), header=None, names=COLONNE)
+            self._df = pd.concat([self._df, self._prepara(nuovi)], ignore_index=True)
+            self.letture_disco += 1
+            self.versione += 1
+            CARICAMENTO_SECONDI.osserva(time.perf_counter() - inizio, 'coda')
+
+        self._offset += fine
+        self._stamp = (stamp[0], self._offset, stamp[2]) if fine < len(coda) else stamp
+
+    def _sincronizza(self):
+        stamp = self._stat(self.csv_file)
+
+        if self._df is not None and stamp == self._stamp:
+            return
+
+        solo_cresciuto = (
+            self._df is not None and stamp is not None and self._stamp is not None
+            and stamp[0] == self._stamp[0] and stamp[1] > self._offset
+        )
+        if solo_cresciuto:
+            self._carica_coda(stamp)
+        else:
+            # Primo accesso o file riscritto (compattazione, modifica manuale)
+            self._carica_tutto(stamp)
+
+    def _applica_pendenti(self):
+        if not self._pendenti:
+            return
+        nuovi = self._prepara(pd.DataFrame(self._pendenti, columns=COLONNE))
+        self._df = pd.concat([self._df, nuovi], ignore_index=True) if len(self._df) else nuovi
+        self._pendenti = []
+
+    def registra_append(self, records: List[dict], byte_scritti: int) -> Optional[Tuple[int, int]]:
+        """
+        Notifica un append (una o più righe) appena scritto da questo processo.
+
+        Se il file è cresciuto esattamente delle righe scritte i record vengono
+        accodati in memoria senza rileggere il disco; in caso contrario la
+        cache si risincronizzerà alla prossima lettura.
+
+        Returns:
+            (versione_prima, versione_dopo) se il record è stato incorporato, altrimenti None
+        """
+        with self._lock:
+            if self._df is None or self._stamp is None:
+                return None
+
+            stamp = self._stat(self.csv_file)
+            if stamp is None or stamp[0] != self._stamp[0] or stamp[1] != self._offset + byte_scritti:
+                return None
+
+            self._pendenti.extend({col: record.get(col, '') for col in COLONNE} for record in records)
+            self._offset = stamp[1]
+            self._stamp = stamp
+            self.versione += 1
+            return self.versione - 1, self.versione
+
+    def invalida(self):
+        """Forza una ricarica completa alla prossima lettura"""
+        with self._lock:
+            self._df = None
+            self._pendenti = []
+            self._stamp = None
+
+    def snapshot(self) -> Tuple[int, pd.DataFrame]:
+        """Restituisce (versione, dataset) letti in modo consistente"""
+        with self._lock:
+            self._sincronizza()
+            self._applica_pendenti()
+            return self.versione, self._df.copy(deep=False)
+
+    def snapshot_incrementale(self) -> Tuple[int, int, pd.DataFrame]:
+        """
+        Restituisce (ricariche, versione, dataset): a parità di ricariche il
+        dataset è cresciuto solo in coda, le righe già viste sono invariate.
+        """
+        with self._lock:
+            versione, df = self.snapshot()
+            return self.ricariche, versione, df
+
+    def get_dataframe(self) -> pd.DataFrame:
+        """
+        Restituisce il dataset con 'data' già convertita in datetime.
+
+        È una copia shallow: aggiungere o riassegnare colonne è sicuro,
+        modificare i valori in-place no.
+        """
+        return self.snapshot()[1]
+
+
+class DatasetCacheSQLite:
+    """
+    Copia in memoria delle transazioni di un utente per il backend SQLite.
+
+    Usa una connessione dedicata: PRAGMA data_version cambia ad ogni commit
+    di qualsiasi altra connessione, quindi il controllo di validità è una
+    sola query. Le nuove righe si leggono per rowid (id > ultimo id visto);
+    se il conteggio non torna (delete/update esterni) si ricarica tutto.
+    """
+
+    def __init__(self, db_file: str, user_id: int = 0):
+        self.db_file = db_file
+        self.user_id = user_id
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        self._df: Optional[pd.DataFrame] = None
+        self._data_version: Optional[int] = None
+        self._ultimo_id = 0
+
+        self.versione = 0
+        self.letture_disco = 0
+        self.ricariche = 0
+        # Righe con data illeggibile escluse dal dataset (contano nel confronto con COUNT(*))
+        self.date_scartate = 0
+
+    def _connessione(self) -> sqlite3.Connection:
+        # Aperta al primo uso e dopo ogni chiudi()
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=30)
+        return self._conn
+
+    def _leggi(self, dopo_id: int = 0) -> pd.DataFrame:
+        inizio = time.perf_counter()
+        df = pd.read_sql_query(
+            f"SELECT id, {', '.join(COLONNE)} FROM transazioni WHERE user_id = ? AND id > ? ORDER BY id",
+            self._connessione(), params=(self.user_id, dopo_id)
+        )
+        if len(df):
+            self._ultimo_id = int(df['id'].iloc[-1])
+        df, scartate = converti_date(df.drop(columns='id'), f"{self.db_file} (utente {self.user_id})")
+        self.date_scartate += scartate
+        self.letture_disco += 1
+        CARICAMENTO_SECONDI.osserva(time.perf_counter() - inizio, 'sqlite')
+        return df
+
+    def _sincronizza(self):
+        data_version = self._connessione().execute("PRAGMA data_version").fetchone()[0]
+        if self._df is not None and data_version == self._data_version:
+            return
+
+        if self._df is None:
+            self._ultimo_id = 0
+            self.date_scartate = 0
+            self._df = self._leggi()
+            self.ricariche += 1
+        else:
+            nuovi = self._leggi(self._ultimo_id)
+            if len(nuovi):
+                self._df = pd.concat([self._df, nuovi], ignore_index=True)
+
+            conteggio = self._connessione().execute(
+                "SELECT COUNT(*) FROM transazioni WHERE user_id = ?", (self.user_id,)
+            ).fetchone()[0]
+            if conteggio != len(self._df) + self.date_scartate:
+                self._ultimo_id = 0
+                self.date_scartate = 0
+                self._df = self._leggi()
+                self.ricariche += 1
+
+        self._data_version = data_version
+        self.versione += 1
+
+    def registra_append(self, records: List[dict], byte_scritti: int = 0) -> Optional[Tuple[int, int]]:
+        """Nessuna azione: le nuove righe si recuperano per rowid"""
+        return None
+
+    def invalida(self):
+        with self._lock:
+            self._df = None
+            self._data_version = None
+
+    def chiudi(self):
+        """Libera dataset e connessione (riaperti al prossimo accesso)"""
+        with self._lock:
+            self.invalida()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def snapshot(self) -> Tuple[int, pd.DataFrame]:
+        """Restituisce (versione, dataset) letti in modo consistente"""
+        with self._lock:
+            self._sincronizza()
+            return self.versione, self._df.copy(deep=False)
+
+    def snapshot_incrementale(self) -> Tuple[int, int, pd.DataFrame]:
+        """Restituisce (ricariche, versione, dataset), come DatasetCache"""
+        with self._lock:
+            versione, df = self.snapshot()
+            return self.ricariche, versione, df
+
+    def get_dataframe(self) -> pd.DataFrame:
+        return self.snapshot()[1]
+
+
+# Registro process-wide: una cache per file, le meno usate liberano il dataset
+_caches: RegistroLRU[DatasetCache] = RegistroLRU(rilascia=DatasetCache.invalida)
+
+
+def get_cache(csv_file: str) -> DatasetCache:
+    """Restituisce la cache condivisa per il file indicato"""
+    return _caches.ottieni(os.path.abspath(csv_file), lambda: DatasetCache(csv_file))
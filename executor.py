@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+⚙️ Executor per il Lavoro Bloccante degli Handler
+🧵 Thread pool per I/O, process pool per rendering e training
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from metriche import ESECUTORE_SECONDI
+
+logger = logging.getLogger(__name__)
+
+# Configurazione (sovrascrivibile da ambiente)
+IO_WORKERS_DEFAULT = int(os.getenv('EXECUTOR_IO_WORKERS', '8'))
+CPU_WORKERS_DEFAULT = int(os.getenv('EXECUTOR_CPU_WORKERS', str(min(4, os.cpu_count() or 1))))
+TIMEOUT_DEFAULT = float(os.getenv('EXECUTOR_TIMEOUT', '60'))
+
+
+class BotExecutor:
+    """
+    Sposta il lavoro bloccante fuori dall'event loop asyncio.
+
+    - run_io: pandas/CSV/SQLite, OpenAI sincrono, requests (thread pool)
+    - run_cpu: matplotlib, sklearn (process pool: niente GIL, e matplotlib
+      non è thread-safe). Le funzioni devono essere top-level e picklabili.
+
+    Ogni task ha un timeout: allo scadere il chiamante riceve TimeoutError
+    (il lavoro già avviato non può essere interrotto, il risultato viene scartato).
+    """
+
+    def __init__(self,
+                 io_workers: Optional[int] = None,
+                 cpu_workers: Optional[int] = None,
+                 timeout: Optional[float] = None):
+        self.io_workers = io_workers or IO_WORKERS_DEFAULT
+        self.cpu_workers = cpu_workers or CPU_WORKERS_DEFAULT
+        self.timeout = timeout or TIMEOUT_DEFAULT
+
+        self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix='bot-io')
+        self._cpu_pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_cpu_pool(self) -> ProcessPoolExecutor:
+        # Creato al primo uso; forkserver evita fork() di un processo con thread attivi
+        if self._cpu_pool is None:
+            metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._cpu_pool = ProcessPoolExecutor(
+                max_workers=self.cpu_workers,
+                mp_context=multiprocessing.get_context(metodo)
+            )
+            logger.info(f"⚙️ Process pool avviato ({self.cpu_workers} worker, {metodo})")
+        return self._cpu_pool
+
+    async def _esegui(self, pool, nome_pool: str, fn: Callable, args, kwargs, timeout: Optional[float]) -> Any:
+        loop = asyncio.get_running_loop()
+        nome = getattr(fn, '__name__', repr(fn))
+        inizio = time.perf_counter()
+        future = loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+
+        limite = timeout if timeout is not None else self.timeout
+        try:
+            return await asyncio.wait_for(future, limite)
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱️ Timeout {nome} dopo {limite:g}s")
+            raise TimeoutError(f"operazione '{nome}' oltre {limite:g}s") from None
+        finally:
+            ESECUTORE_SECONDI.osserva(time.perf_counter() - inizio, nome_pool, nome)
+
+    async def run_io(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Esegue fn nel thread pool I/O"""
+        return await self._esegui(self._io_pool, 'io', fn, args, kwargs, timeout)
+
+    async def run_cpu(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Esegue fn nel process pool CPU"""
+        pool = self._get_cpu_pool()
+        try:
+            return await self._esegui(pool, 'cpu', fn, args, kwargs, timeout)
+        except BrokenProcessPool:
+            # Un worker morto rende il pool inutilizzabile: lo chiudiamo (liberando i worker
+            # superstiti e i task in coda) e lo ricreiamo al prossimo uso. Solo se è ancora
+            # quello corrente: un altro task potrebbe averlo già sostituito
+            if self._cpu_pool is pool:
+                self._cpu_pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def shutdown(self):
+        self._io_pool.shutdown(wait=False, cancel_futures=True)
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+🧮 Feature Store delle Transazioni
+📆 Colonne temporali e codici categoria calcolati una volta per versione dei dati
+"""
+
+import threading
+import weakref
+from typing import Dict, Optional
+
+import pandas as pd
+
+# Colonne derivate aggiunte al dataset (in questo ordine)
+FEATURES = ['anno', 'mese', 'giorno', 'giorno_settimana', 'giorno_anno',
+            'anno_mese', 'mese_nome', 'categoria_encoded']
+
+
+class FeatureStore:
+    """
+    Dataset arricchito con le feature usate da SpeseAI e SpeseAnalytics.
+
+    Le colonne sono interi compatti (int16/int8), 'mese_nome' riusa una stringa
+    per mese (strftime solo sui mesi distinti) e 'categoria_encoded' usa codici stabili:
+    una categoria mantiene il suo codice per tutta la vita dello store, le
+    nuove prendono il successivo. Finché la cache cresce solo in coda
+    (stesso numero di ricariche) si calcolano le feature delle sole righe nuove.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._lock = threading.Lock()
+
+        self._df: Optional[pd.DataFrame] = None
+        self._ricariche: Optional[int] = None
+        self.versione: Optional[int] = None  # versione del dataset da cui derivano le feature
+        self.codici_categoria: Dict[str, int] = {}
+        self._nomi_mese: Dict[pd.Period, str] = {}
+
+        # Contatori
+        self.ricostruzioni = 0
+        self.estensioni = 0
+
+    def _codifica(self, categorie: pd.Series) -> pd.Series:
+        for categoria in pd.unique(categorie.dropna()):
+            self.codici_categoria.setdefault(categoria, len(self.codici_categoria))
+        return categorie.map(self.codici_categoria).fillna(-1).astype('int16')
+
+    def _calcola(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Aggiunge le colonne derivate a un blocco di righe"""
+        data = df['data'].dt
+        df = df.copy(deep=False)
+        df['anno'] = data.year.fillna(0).astype('int16')
+        df['mese'] = data.month.fillna(0).astype('int8')
+        df['giorno'] = data.day.fillna(0).astype('int8')
+        df['giorno_settimana'] = data.dayofweek.fillna(0).astype('int8')
+        df['giorno_anno'] = data.dayofyear.fillna(0).astype('int16')
+        df['anno_mese'] = data.to_period('M')
+
+        # Nome del mese formattato una volta per mese distinto, non per riga
+        for mese in df['anno_mese'].unique():
+            if mese not in self._nomi_mese and not pd.isna(mese):
+                self._nomi_mese[mese] = mese.strftime('%B %Y')
+        df['mese_nome'] = df['anno_mese'].map(self._nomi_mese)
+
+        df['categoria_encoded'] = self._codifica(df['categoria'])
+        return df
+
+    def dataframe(self) -> pd.DataFrame:
+        """
+        Dataset con le colonne di FEATURES, aggiornato alla versione corrente.
+
+        È una copia shallow: aggiungere colonne è sicuro, modificare i valori no.
+        """
+        ricariche, versione, df = self._cache.snapshot_incrementale()
+
+        with self._lock:
+            righe = 0 if self._df is None else len(self._df)
+            if righe and ricariche == self._ricariche and len(df) >= righe:
+                if len(df) > righe:
+                    self._df = pd.concat([self._df, self._calcola(df.iloc[righe:])], ignore_index=True)
+                    self.estensioni += 1
+                self.versione = versione
+                return self._df.copy(deep=False)
+
+            self._df = self._calcola(df)
+            self._ricariche, self.versione = ricariche, versione
+            self.ricostruzioni += 1
+            return self._df.copy(deep=False)
+
+
+# Uno store per cache: condiviso da tutte le istanze che leggono gli stessi dati
+_stores: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_feature_store(cache) -> FeatureStore:
+    """Restituisce il feature store associato alla cache del dataset"""
+    with _stores_lock:
+        store = _stores.get(cache)
+        if store is None:
+            store = _stores[cache] = FeatureStore(cache)
+        return store
+
+
+# Test rapido: python feature_store.py
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import time
+
+    from benchmarks.dati_sintetici import genera_ledger
+    from storage import apri_storage
+
+    with tempfile.TemporaryDirectory() as cartella:
+        csv_file = os.path.join(cartella, 'spese.csv')
+        genera_ledger(200000, mesi=36).to_csv(csv_file, index=False)
+        storage = apri_storage(csv_file, 'csv')
+        store = get_feature_store(storage.cache)
+        storage.cache.get_dataframe()
+
+        # Preparazione per chiamata come prima del feature store
+        inizio = time.perf_counter()
+        df = storage.cache.get_dataframe()
+        for colonna, attributo in (('anno', 'year'), ('mese', 'month'), ('giorno', 'day'),
+                                   ('giorno_settimana', 'dayofweek'), ('giorno_anno', 'dayofyear')):
+            df[colonna] = getattr(df['data'].dt, attributo)
+        df['mese_nome'] = df['data'].dt.strftime('%B %Y')
+        print(f"🐢 Preparazione per chiamata: {(time.perf_counter() - inizio) * 1000:.0f} ms")
+
+        inizio = time.perf_counter()
+        store.dataframe()
+        print(f"🧮 Primo calcolo nello store: {(time.perf_counter() - inizio) * 1000:.0f} ms")
+
+        inizio = time.perf_counter()
+        for _ in range(100):
+            store.dataframe()
+        print(f"⚡ Lettura a versione invariata: {(time.perf_counter() - inizio) * 10:.2f} ms")
+
+        storage.aggiungi({'data': '2026-10-17', 'nome_transazione': 'corso', 'categoria': 'Formazione',
+                          'importo': 90.0, 'tipo': 'spesa', 'note': ''})
+        inizio = time.perf_counter()
+        df = store.dataframe()
+        print(f"➕ Estensione dopo un insert: {(time.perf_counter() - inizio) * 1000:.1f} ms "
+              f"(ricostruzioni {store.ricostruzioni}, estensioni {store.estensioni})")
+        print(f"🏷️ Codici stabili: {store.codici_categoria}")
+        print(df[FEATURES].tail(2).to_string())
@@ -6,22 +6,35 @@
 """
 
 import os
-import re
+import asyncio
 import json
 import logging
-import pandas as pd
+import tempfile
 import threading
+from functools import lru_cache
+from typing import Optional
 from datetime import datetime
 from dotenv import load_dotenv
-from telegram import Update, BotCommand
+from telegram import Update, BotCommand, InputMediaPhoto
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from openai import OpenAI
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
 # Import sistemi locali
 from spese_manager import SpeseManager
-from analytics import SpeseAnalytics  
-from ai_predictor import SpeseAI
+from analytics import SpeseAnalytics, GRAFICI_REPORT, PROFILO_DEFAULT, cache_grafici, genera_grafico_utente
+from ai_predictor import SpeseAI, addestra_e_predici, aggiorna_modello_utente
+from executor import BotExecutor
+from registro_lru import RegistroLRU
+from scrittore import ScrittoreLedger
+from importazione import ESTENSIONI, MAX_MB, categorizza_importazione, prepara_importazione
+from previsioni_online import TOTALE
+from webhook import MODALITA_DEFAULT, WEBHOOK_MAX_BYTE, RicevitoreWebhook, esegui_webhook
+from metriche import GRAFICO_SECONDI, RENDERING_BYTE, RENDERING_SECONDI, contatori_cache, registro, strumenta
+from cache_categorie import CacheCategorie
+from classificatore import ClassificatoreLocale
+from parole_chiave import MatcherParoleChiave
+import parser_transazioni
+from categorizzatore import CategorizzatoreAsync
 
 # Logging produzione
 logging.basicConfig(
@@ -39,164 +52,105 @@ load_dotenv()
 TOKEN = os.getenv('TELEGRAM_TOKEN')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+# OpenAI client asincrono, creato al primo uso: la maggior parte delle
+# categorizzazioni si chiude in cache o nel classificatore locale
+@lru_cache(maxsize=None)
+def get_async_openai_client():
+    if not OPENAI_API_KEY:
+        return None
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+class ServiziUtente:
+    """Manager, analytics e AI con scope sulla partizione dati di un utente"""
+    
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.spese_manager = SpeseManager(user_id=user_id)
+        self.analytics = SpeseAnalytics(user_id=user_id)
+        self.ai = SpeseAI(user_id=user_id)
+        self._cache_seminata = False
+        self._lock_semina = threading.Lock()
+    
+    def semina_cache(self, cache_categorie: CacheCategorie):
+        """Alimenta (una sola volta) la cache delle categorie con lo storico dell'utente"""
+        with self._lock_semina:
+            if not self._cache_seminata:
+                cache_categorie.semina_da_ledger(self.spese_manager.get_dataframe())
+                self._cache_seminata = True
 
 class FinanceBotAI:
     """Bot AI per gestione finanze personali con OpenAI e ricavi"""
     
     def __init__(self):
-        self.spese_manager = SpeseManager()
-        self.analytics = SpeseAnalytics()
-        self.ai = SpeseAI()
-        self.openai_client = openai_client
+        # Tier di categorizzazione: cache persistente → classificatore locale → OpenAI (batch) → keyword
+        self.parole_chiave = MatcherParoleChiave.da_file()
+        self.cache_categorie = CacheCategorie()
+        self.classificatore = ClassificatoreLocale()
+        self.categorizzatore = CategorizzatoreAsync(
+            get_async_openai_client, self._fallback_categorize,
+            cache=self.cache_categorie, classificatore=self.classificatore
+        )
+        
+        # Servizi per utente (ogni utente vede e scansiona solo i propri dati), LRU sugli utenti attivi
+        self._servizi = RegistroLRU()  # user_id -> ServiziUtente
+        
+        # Utenti con un riaddestramento del modello previsioni in corso
+        self._riaddestramenti = set()
         
         # Modalità corrente (spese o ricavi)
         self.user_modes = {}  # user_id -> 'spese' | 'ricavi' | None
-    
-    def parse_transazione(self, testo: str, tipo: str = 'spesa') -> dict:
-        """Parse intelligente di transazioni (spese/ricavi) da testo naturale"""
-        patterns = [
-            r'(€?\s*\d+[.,]?\d*)\s+(.+)',
-            r'(.+?)\s+(€?\s*\d+[.,]?\d*)$',
-            r'ho\s+(speso|guadagnato|ricevuto)\s+(€?\s*\d+[.,]?\d*)\s+(per|da|di)\s+(.+)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, testo.lower().strip())
-            if match:
-                groups = match.groups()
-                
-                if len(groups) == 4:  # Pattern con verbo
-                    _, importo_str, _, descrizione = groups
-                else:  # Pattern semplice
-                    p1, p2 = groups
-                    for parte in [p1, p2]:
-                        clean = parte.replace('€', '').replace(',', '.').strip()
-                        if re.match(r'^\d+\.?\d*$', clean):
-                            importo_str = clean
-                            descrizione = p1 if parte == p2 else p2
-                            break
-                    else:
-                        continue
-                
-                try:
-                    importo = float(importo_str.replace('€', '').replace(',', '.').strip())
-                    desc_clean = descrizione.strip()
-                    categoria = self._categorize_with_openai(desc_clean, tipo)
-                    
-                    return {
-                        'successo': True,
-                        'importo': importo,
-                        'descrizione': desc_clean,
-                        'categoria': categoria,
-                        'tipo': tipo
-                    }
-                except ValueError:
-                    continue
-        
-        return {'successo': False}
-    
-    def _categorize_with_openai(self, descrizione: str, tipo: str) -> str:
-        """Categorizzazione intelligente con OpenAI GPT"""
-        if not self.openai_client:
-            return self._fallback_categorize(descrizione, tipo)
         
-        try:
-            if tipo == 'spesa':
-                categorie = "Trasporti, Alimentari, Ristorazione, Casa, Salute, Svago, Abbigliamento, Varie"
-                prompt = f"""Categorizza questa spesa in una delle seguenti categorie: {categorie}
-
-Spesa: "{descrizione}"
-
-Regole:
-- Trasporti: benzina, carburante, treni, bus, taxi, parcheggi, assicurazione auto
-- Alimentari: supermercati, spesa alimentare, pane, latte, frutta, verdura  
-- Ristorazione: ristoranti, bar, caffè, pizzerie, takeaway, delivery
-- Casa: bollette, affitto, mobili, elettrodomestici, internet, telefono
-- Salute: farmacie, visite mediche, medicine, analisi
-- Svago: cinema, libri, palestra, sport, giochi, viaggi
-- Abbigliamento: vestiti, scarpe, accessori
-- Varie: tutto il resto
-
-Rispondi solo con il nome della categoria."""
-
-            else:  # ricavo
-                categorie = "Stipendio, Freelance, Famiglia, Investimenti, Vendite, Altri"
-                prompt = f"""Categorizza questo ricavo in una delle seguenti categorie: {categorie}
-
-Ricavo: "{descrizione}"
-
-Regole:
-- Stipendio: salario, busta paga, lavoro principale
-- Freelance: consulenze, lavori secondari, progetti
-- Famiglia: paghette, regali nonni, genitori, contributi familiari
-- Investimenti: dividendi, interessi, capital gain, rendite
-- Vendite: vendita oggetti usati, marketplace, e-commerce
-- Altri: qualsiasi altra entrata
-
-Rispondi solo con il nome della categoria."""
-            
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=10,
-                temperature=0.1
-            )
-            
-            categoria = response.choices[0].message.content.strip()
-            
-            # Valida la risposta
-            categorie_valide = {
-                'spesa': ['Trasporti', 'Alimentari', 'Ristorazione', 'Casa', 'Salute', 'Svago', 'Abbigliamento', 'Varie'],
-                'ricavo': ['Stipendio', 'Freelance', 'Famiglia', 'Investimenti', 'Vendite', 'Altri']
-            }
-            
-            if categoria in categorie_valide[tipo]:
-                return categoria
-            else:
-                return 'Varie' if tipo == 'spesa' else 'Altri'
-                
-        except Exception as e:
-            logger.warning(f"Errore OpenAI categorization: {e}")
-            return self._fallback_categorize(descrizione, tipo)
+        # Utenti che hanno chiesto /importa e stanno per inviare il file
+        self.importazioni_attese = set()
+    
+    def servizi(self, user_id: int) -> ServiziUtente:
+        """Restituisce (creandoli al primo uso) i servizi dell'utente"""
+        servizi = self._servizi.ottieni(user_id, lambda: ServiziUtente(user_id))
+        # Lo storico (letto dopo la registrazione, senza lock del registro) alimenta la cache delle categorie
+        servizi.semina_cache(self.cache_categorie)
+        return servizi
+    
+    async def parse_transazione_async(self, testo: str, tipo: str = 'spesa') -> dict:
+        """Parse di una transazione (spesa/ricavo) da testo naturale, categorizzata dal servizio batch asincrono"""
+        estratta = parser_transazioni.parse(testo)
+        if estratta is None:
+            return {'successo': False}
+        
+        return {
+            'successo': True,
+            'importo': estratta['importo'],
+            'descrizione': estratta['descrizione'],
+            'categoria': await self.categorizzatore.categorizza(estratta['descrizione'], tipo),
+            'tipo': tipo,
+            'data': estratta['data']
+        }
     
     def _fallback_categorize(self, descrizione: str, tipo: str) -> str:
-        """Categorizzazione fallback senza OpenAI"""
-        desc_lower = descrizione.lower()
-        
-        if tipo == 'spesa':
-            categorie_map = {
-                'Trasporti': ['benzina', 'treno', 'bus', 'taxi', 'parcheggio', 'auto'],
-                'Alimentari': ['supermercato', 'spesa', 'pane', 'latte', 'coop', 'lidl'],
-                'Ristorazione': ['ristorante', 'bar', 'caffè', 'pizza', 'pranzo', 'cena'],
-                'Casa': ['bolletta', 'affitto', 'luce', 'gas', 'internet', 'casa'],
-                'Salute': ['farmacia', 'dottore', 'medico', 'medicina'],
-                'Svago': ['cinema', 'libro', 'palestra', 'sport', 'gioco'],
-                'Abbigliamento': ['vestiti', 'scarpe', 'maglietta', 'pantaloni']
-            }
-            
-            for categoria, keywords in categorie_map.items():
-                if any(kw in desc_lower for kw in keywords):
-                    return categoria
-            return 'Varie'
-        
-        else:  # ricavo
-            categorie_map = {
-                'Stipendio': ['stipendio', 'salario', 'busta', 'paga', 'lavoro'],
-                'Freelance': ['consulenza', 'freelance', 'progetto', 'cliente'],
-                'Famiglia': ['paghetta', 'nonna', 'nonno', 'mamma', 'papà', 'famiglia'],
-                'Investimenti': ['dividendo', 'interesse', 'investimento', 'borsa'],
-                'Vendite': ['vendita', 'vendo', 'usato', 'marketplace']
-            }
-            
-            for categoria, keywords in categorie_map.items():
-                if any(kw in desc_lower for kw in keywords):
-                    return categoria
-            return 'Altri'
+        """Categorizzazione fallback senza OpenAI (dizionario parole chiave pesato)"""
+        return self.parole_chiave.categorizza(descrizione, tipo)
 
-# Istanza globale
+# Istanze globali
 bot = FinanceBotAI()
+executor = BotExecutor()
+scrittore = ScrittoreLedger()
+
+async def servizi_utente(update: Update) -> ServiziUtente:
+    """Servizi dell'utente (il primo accesso apre la partizione su disco, fuori dall'event loop)"""
+    return await executor.run_io(bot.servizi, update.effective_user.id)
+
+def pianifica_riaddestramento(user_id: int):
+    """Riaddestra in background il modello previsioni dell'utente (uno alla volta per utente)"""
+    if user_id in bot._riaddestramenti:
+        return
+    bot._riaddestramenti.add(user_id)
+    
+    def completato(task: asyncio.Task):
+        bot._riaddestramenti.discard(user_id)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Errore riaddestramento modello utente {user_id}: {task.exception()}")
+    
+    asyncio.ensure_future(executor.run_cpu(aggiorna_modello_utente, user_id)).add_done_callback(completato)
 
 # HANDLERS
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -212,6 +166,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • `/budget` - Stato budget vs spese
 • `/bilancio` - Entrate vs Uscite  
 • `/stats` - Statistiche generali
+• `/importa` - Importa estratto conto (CSV/XLSX)
 
 🤖 *AI Features (OpenAI):*
 • Categorizzazione intelligente automatica
@@ -233,6 +188,7 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • `€25 spesa supermercato`  
 • `ho speso 12 per pranzo`
 • `cinema 8.50`
+• `1.250,00 affitto 01/10` (data opzionale: `oggi`, `ieri`, `gg/mm`)
 
 🎯 *Categorizzazione automatica:*
 • 🚗 Trasporti, 🛒 Alimentari, 🍽️ Ristorazione
@@ -243,6 +199,9 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Statistiche complete e pattern comportamentali  
 • Predizioni AI basate su cronologia
 
+📥 *Import estratto conto:*
+`/importa` e poi invia il file CSV o XLSX della banca
+
 ⚙️ *Configurazione:*
 Modifica `config.json` per budget personalizzati
 
@@ -326,19 +285,16 @@ async def bilancio(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("💰 Calcolo bilancio...")
     
     try:
-        df = bot.spese_manager.get_dataframe()
+        servizi = await servizi_utente(update)
+        bilancio_mese = await executor.run_io(servizi.spese_manager.get_bilancio_mese)
         
-        if df.empty:
+        if bilancio_mese['transazioni'] == 0:
             await update.message.reply_text("❌ Nessun dato disponibile")
             return
         
-        # Filtra per mese corrente
-        df['data'] = pd.to_datetime(df['data'])
-        mese_corrente = df[df['data'].dt.month == datetime.now().month]
-        
-        spese_totali = mese_corrente[mese_corrente['tipo'] == 'spesa']['importo'].sum()
-        ricavi_totali = mese_corrente[mese_corrente['tipo'] == 'ricavo']['importo'].sum()
-        bilancio_netto = ricavi_totali - spese_totali
+        spese_totali = bilancio_mese['uscite']
+        ricavi_totali = bilancio_mese['entrate']
+        bilancio_netto = bilancio_mese['bilancio']
         
         # Emoji per bilancio
         emoji_bilancio = "📈" if bilancio_netto > 0 else "📉" if bilancio_netto < 0 else "⚖️"
@@ -350,7 +306,7 @@ async def bilancio(update: Update, context: ContextTypes.DEFAULT_TYPE):
 {emoji_bilancio} *Bilancio:* €{bilancio_netto:.2f}
 
 📊 *Dettagli:*
-• Transazioni totali: {len(mese_corrente)}
+• Transazioni totali: {bilancio_mese['transazioni']}
 • Media giornaliera spese: €{spese_totali/30:.2f}
 • % Risparmiato: {(bilancio_netto/ricavi_totali*100):.1f}%" if ricavi_totali > 0 else "N/A"
 """
@@ -360,13 +316,48 @@ async def bilancio(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"❌ Errore calcolo bilancio: {e}")
 
+async def grafici_report(servizi: ServiziUtente) -> dict:
+    """Grafici del report: dalla cache se i dati non sono cambiati, gli altri renderizzati in parallelo"""
+    analytics = servizi.analytics
+    chiavi = await executor.run_io(analytics.chiavi_report)
+    
+    grafici = {}
+    mancanti = []
+    for nome, chiave in chiavi.items():
+        dati = analytics.grafico_da_cache(chiave)
+        if dati is None:
+            mancanti.append(nome)
+        else:
+            grafici[nome] = dati
+    
+    # I grafici da rifare vengono renderizzati in parallelo nel process pool
+    async def renderizza(nome: str) -> bytes:
+        with GRAFICO_SECONDI.tempo(nome):
+            dati, secondi = await executor.run_cpu(genera_grafico_utente, nome, servizi.user_id)
+        RENDERING_SECONDI.osserva(secondi, PROFILO_DEFAULT)
+        if dati:
+            RENDERING_BYTE.osserva(len(dati), PROFILO_DEFAULT)
+        return dati
+    
+    risultati = await asyncio.gather(*(renderizza(nome) for nome in mancanti), return_exceptions=True)
+    for nome, risultato in zip(mancanti, risultati):
+        if isinstance(risultato, Exception):
+            logger.warning(f"Errore grafico {nome}: {risultato}")
+            continue
+        dati = risultato or b''
+        analytics.memorizza_grafico(chiavi[nome], dati)
+        grafici[nome] = dati
+    
+    return {nome: grafici[nome] for nome in GRAFICI_REPORT if grafici.get(nome)}
+
 async def grafici(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("📊 Generazione grafici...")
     
     try:
-        grafici_paths = bot.analytics.genera_report_completo()
+        servizi = await servizi_utente(update)
+        grafici_png = await grafici_report(servizi)
         
-        if not grafici_paths:
+        if not grafici_png:
             await update.message.reply_text("❌ Nessun dato per grafici")
             return
         
@@ -377,11 +368,15 @@ async def grafici(update: Update, context: ContextTypes.DEFAULT_TYPE):
             'settimana': '📅 Pattern Settimanali'
         }
         
-        for nome, path in grafici_paths.items():
-            if path and os.path.exists(path):
-                with open(path, 'rb') as f:
-                    caption = titoli.get(nome, 'Grafico')
-                    await update.message.reply_photo(photo=f, caption=caption)
+        # Un solo upload per tutti i grafici (un album richiede almeno 2 elementi)
+        if len(grafici_png) == 1:
+            nome, dati = next(iter(grafici_png.items()))
+            await update.message.reply_photo(photo=dati, caption=titoli.get(nome, 'Grafico'))
+        else:
+            await update.message.reply_media_group(media=[
+                InputMediaPhoto(media=dati, caption=titoli.get(nome, 'Grafico'))
+                for nome, dati in grafici_png.items()
+            ])
         
         await update.message.reply_text("✅ Grafici completati!")
         
@@ -390,7 +385,8 @@ async def grafici(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def budget_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        budget_info = bot.spese_manager.verifica_budget()
+        servizi = await servizi_utente(update)
+        budget_info = await executor.run_io(servizi.spese_manager.verifica_budget)
         
         messaggio = f"""💰 *Budget Status - {budget_info['mese']}*
 
@@ -419,7 +415,8 @@ async def budget_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        stats = bot.spese_manager.get_statistiche_generali()
+        servizi = await servizi_utente(update)
+        stats = await executor.run_io(servizi.spese_manager.get_statistiche_generali)
         
         messaggio = f"""📊 *Statistiche Generali*
 
@@ -440,19 +437,21 @@ async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Errore stats: {e}")
 
 async def predizioni_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("🤖 AI Training e predizioni...")
-    
     try:
-        # Training
-        training = bot.ai.train_modello_spesa_totale()
+        # Sola inferenza con il modello salvato; training nel process pool solo se non esiste ancora
+        servizi = await servizi_utente(update)
+        risultato = await executor.run_io(servizi.ai.previsione)
+        if risultato is None:
+            await update.message.reply_text("🤖 AI Training e predizioni...")
+            risultato = await executor.run_cpu(addestra_e_predici, servizi.user_id)
+        elif await executor.run_io(servizi.ai.modello_da_aggiornare):
+            pianifica_riaddestramento(servizi.user_id)
+        training, pred = risultato
         
         if 'errore' in training:
             await update.message.reply_text(f"⚠️ {training['errore']}")
             return
         
-        # Predizione
-        pred = bot.ai.predici_spesa_mese_prossimo()
-        
         if 'errore' in pred:
             await update.message.reply_text(f"❌ {pred['errore']}")
             return
@@ -471,6 +470,14 @@ async def predizioni_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Samples: {training['samples_train']}
         """
         
+        # Previsione online per categoria (Holt), già aggiornata dagli ultimi inserimenti
+        online = await executor.run_io(servizi.spese_manager.previsione_online)
+        totale = online.pop(TOTALE, None)
+        if totale is not None:
+            messaggio += f"\n📈 *Previsione online:* €{totale:.2f}\n"
+            for categoria, importo in sorted(online.items(), key=lambda x: x[1], reverse=True)[:5]:
+                messaggio += f"• {categoria}: €{importo:.2f}\n"
+        
         await update.message.reply_text(messaggio, parse_mode='Markdown')
         
     except Exception as e:
@@ -478,7 +485,8 @@ async def predizioni_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def pattern_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        pattern = bot.ai.analizza_pattern_spesa()
+        servizi = await servizi_utente(update)
+        pattern = await executor.run_io(servizi.ai.analizza_pattern_spesa)
         
         if 'errore' in pattern:
             await update.message.reply_text(f"❌ {pattern['errore']}")
@@ -503,7 +511,8 @@ async def pattern_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def raccomandazioni_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        racc = bot.ai.raccomandazioni_budget()
+        servizi = await servizi_utente(update)
+        racc = await executor.run_io(servizi.ai.raccomandazioni_budget)
         
         messaggio = "💡 *AI Recommendations:*\n\n"
         for i, r in enumerate(racc, 1):
@@ -535,21 +544,38 @@ async def gestisci_testo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Determina tipo di transazione
     tipo = modalita  # 'spese' o 'ricavi'
+    tipo_transazione = 'spesa' if tipo == 'spese' else 'ricavo'
     
-    # Parse transazione con OpenAI
-    transazione = bot.parse_transazione(testo, tipo)
+    # Parse + categorizzazione OpenAI (batch asincrono, non blocca l'event loop)
+    transazione = await bot.parse_transazione_async(testo, tipo_transazione)
     
     if transazione['successo']:
-        # Salva nel database con tipo corretto
-        success = bot.spese_manager.aggiungi_transazione(
+        # Salva nella partizione dell'utente con tipo corretto
+        # (tramite lo scrittore unico: group commit, conferma solo a riga durevole)
+        servizi = await servizi_utente(update)
+        record = servizi.spese_manager.crea_record(
             nome_transazione=transazione['descrizione'],
             categoria=transazione['categoria'],
             importo=transazione['importo'],
-            tipo='spesa' if tipo == 'spese' else 'ricavo',
-            note=f"Bot - {user}"
+            tipo=tipo_transazione,
+            note=f"Bot - {user}",
+            data=transazione['data']
         )
         
+        # Confronto con lo storico della categoria (statistiche in streaming), prima del
+        # salvataggio: dopo, la riga farebbe già parte della media con cui viene confrontata
+        anomalia = None
+        if tipo_transazione == 'spesa':
+            anomalia = await executor.run_io(
+                servizi.spese_manager.valuta_anomalia, transazione['categoria'], transazione['importo']
+            )
+        
+        success = await scrittore.salva(servizi.spese_manager, record)
+        
         if success:
+            # Il modello previsioni si aggiorna in background se i dati sono cambiati
+            pianifica_riaddestramento(user_id)
+            
             # Emoji per categorie
             emoji_spese = {
                 'Trasporti': '🚗', 'Alimentari': '🛒', 'Ristorazione': '🍽️',
@@ -566,17 +592,23 @@ async def gestisci_testo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             emoji = emoji_dict.get(transazione['categoria'], '📝')
             
             tipo_display = "Ricavo" if tipo == 'ricavi' else "Spesa"
+            data_display = datetime.strptime(transazione['data'], "%Y-%m-%d") if transazione['data'] else datetime.now()
+            data_display = data_display.strftime("%d/%m/%Y")
             
             messaggio = f"""✅ *{tipo_display} Salvat{'o' if tipo == 'ricavi' else 'a'}!*
 
 💰 **€{transazione['importo']:.2f}**
 📝 {transazione['descrizione']}  
 {emoji} {transazione['categoria']}
-📅 {datetime.now().strftime("%d/%m/%Y")}
+📅 {data_display}
 🤖 Categorizzato con OpenAI
 
 💾 Database aggiornato"""
             
+            if anomalia:
+                messaggio += (f"\n\n🚨 *Spesa insolita:* {anomalia['rapporto']:.1f}x la media "
+                              f"di {transazione['categoria']} (€{anomalia['media_categoria']:.2f})")
+            
             await update.message.reply_text(messaggio, parse_mode='Markdown')
         else:
             await update.message.reply_text("❌ Errore salvataggio")
@@ -597,6 +629,89 @@ async def gestisci_testo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await update.message.reply_text(messaggio, parse_mode='Markdown')
 
+async def importa_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """📥 Attende un estratto conto (CSV/XLSX) da importare"""
+    bot.importazioni_attese.add(update.effective_user.id)
+    await update.message.reply_text(
+        f"""📥 *Importa estratto conto*
+
+Inviami il file esportato dalla banca come documento (CSV o XLSX, max {MAX_MB} MB).
+
+🔎 Servono le colonne *data*, *descrizione* e *importo* (negativi = spese) oppure *uscite*/*entrate*.
+🏷️ Le categorie vengono assegnate automaticamente, le transazioni già presenti vengono saltate.""",
+        parse_mode='Markdown'
+    )
+    
+async def gestisci_documento(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Import di un estratto conto inviato come documento dopo /importa"""
+    user_id = update.effective_user.id
+    documento = update.message.document
+    didascalia = (update.message.caption or '').strip().lower()
+    
+    if user_id not in bot.importazioni_attese and not didascalia.startswith('/importa'):
+        await update.message.reply_text("💡 Per importare un estratto conto usa prima `/importa`.", parse_mode='Markdown')
+        return
+    
+    nome_file = documento.file_name or 'estratto'
+    estensione = os.path.splitext(nome_file)[1].lower()
+    if estensione not in ESTENSIONI:
+        await update.message.reply_text("❌ Formato non supportato: invia un file CSV o XLSX.")
+        return
+    if documento.file_size and documento.file_size > MAX_MB * 1024 * 1024:
+        await update.message.reply_text(f"❌ File troppo grande (max {MAX_MB} MB): dividilo per periodo.")
+        return
+    
+    bot.importazioni_attese.discard(user_id)
+    await update.message.reply_text(f"⏳ Importo `{nome_file}`...", parse_mode='Markdown')
+    
+    try:
+        servizi = await servizi_utente(update)
+        with tempfile.TemporaryDirectory() as cartella:
+            percorso = os.path.join(cartella, f"estratto{estensione}")
+            await (await documento.get_file()).download_to_drive(percorso)
+    
+            # Lettura a blocchi, parsing e deduplica nel thread pool (il file non è mai tutto in memoria)
+            righe, resoconto = await executor.run_io(
+                prepara_importazione, percorso, servizi.spese_manager.get_dataframe,
+                note=f"Import {nome_file}", timeout=600
+            )
+    
+        # Categorie mancanti: cache → classificatore → OpenAI (batch) → keyword, una volta per descrizione
+        righe = await categorizza_importazione(righe, bot.categorizzatore)
+    
+        # Un solo commit per tutto il file
+        importate = await executor.run_io(servizi.spese_manager.importa_transazioni, righe, timeout=600)
+        if importate:
+            pianifica_riaddestramento(user_id)
+    
+    except ValueError as e:
+        await update.message.reply_text(f"❌ File non importabile: {e}")
+        return
+    except Exception as e:
+        logger.error(f"❌ Errore import {nome_file}: {e}")
+        await update.message.reply_text("❌ Errore durante l'importazione, nessuna transazione salvata.")
+        return
+    
+    spese = righe[righe['tipo'] == 'spesa']
+    ricavi = righe[righe['tipo'] == 'ricavo']
+    messaggio = f"""✅ *Import completato!*
+
+📄 Righe lette: {resoconto['lette']:,}
+💾 Nuove transazioni: {importate:,}
+🔁 Già presenti: {resoconto['duplicate']:,}
+⚠️ Scartate (senza data o importo): {resoconto['scartate']:,}
+
+💸 Spese: {len(spese):,} (€{spese['importo'].sum():,.2f})
+💰 Ricavi: {len(ricavi):,} (€{ricavi['importo'].sum():,.2f})"""
+    
+    if len(spese):
+        principali = spese.groupby('categoria')['importo'].sum().nlargest(3)
+        messaggio += "\n\n🏷️ *Categorie principali:*\n" + "\n".join(
+            f"• {categoria}: €{totale:,.2f}" for categoria, totale in principali.items()
+        )
+    
+    await update.message.reply_text(messaggio, parse_mode='Markdown')
+
 async def credito_openai(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """🔍 Mostra info credito e usage OpenAI"""
     logger.info(f"🔍 /credito chiamato da {update.effective_user.id}")
@@ -604,8 +719,10 @@ async def credito_openai(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🔍 Controllo credito OpenAI...", parse_mode='HTML')
     
     try:
-        # Controlla credito
-        credito_info = bot.spese_manager.check_openai_credit()
+        spese_manager = (await servizi_utente(update)).spese_manager
+        
+        # Controlla credito (requests sincrono: nel thread pool)
+        credito_info = await executor.run_io(spese_manager.check_openai_credit)
         
         if "error" in credito_info:
             await update.message.reply_text(
@@ -615,10 +732,10 @@ async def credito_openai(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Ottieni stima costi
-        stima_costi = bot.spese_manager.stima_costo_mensile()
+        stima_costi = spese_manager.stima_costo_mensile()
         
         # Ottieni stima costi
-        stima_costi = bot.spese_manager.stima_costo_mensile()
+        stima_costi = spese_manager.stima_costo_mensile()
         
         # Prepara messaggio basato sullo status
         status = credito_info.get('status', 'unknown')
@@ -718,6 +835,7 @@ async def setup_bot_commands(app):
         BotCommand("predizioni", "🔮 Predizioni AI spese future"),
         BotCommand("pattern", "🔍 Analisi pattern comportamentali"),
         BotCommand("credito", "💳 Controlla credito e usage OpenAI"),
+        BotCommand("importa", "📥 Importa estratto conto (CSV/XLSX)"),
         BotCommand("raccomandazioni", "💡 Consigli AI personalizzati")
     ]
     
@@ -725,12 +843,38 @@ async def setup_bot_commands(app):
     logger.info("✅ Menu comandi bot configurato!")
 
 class HealthCheckHandler(BaseHTTPRequestHandler):
-    """Semplice health check per Render"""
+    """Health check per Render, metriche Prometheus su /metrics e webhook Telegram"""
+    
+    # Impostato in modalità webhook: riceve i POST sul percorso configurato
+    ricevitore: Optional[RicevitoreWebhook] = None
+    
+    def do_POST(self):
+        ricevitore = self.ricevitore
+        try:
+            lunghezza = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            lunghezza = -1
+        if ricevitore is None or not ricevitore.gestisce(self.path):
+            status = 404
+        elif lunghezza <= 0 or lunghezza > WEBHOOK_MAX_BYTE:
+            status = 413 if lunghezza > WEBHOOK_MAX_BYTE else 400
+        else:
+            status = ricevitore.ricevi(self.headers, self.rfile.read(lunghezza))
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
     def do_GET(self):
+        if self.path.split('?', 1)[0] == '/metrics':
+            corpo = registro.esporta().encode('utf-8')
+            tipo = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            corpo, tipo = b'Bot is running!', 'text/plain'
         self.send_response(200)
-        self.send_header('Content-type', 'text/plain')
+        self.send_header('Content-type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
         self.end_headers()
-        self.wfile.write(b'Bot is running!')
+        self.wfile.write(corpo)
     
     def log_message(self, format, *args):
         # Disable HTTP server logging
@@ -739,7 +883,7 @@ class HealthCheckHandler(BaseHTTPRequestHandler):
 def start_health_server():
     """Avvia server HTTP per health check su Render"""
     port = int(os.environ.get('PORT', 10000))
-    server = HTTPServer(('0.0.0.0', port), HealthCheckHandler)
+    server = ThreadingHTTPServer(('0.0.0.0', port), HealthCheckHandler)
     logger.info(f"✅ Health server avviato su porta {port}")
     server.serve_forever()
 
@@ -755,30 +899,52 @@ def main():
         print("❌ Token mancante!")
         return
     
-    # Avvia health server in background per Render
+    # Hit/miss delle cache letti solo quando Prometheus interroga /metrics
+    registro.raccogli(contatori_cache(
+        'financebot_cache_richieste_totale', 'Lookup nelle cache di categorie e grafici',
+        {'categorie': bot.cache_categorie, 'grafici': cache_grafici}
+    ))
+    
+    # In modalità webhook gli update arrivano sulla stessa porta del server di health
+    if MODALITA_DEFAULT == 'webhook':
+        try:
+            HealthCheckHandler.ricevitore = RicevitoreWebhook()
+        except ValueError as e:
+            print(f"❌ Modalità webhook non avviabile: {e}")
+            return
+    
+    # Avvia health server in background per Render (anche /metrics e webhook)
     health_thread = threading.Thread(target=start_health_server, daemon=True)
     health_thread.start()
     
+    # Classificatore locale: addestrato sulle voci della cache, riaddestrato in background quando cambiano
+    bot.cache_categorie.semina_da_ledger(SpeseManager().get_dataframe())
+    bot.classificatore.avvia(bot.cache_categorie.voci, lambda: bot.cache_categorie.generazione)
+    
     # Setup bot
     app = Application.builder().token(TOKEN).build()
     
     # Comandi
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_cmd))
-    app.add_handler(CommandHandler("segnaspese", segnaspese))
-    app.add_handler(CommandHandler("segnaricavi", segnaricavi))
-    app.add_handler(CommandHandler("modalinormale", modalinormale))
-    app.add_handler(CommandHandler("bilancio", bilancio))
-    app.add_handler(CommandHandler("grafici", grafici))
-    app.add_handler(CommandHandler("budget", budget_cmd))  
-    app.add_handler(CommandHandler("stats", stats_cmd))
-    app.add_handler(CommandHandler("predizioni", predizioni_cmd))
-    app.add_handler(CommandHandler("pattern", pattern_cmd))
-    app.add_handler(CommandHandler("raccomandazioni", raccomandazioni_cmd))
-    app.add_handler(CommandHandler("credito", credito_openai))
+    app.add_handler(CommandHandler("start", strumenta("start", start)))
+    app.add_handler(CommandHandler("help", strumenta("help", help_cmd)))
+    app.add_handler(CommandHandler("segnaspese", strumenta("segnaspese", segnaspese)))
+    app.add_handler(CommandHandler("segnaricavi", strumenta("segnaricavi", segnaricavi)))
+    app.add_handler(CommandHandler("modalinormale", strumenta("modalinormale", modalinormale)))
+    app.add_handler(CommandHandler("bilancio", strumenta("bilancio", bilancio)))
+    app.add_handler(CommandHandler("grafici", strumenta("grafici", grafici)))
+    app.add_handler(CommandHandler("budget", strumenta("budget", budget_cmd)))  
+    app.add_handler(CommandHandler("stats", strumenta("stats", stats_cmd)))
+    app.add_handler(CommandHandler("predizioni", strumenta("predizioni", predizioni_cmd)))
+    app.add_handler(CommandHandler("pattern", strumenta("pattern", pattern_cmd)))
+    app.add_handler(CommandHandler("raccomandazioni", strumenta("raccomandazioni", raccomandazioni_cmd)))
+    app.add_handler(CommandHandler("credito", strumenta("credito", credito_openai)))
+    app.add_handler(CommandHandler("importa", strumenta("importa", importa_cmd)))
+    
+    # Documenti (estratti conto da importare)
+    app.add_handler(MessageHandler(filters.Document.ALL, strumenta("documento", gestisci_documento)))
     
     # Testi (spese)
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, gestisci_testo))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, strumenta("testo", gestisci_testo)))
     
     print("✅ Bot configurato!")
     print("📱 @SpesaAIbot")
@@ -791,9 +957,17 @@ def main():
             await setup_bot_commands(app)
         
         app.post_init = post_init
-        app.run_polling()
+        if HealthCheckHandler.ricevitore is not None:
+            asyncio.run(esegui_webhook(app, HealthCheckHandler.ricevitore))
+        else:
+            app.run_polling()
     except KeyboardInterrupt:
         print("\n🔴 Bot fermato")
+    finally:
+        scrittore.chiudi()
+        executor.shutdown()
+        bot.classificatore.ferma()
+        bot.cache_categorie.salva()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
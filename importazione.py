@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+📥 Importazione di Estratti Conto (CSV/XLSX)
+🌊 Lettura a blocchi, parsing vettoriale, deduplica e un solo commit
+"""
+
+import csv
+import os
+import logging
+import re
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from categorizzatore import CATEGORIE
+from dataset_cache import COLONNE
+
+logger = logging.getLogger(__name__)
+
+# Configurazione (sovrascrivibile da ambiente)
+BLOCCO_DEFAULT = int(os.getenv('IMPORTA_BLOCCO', '20000'))
+MAX_OPENAI_DEFAULT = int(os.getenv('IMPORTA_MAX_OPENAI', '500'))
+MAX_MB = 20  # limite di download dei file della Bot API
+
+ESTENSIONI = ('.csv', '.xlsx')
+
+# Intestazioni riconosciute per ruolo (confronto su minuscolo, spazi compattati)
+SINONIMI = {
+    'data': ['data', 'data operazione', 'data contabile', 'data valuta', 'data registrazione',
+             'date', 'booking date', 'transaction date', 'posting date'],
+    'descrizione': ['descrizione', 'descrizione operazione', 'causale', 'dettagli', 'nome_transazione',
+                    'beneficiario', 'operazione', 'description', 'details', 'payee', 'memo'],
+    'importo': ['importo', 'importo eur', 'importo (eur)', 'importo in euro', 'amount', 'valore'],
+    'uscite': ['uscite', 'addebiti', 'addebito', 'dare', 'importo dare', 'debit', 'debito'],
+    'entrate': ['entrate', 'accrediti', 'accredito', 'avere', 'importo avere', 'credit', 'credito'],
+    'categoria': ['categoria', 'category'],
+}
+
+# Formati provati sul primo blocco (a parità di righe lette vince il primo: giorno prima del mese)
+FORMATI_DATA = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d/%m/%y', '%Y/%m/%d', '%m/%d/%Y']
+
+# Righe in cui cercare l'intestazione (gli export bancari hanno spesso un preambolo)
+RIGHE_PREAMBOLO = 30
+SEPARATORI = (';', '\t', ',', '|')
+INTESTAZIONE_MANCANTE = ("intestazione non riconosciuta: servono le colonne data, descrizione "
+                         "e importo (o uscite/entrate)")
+
+
+def _normalizza_intestazione(nome) -> str:
+    return ' '.join(str(nome).lower().replace('.', ' ').split()) if nome is not None else ''
+
+
+def mappa_colonne(colonne: List) -> Dict[str, int]:
+    """
+    Posizione della colonna per ogni ruolo riconosciuto.
+
+    Prima le corrispondenze esatte con SINONIMI, poi le intestazioni che
+    iniziano con un sinonimo ('Importo in EUR'). Servono data, descrizione
+    e un importo (con segno, oppure colonne uscite/entrate separate).
+    """
+    nomi = [_normalizza_intestazione(c) for c in colonne]
+    mappa: Dict[str, int] = {}
+    for esatta in (True, False):
+        for ruolo, sinonimi in SINONIMI.items():
+            if ruolo in mappa:
+                continue
+            for i, nome in enumerate(nomi):
+                if i in mappa.values() or not nome:
+                    continue
+                if nome in sinonimi if esatta else any(nome.startswith(s + ' ') for s in sinonimi):
+                    mappa[ruolo] = i
+                    break
+    return mappa
+
+
+def _mappa_valida(mappa: Dict[str, int]) -> bool:
+    return ('data' in mappa and 'descrizione' in mappa
+            and ('importo' in mappa or 'uscite' in mappa or 'entrate' in mappa))
+
+
+def _trova_intestazione(righe: List[List]) -> Tuple[int, Dict[str, int]]:
+    for indice, riga in enumerate(righe):
+        mappa = mappa_colonne(riga)
+        if _mappa_valida(mappa):
+            return indice, mappa
+    raise ValueError(INTESTAZIONE_MANCANTE)
+
+
+def _blocchi_csv(percorso: str, blocco: int) -> Iterator[Tuple[pd.DataFrame, Dict[str, int]]]:
+    """Blocchi di righe (stringhe) con separatore e codifica dedotti dall'inizio del file"""
+    with open(percorso, 'rb') as f:
+        inizio = f.read(64 * 1024)
+    try:
+        codifica = 'utf-8-sig'
+        testo = inizio.decode(codifica)
+    except UnicodeDecodeError as e:
+        # Un carattere multibyte troncato dal limite del campione non conta
+        codifica = 'utf-8-sig' if e.start >= len(inizio) - 3 else 'latin-1'
+        testo = inizio[:e.start].decode(codifica) if codifica != 'latin-1' else inizio.decode(codifica)
+
+    # Separatore: il primo con cui si riconosce l'intestazione (';' è il più comune negli export italiani)
+    righe_campione = testo.splitlines()[:RIGHE_PREAMBOLO]
+    for separatore in SEPARATORI:
+        try:
+            indice, mappa = _trova_intestazione(list(csv.reader(righe_campione, delimiter=separatore)))
+            break
+        except ValueError:
+            continue
+    else:
+        raise ValueError(INTESTAZIONE_MANCANTE)
+
+    lettore = pd.read_csv(percorso, sep=separatore, encoding=codifica, skiprows=indice, header=0,
+                          dtype=str, chunksize=blocco, skip_blank_lines=True, on_bad_lines='skip')
+    for parte in lettore:
+        yield parte, mappa
+
+
+def _blocchi_xlsx(percorso: str, blocco: int) -> Iterator[Tuple[pd.DataFrame, Dict[str, int]]]:
+    """Blocchi del primo foglio letti in streaming (openpyxl in sola lettura)"""
+    from openpyxl import load_workbook
+
+    cartella = load_workbook(percorso, read_only=True, data_only=True)
+    try:
+        righe = cartella.active.iter_rows(values_only=True)
+        preambolo = []
+        for riga in righe:
+            preambolo.append(list(riga))
+            if len(preambolo) >= RIGHE_PREAMBOLO:
+                break
+        indice, mappa = _trova_intestazione(preambolo)
+        intestazione = [str(c) if c is not None else f'colonna_{i}' for i, c in enumerate(preambolo[indice])]
+
+        def frame(valori: list) -> pd.DataFrame:
+            return pd.DataFrame([v[:len(intestazione)] for v in valori], columns=intestazione)
+
+        parte = preambolo[indice + 1:]
+        for riga in righe:
+            parte.append(riga)
+            if len(parte) >= blocco:
+                yield frame(parte), mappa
+                parte = []
+        if parte:
+            yield frame(parte), mappa
+    finally:
+        cartella.close()
+
+
+def leggi_blocchi(percorso: str, blocco: Optional[int] = None) -> Iterator[Tuple[pd.DataFrame, Dict[str, int]]]:
+    """Blocchi grezzi del file (CSV o XLSX, dall'estensione) con la mappa delle colonne"""
+    blocco = blocco or BLOCCO_DEFAULT
+    estensione = os.path.splitext(percorso)[1].lower()
+    if estensione == '.csv':
+        return _blocchi_csv(percorso, blocco)
+    if estensione == '.xlsx':
+        return _blocchi_xlsx(percorso, blocco)
+    raise ValueError(f"formato non supportato: {estensione or 'senza estensione'} (usa CSV o XLSX)")
+
+
+def _celle_numeriche(serie: pd.Series) -> pd.Series:
+    # Celle già numeriche in una colonna mista (XLSX): non vanno reinterpretate come testo
+    if pd.api.types.infer_dtype(serie, skipna=True) in ('string', 'empty'):
+        return pd.Series(False, index=serie.index)
+    return serie.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))
+
+
+def _testo_importi(serie: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    # Solo cifre, separatori e segno; il segno contabile ('12,50-', '(12.50)') a parte
+    testo = serie.astype(str).str.strip()
+    negativo = (testo.str.startswith('(') & testo.str.endswith(')')) | testo.str.endswith('-')
+    return testo.str.replace(r'[^\d,.\-+]', '', regex=True).str.rstrip('-'), negativo
+
+
+def deduci_decimale(serie: pd.Series, campione: int = 500) -> str:
+    """
+    Separatore decimale ('.' o ',') di una colonna di importi, su un campione.
+
+    Decidono i valori non ambigui: con entrambi i separatori il decimale è
+    l'ultimo, un separatore ripetuto è delle migliaia, uno solo seguito da
+    un numero di cifre diverso da 3 è decimale. Se tutti sono ambigui
+    ('1.500') vale la regola di converti_importo: sono migliaia.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return '.'
+    serie = serie.dropna()
+    testo, _ = _testo_importi(serie[~_celle_numeriche(serie)].head(campione))
+    punto, virgola = testo.str.rfind('.'), testo.str.rfind(',')
+    ultimo = np.maximum(punto, virgola)
+    cifre_dopo = testo.str.len() - ultimo - 1
+    entrambi = (punto >= 0) & (virgola >= 0)
+
+    def voti(sep: str, altro: str, pos: pd.Series) -> int:
+        # Valori che dicono "`sep` è il decimale"
+        decimale = (entrambi & (pos == ultimo)) | (
+            ~entrambi & (pos >= 0) & (testo.str.count(re.escape(sep)) == 1) & (cifre_dopo != 3))
+        migliaia_altro = ~entrambi & (testo.str.count(re.escape(altro)) > 1)
+        return int((decimale | migliaia_altro).sum())
+
+    virgola_voti, punto_voti = voti(',', '.', virgola), voti('.', ',', punto)
+    if virgola_voti or punto_voti:
+        return ',' if virgola_voti >= punto_voti else '.'
+    # Solo '1.500' / '1,500': il separatore che compare è delle migliaia
+    return ',' if (punto >= 0).sum() >= (virgola >= 0).sum() else '.'
+
+
+def parse_importi(serie: pd.Series, decimale: Optional[str] = None) -> pd.Series:
+    """
+    Importi con segno da testo in formato italiano o inglese, vettoriale.
+
+    '1.234,56', '1,234.56', '-12,50', '12,50-', '(12.50)', '€ 9' → float.
+    Il separatore decimale è uno per colonna (`decimale`, o deduci_decimale),
+    così '1.234' e '1.000.000' nello stesso file si leggono allo stesso modo.
+    Illeggibili → NaN.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float)
+
+    decimale = decimale or deduci_decimale(serie)
+    testo, negativo = _testo_importi(serie)
+    if decimale == ',':
+        testo = testo.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    else:
+        testo = testo.str.replace(',', '', regex=False)
+    valori = pd.to_numeric(testo, errors='coerce').astype(float)
+    valori = valori.where(~negativo, -valori.abs())
+    numeriche = _celle_numeriche(serie)
+    return valori.mask(numeriche, pd.to_numeric(serie.where(numeriche), errors='coerce'))
+
+
+def _testo_date(serie: pd.Series) -> pd.Series:
+    # Celle datetime di Excel → 'YYYY-MM-DD HH:MM:SS'; l'eventuale orario si scarta
+    return serie.astype(str).str.strip().str.split(' ', n=1).str[0]
+
+
+def deduci_formato_data(serie: pd.Series, campione: int = 500) -> str:
+    """Formato con più date valide su un campione (a parità, l'ordine di FORMATI_DATA)"""
+    testo = _testo_date(serie.dropna().head(campione))
+    validi = [(pd.to_datetime(testo, format=f, errors='coerce').notna().sum(), -i, f)
+              for i, f in enumerate(FORMATI_DATA)]
+    return max(validi)[2]
+
+
+def parse_date(serie: pd.Series, formato: str) -> pd.Series:
+    """Date con il formato del file; le celle già in formato ISO (Excel) sono sempre accettate"""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    testo = _testo_date(serie)
+    date = pd.to_datetime(testo, format=formato, errors='coerce')
+    if formato != '%Y-%m-%d':
+        date = date.fillna(pd.to_datetime(testo, format='%Y-%m-%d', errors='coerce'))
+    return date
+
+
+def normalizza_blocco(parte: pd.DataFrame, mappa: Dict[str, int], formato: str, note: str,
+                      decimale: Optional[str] = None) -> pd.DataFrame:
+    """
+    Righe del ledger (COLONNE) da un blocco grezzo.
+
+    Importi negativi (o nella colonna uscite) sono spese, positivi ricavi;
+    righe senza data o con importo nullo/illeggibile vengono scartate. La
+    categoria del file si tiene solo se è una di quelle del bot, altrimenti
+    resta vuota e verrà assegnata dalla categorizzazione.
+    """
+    colonna = lambda ruolo: parte.iloc[:, mappa[ruolo]]
+
+    if 'importo' in mappa:
+        importi = parse_importi(colonna('importo'), decimale)
+    else:
+        importi = pd.Series(0.0, index=parte.index)
+        if 'entrate' in mappa:
+            importi = importi + parse_importi(colonna('entrate'), decimale).abs().fillna(0)
+        if 'uscite' in mappa:
+            importi = importi - parse_importi(colonna('uscite'), decimale).abs().fillna(0)
+
+    date = parse_date(colonna('data'), formato)
+    descrizioni = colonna('descrizione').fillna('').astype(str).str.strip()
+    tipi = np.where(importi < 0, 'spesa', 'ricavo')
+
+    righe = pd.DataFrame({
+        'data': date.dt.strftime('%Y-%m-%d'),
+        'nome_transazione': descrizioni.str.replace(r'\s+', ' ', regex=True),
+        'categoria': None,
+        'importo': importi.abs().round(2),
+        'tipo': tipi,
+        'note': note,
+    })
+    if 'categoria' in mappa:
+        categorie = colonna('categoria').astype(str).str.strip()
+        valide = (((righe['tipo'] == 'spesa') & categorie.isin(CATEGORIE['spesa']))
+                  | ((righe['tipo'] == 'ricavo') & categorie.isin(CATEGORIE['ricavo'])))
+        righe['categoria'] = categorie.where(valide)
+
+    valide = date.notna() & importi.notna() & (importi != 0) & (righe['nome_transazione'] != '')
+    return righe[valide.to_numpy()].reset_index(drop=True)
+
+
+def chiavi_dedup(df: pd.DataFrame) -> pd.Series:
+    """Hash di (data, importo in centesimi, descrizione normalizzata, tipo) per riga"""
+    data = df['data']
+    if pd.api.types.is_datetime64_any_dtype(data):
+        data = data.dt.strftime('%Y-%m-%d')
+    return pd.util.hash_pandas_object(pd.DataFrame({
+        'data': data.astype(str),
+        'centesimi': (pd.to_numeric(df['importo'], errors='coerce').abs() * 100).round().fillna(-1).astype('int64'),
+        'descrizione': df['nome_transazione'].fillna('').astype(str).str.lower().str.split().str.join(' '),
+        'tipo': df['tipo'].fillna('spesa').astype(str),
+    }), index=False)
+
+
+def prepara_importazione(percorso: str, esistenti: Union[pd.DataFrame, Callable[[], pd.DataFrame]],
+                         note: str = 'Import', blocco: Optional[int] = None) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Legge il file a blocchi e restituisce le sole righe nuove, pronte per il commit.
+
+    La deduplica conta le occorrenze: una riga del file è nuova se la stessa
+    chiave compare nel file più volte di quante sia già nel ledger. Così
+    reimportare lo stesso estratto non aggiunge nulla, ma due caffè identici
+    nello stesso giorno restano due transazioni. Formato delle date e
+    separatore decimale si deducono una volta, dal primo blocco. `esistenti`
+    può essere una funzione (es. manager.get_dataframe), chiamata qui.
+
+    Returns:
+        (righe nuove con COLONNE, resoconto con lette/scartate/duplicate/nuove)
+    """
+    if callable(esistenti):
+        esistenti = esistenti()
+    gia_presenti = chiavi_dedup(esistenti).value_counts() if len(esistenti) else pd.Series(dtype='int64')
+    visti = pd.Series(dtype='int64')
+    formato = decimale = None
+
+    nuove: List[pd.DataFrame] = []
+    resoconto = {'lette': 0, 'scartate': 0, 'duplicate': 0, 'nuove': 0,
+                 'formato_data': None, 'decimale': None}
+    for parte, mappa in leggi_blocchi(percorso, blocco):
+        if formato is None:
+            formato = resoconto['formato_data'] = deduci_formato_data(parte.iloc[:, mappa['data']])
+            importi = [parte.iloc[:, mappa[r]] for r in ('importo', 'entrate', 'uscite') if r in mappa]
+            decimale = resoconto['decimale'] = deduci_decimale(pd.concat(importi, ignore_index=True))
+        righe = normalizza_blocco(parte, mappa, formato, note, decimale)
+        resoconto['lette'] += len(parte)
+        resoconto['scartate'] += len(parte) - len(righe)
+        if righe.empty:
+            continue
+
+        chiavi = chiavi_dedup(righe)
+        occorrenza = chiavi.groupby(chiavi).cumcount() + chiavi.map(visti).fillna(0)
+        nuova = occorrenza >= chiavi.map(gia_presenti).fillna(0)
+        visti = visti.add(chiavi.value_counts(), fill_value=0)
+
+        resoconto['duplicate'] += int((~nuova).sum())
+        nuove.append(righe[nuova.to_numpy()])
+
+    risultato = pd.concat(nuove, ignore_index=True) if nuove else pd.DataFrame(columns=COLONNE)
+    resoconto['nuove'] = len(risultato)
+    return risultato, resoconto
+
+
+async def categorizza_importazione(righe: pd.DataFrame, categorizzatore,
+                                   max_api: Optional[int] = None) -> pd.DataFrame:
+    """
+    Completa le categorie mancanti con i tier di categorizzazione del bot
+    (una volta per descrizione distinta, cache e classificatore in batch).
+    """
+    max_api = MAX_OPENAI_DEFAULT if max_api is None else max_api
+    for tipo in ('spesa', 'ricavo'):
+        mancanti = righe['categoria'].isna() & (righe['tipo'] == tipo)
+        if not mancanti.any():
+            continue
+        descrizioni = pd.unique(righe.loc[mancanti, 'nome_transazione'])
+        categorie = await categorizzatore.categorizza_molti(list(descrizioni), tipo, max_api=max_api)
+        righe.loc[mancanti, 'categoria'] = righe.loc[mancanti, 'nome_transazione'].map(
+            dict(zip(descrizioni, categorie)))
+        max_api = max(0, max_api - len(descrizioni))
+    return righe
+
+
+# Import di prova: python importazione.py [righe]
+if __name__ == "__main__":
+    import asyncio
+    import sys
+    import tempfile
+    import time
+    import tracemalloc
+
+    from benchmarks.dati_sintetici import genera_ledger
+    from categorizzatore import CategorizzatoreAsync
+    from parole_chiave import MatcherParoleChiave
+    from spese_manager import SpeseManager
+
+    logging.disable(logging.INFO)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    with tempfile.TemporaryDirectory() as cartella:
+        os.chdir(cartella)
+
+        # Estratto conto "bancario": preambolo, ';', date gg/mm/aaaa, importi italiani con segno
+        ledger = genera_ledger(n, mesi=12, seed=7)
+        segno = np.where(ledger['tipo'] == 'spesa', -1, 1)
+        importi = (ledger['importo'] * segno).map(lambda v: f"{v:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'))
+        estratto = pd.DataFrame({
+            'Data operazione': pd.to_datetime(ledger['data']).dt.strftime('%d/%m/%Y'),
+            'Data valuta': pd.to_datetime(ledger['data']).dt.strftime('%d/%m/%Y'),
+            'Descrizione': ledger['nome_transazione'].str.upper(),
+            'Importo (EUR)': importi,
+        })
+        with open('estratto.csv', 'w', encoding='utf-8') as f:
+            f.write('Estratto conto;;;\nConto 000123;;;\n\n')
+            estratto.to_csv(f, sep=';', index=False)
+        estratto.head(2000).to_excel('estratto.xlsx', index=False)
+        del ledger, estratto
+
+        manager = SpeseManager('spese.csv', 'config.json', 'backup', user_id=1)
+        categorizzatore = CategorizzatoreAsync(fallback=MatcherParoleChiave.da_file().categorizza)
+
+        for giro in ('primo import', 'reimport'):
+            inizio = time.perf_counter()
+            righe, resoconto = prepara_importazione('estratto.csv', manager.get_dataframe())
+            letto = time.perf_counter()
+            righe = asyncio.run(categorizza_importazione(righe, categorizzatore))
+            categorizzato = time.perf_counter()
+            manager.importa_transazioni(righe)
+            print(f"📥 CSV {giro}: {resoconto} — lettura {letto - inizio:.2f} s, "
+                  f"categorie {categorizzato - letto:.2f} s, commit {time.perf_counter() - categorizzato:.2f} s")
+
+        # Memoria della lettura a blocchi (esecuzione tracciata a parte: tracemalloc rallenta)
+        tracemalloc.start()
+        prepara_importazione('estratto.csv', manager.get_dataframe())
+        print(f"🧠 Picco di memoria della lettura: {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.0f} MB "
+              f"(file {os.path.getsize('estratto.csv') / 1024 / 1024:.0f} MB)")
+        tracemalloc.stop()
+
+        righe, resoconto = prepara_importazione('estratto.xlsx', manager.get_dataframe())
+        print(f"📊 XLSX (prime 2000 righe, già importate): {resoconto}")
+        print(f"✅ Righe nel ledger: {len(manager.get_dataframe())}")
+        print(manager.get_dataframe().tail(3).to_string())
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+📡 Metriche del Bot in Formato Prometheus
+⏱️ Contatori, indicatori e istogrammi in memoria, esposti su /metrics dal server di health
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Bucket di latenza (secondi): dai lookup in cache ai grafici e al training
+BUCKET_DEFAULT = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Campione esportato: (suffisso, etichette, valore)
+Campione = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+
+def _escape(valore: str) -> str:
+    return str(valore).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatta(valore: float) -> str:
+    if valore == float('inf'):
+        return '+Inf'
+    return repr(float(valore)) if valore != int(valore) else str(int(valore))
+
+
+class _Metrica:
+    """Famiglia di serie con le stesse etichette; le serie si creano al primo uso"""
+
+    tipo = ''
+
+    def __init__(self, nome: str, descrizione: str, etichette: Sequence[str] = ()):
+        self.nome = nome
+        self.descrizione = descrizione
+        self.etichette = tuple(etichette)
+        self._serie: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def _nuova(self) -> list:
+        return [0.0]
+
+    def _valori(self, valori: Tuple[str, ...]) -> list:
+        serie = self._serie.get(valori)
+        if serie is None:
+            if len(valori) != len(self.etichette):
+                raise ValueError(f"{self.nome}: attese etichette {self.etichette}, ricevuti {valori}")
+            serie = self._serie.setdefault(valori, self._nuova())
+        return serie
+
+    def campioni(self) -> List[Campione]:
+        with self._lock:
+            return [('', tuple(zip(self.etichette, valori)), serie[0])
+                    for valori, serie in sorted(self._serie.items())]
+
+
+class Contatore(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, *etichette: str, valore: float = 1.0):
+        with self._lock:
+            self._valori(etichette)[0] += valore
+
+
+class Indicatore(_Metrica):
+    tipo = 'gauge'
+
+    def inc(self, *etichette: str, valore: float = 1.0):
+        with self._lock:
+            self._valori(etichette)[0] += valore
+
+    def dec(self, *etichette: str, valore: float = 1.0):
+        with self._lock:
+            self._valori(etichette)[0] -= valore
+
+
+class Istogramma(_Metrica):
+    """Conteggi per bucket (non cumulativi in memoria, cumulati all'export), somma e totale"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nome: str, descrizione: str, etichette: Sequence[str] = (),
+                 bucket: Sequence[float] = BUCKET_DEFAULT):
+        super().__init__(nome, descrizione, etichette)
+        self.bucket = tuple(sorted(bucket))
+
+    def _nuova(self) -> list:
+        # [somma, conteggio, per bucket..., oltre l'ultimo]
+        return [0.0, 0] + [0] * (len(self.bucket) + 1)
+
+    def osserva(self, valore: float, *etichette: str):
+        indice = bisect.bisect_left(self.bucket, valore)
+        with self._lock:
+            serie = self._valori(etichette)
+            serie[0] += valore
+            serie[1] += 1
+            serie[2 + indice] += 1
+
+    @contextmanager
+    def tempo(self, *etichette: str):
+        """Osserva la durata del blocco (anche se solleva un'eccezione)"""
+        inizio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.osserva(time.perf_counter() - inizio, *etichette)
+
+    def campioni(self) -> List[Campione]:
+        with self._lock:
+            copia = sorted((valori, list(serie)) for valori, serie in self._serie.items())
+
+        campioni = []
+        for valori, serie in copia:
+            etichette = tuple(zip(self.etichette, valori))
+            cumulato = 0
+            for limite, conteggio in zip(self.bucket + (float('inf'),), serie[2:]):
+                cumulato += conteggio
+                campioni.append(('_bucket', etichette + (('le', _formatta(limite)),), cumulato))
+            campioni.append(('_sum', etichette, serie[0]))
+            campioni.append(('_count', etichette, serie[1]))
+        return campioni
+
+
+class Registro:
+    """
+    Insieme delle metriche del processo.
+
+    Oltre alle metriche registrate accetta dei raccoglitori: funzioni chiamate
+    solo all'export che leggono contatori già esistenti (es. hit/miss delle
+    cache), così il percorso caldo non paga nulla in più.
+    """
+
+    def __init__(self):
+        self._metriche: Dict[str, _Metrica] = {}
+        self._raccoglitori: List[Callable[[], Iterable[_Metrica]]] = []
+        self._lock = threading.Lock()
+
+    def registra(self, metrica: _Metrica) -> _Metrica:
+        with self._lock:
+            if metrica.nome in self._metriche:
+                raise ValueError(f"Metrica già registrata: {metrica.nome}")
+            self._metriche[metrica.nome] = metrica
+        return metrica
+
+    def raccogli(self, raccoglitore: Callable[[], Iterable[_Metrica]]):
+        with self._lock:
+            self._raccoglitori.append(raccoglitore)
+
+    def esporta(self) -> str:
+        """Tutte le metriche nel formato testuale Prometheus 0.0.4"""
+        with self._lock:
+            metriche = list(self._metriche.values())
+            raccoglitori = list(self._raccoglitori)
+        for raccoglitore in raccoglitori:
+            metriche.extend(raccoglitore())
+
+        righe = []
+        for metrica in metriche:
+            righe.append(f"# HELP {metrica.nome} {metrica.descrizione}")
+            righe.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            for suffisso, etichette, valore in metrica.campioni():
+                testo = ','.join(f'{k}="{_escape(v)}"' for k, v in etichette)
+                righe.append(f"{metrica.nome}{suffisso}{'{' + testo + '}' if testo else ''} {_formatta(valore)}")
+        return '\n'.join(righe) + '\n'
+
+
+registro = Registro()
+
+# Comandi Telegram
+COMANDO_SECONDI = registro.registra(Istogramma(
+    'financebot_comando_secondi', 'Latenza dei comandi e dei messaggi Telegram', ['comando']))
+COMANDI_IN_CORSO = registro.registra(Indicatore(
+    'financebot_comandi_in_corso', 'Comandi Telegram in esecuzione', ['comando']))
+COMANDO_ERRORI = registro.registra(Contatore(
+    'financebot_comando_errori_totale', 'Comandi Telegram terminati con eccezione', ['comando']))
+
+# Dipendenze e lavoro pesante
+OPENAI_SECONDI = registro.registra(Istogramma(
+    'financebot_openai_secondi', 'Latenza delle chiamate OpenAI', ['chiamata', 'esito']))
+GRAFICO_SECONDI = registro.registra(Istogramma(
+    'financebot_grafico_secondi', 'Generazione di un grafico (process pool incluso)', ['grafico']))
+ESECUTORE_SECONDI = registro.registra(Istogramma(
+    'financebot_executor_secondi', 'Task nei pool io/cpu, attesa in coda inclusa', ['pool', 'funzione']))
+CARICAMENTO_SECONDI = registro.registra(Istogramma(
+    'financebot_caricamento_dataset_secondi', 'Lettura del ledger da disco nella cache', ['lettura']))
+
+# Scrittore del ledger (group commit)
+SCRITTURA_SECONDI = registro.registra(Istogramma(
+    'financebot_scrittura_ledger_secondi', 'Scrittura durevole di un gruppo di righe', ['backend']))
+SCRITTURA_RIGHE = registro.registra(Istogramma(
+    'financebot_scrittura_ledger_righe', 'Righe per scrittura del ledger', ['backend'],
+    bucket=(1, 2, 4, 8, 16, 32, 64, 128, 256)))
+RENDERING_SECONDI = registro.registra(Istogramma(
+    'financebot_rendering_grafico_secondi', 'Rendering di un grafico nel worker (attesa in coda esclusa)',
+    ['profilo']))
+RENDERING_BYTE = registro.registra(Istogramma(
+    'financebot_rendering_grafico_byte', 'Dimensione di un grafico renderizzato', ['profilo'],
+    bucket=tuple(1024 * kb for kb in (16, 32, 64, 128, 256, 512, 1024, 2048, 4096))))
+
+
+def strumenta(comando: str, handler: Callable) -> Callable:
+    """Avvolge un handler asincrono con latenza, comandi in corso ed errori"""
+
+    @functools.wraps(handler)
+    async def avvolto(*args, **kwargs):
+        COMANDI_IN_CORSO.inc(comando)
+        inizio = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception:
+            COMANDO_ERRORI.inc(comando)
+            raise
+        finally:
+            COMANDO_SECONDI.osserva(time.perf_counter() - inizio, comando)
+            COMANDI_IN_CORSO.dec(comando)
+
+    return avvolto
+
+
+def contatori_cache(nome: str, descrizione: str, sorgenti: Dict[str, object]) -> Callable[[], List[_Metrica]]:
+    """
+    Raccoglitore che esporta hit/miss di oggetti con attributi `hit` e `miss`
+    come {nome}{cache="...", esito="hit|miss"}.
+    """
+    def raccogli() -> List[_Metrica]:
+        metrica = Contatore(nome, descrizione, ['cache', 'esito'])
+        for cache, oggetto in sorgenti.items():
+            metrica.inc(cache, 'hit', valore=oggetto.hit)
+            metrica.inc(cache, 'miss', valore=oggetto.miss)
+        return [metrica]
+    return raccogli
+
+
+# Micro-benchmark: python metriche.py
+if __name__ == "__main__":
+    import asyncio
+
+    n = 200000
+    inizio = time.perf_counter()
+    for i in range(n):
+        COMANDO_SECONDI.osserva((i % 100) / 1000, 'stats')
+    print(f"⚡ osserva(): {(time.perf_counter() - inizio) / n * 1e9:.0f} ns")
+
+    async def handler(update, context):
+        await asyncio.sleep(0)
+
+    strumentato = strumenta('start', handler)
+
+    async def giro():
+        inizio = time.perf_counter()
+        for _ in range(20000):
+            await handler(None, None)
+        nudo = time.perf_counter() - inizio
+        inizio = time.perf_counter()
+        for _ in range(20000):
+            await strumentato(None, None)
+        return (time.perf_counter() - inizio - nudo) / 20000
+
+    print(f"⚡ Overhead per handler: {asyncio.run(giro()) * 1e6:.2f} µs")
+
+    class _Cache:
+        hit, miss = 42, 8
+
+    registro.raccogli(contatori_cache('financebot_cache_richieste_totale', 'Lookup nelle cache',
+                                      {'categorie': _Cache()}))
+    OPENAI_SECONDI.osserva(0.8, 'batch', 'ok')
+    testo = registro.esporta()
+    print('\n'.join(r for r in testo.splitlines() if 'openai' in r or 'cache' in r or 'start' in r))
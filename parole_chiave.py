@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+🔑 Matcher delle Parole Chiave per la Categorizzazione di Fallback
+🌲 Dizionario compilato in una sola regex a trie, con confini di parola e pesi
+"""
+
+import json
+import os
+import re
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+from cache_categorie import normalizza_descrizione
+
+logger = logging.getLogger(__name__)
+
+# Configurazione (sovrascrivibile da ambiente)
+DIZIONARIO_FILE_DEFAULT = os.getenv(
+    'PAROLE_CHIAVE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parole_chiave.json')
+)
+
+# {tipo: {categoria: {parola: peso}}}; una lista di parole vale peso 1.
+# Una parola che termina con '*' è un prefisso ("pizz*" → pizza, pizzeria).
+Dizionario = Dict[str, Dict[str, Union[Dict[str, float], List[str]]]]
+
+
+def _regex_trie(parole: List[Tuple[str, bool]]) -> str:
+    """
+    Regex equivalente all'alternanza delle parole, fattorizzata come un trie:
+    il costo per posizione dipende dalla lunghezza delle parole, non dal loro numero.
+    Le parole intere terminano con (?!\\w), i prefissi no.
+    """
+    trie: dict = {}
+    for parola, prefisso in parole:
+        nodo = trie
+        for carattere in parola:
+            nodo = nodo.setdefault(carattere, {})
+        nodo[''] = nodo.get('', False) or prefisso
+
+    def genera(nodo: dict) -> str:
+        rami = [re.escape(c) + genera(figlio) for c, figlio in sorted(nodo.items()) if c != '']
+        if '' in nodo:
+            # Fine parola per ultima: si preferisce sempre la corrispondenza più lunga
+            rami.append('' if nodo[''] else r'(?!\w)')
+        if len(rami) == 1:
+            return rami[0]
+        return '(?:' + '|'.join(rami) + ')'
+
+    return r'(?<!\w)' + genera(trie)
+
+
+class MatcherParoleChiave:
+    """
+    Categorizzazione per parole chiave costruita una sola volta.
+
+    Per ogni tipo tutte le parole del dizionario diventano un'unica regex;
+    categorizza() somma i pesi delle parole trovate per categoria e
+    restituisce la categoria con il punteggio più alto (a parità vince
+    l'ordine del dizionario), oppure la categoria di default.
+    """
+
+    def __init__(self, dizionario: Dizionario, default: Optional[Dict[str, str]] = None):
+        self.default = default or {'spesa': 'Varie', 'ricavo': 'Altri'}
+        self._regex: Dict[str, re.Pattern] = {}
+        self._pesi: Dict[str, Dict[str, List[Tuple[str, float]]]] = {}
+        self._ordine: Dict[str, Dict[str, int]] = {}
+
+        for tipo, categorie in dizionario.items():
+            pesi: Dict[str, List[Tuple[str, float]]] = {}
+            parole = set()
+            for categoria, voci in categorie.items():
+                if isinstance(voci, list):
+                    voci = {parola: 1 for parola in voci}
+                for parola, peso in voci.items():
+                    parola = normalizza_descrizione(parola)
+                    prefisso = parola.endswith('*')
+                    parola = parola.rstrip('*')
+                    if not parola:
+                        continue
+                    pesi.setdefault(parola, []).append((categoria, float(peso)))
+                    parole.add((parola, prefisso))
+
+            self._pesi[tipo] = pesi
+            self._ordine[tipo] = {categoria: i for i, categoria in enumerate(categorie)}
+            if parole:
+                self._regex[tipo] = re.compile(_regex_trie(sorted(parole)))
+
+    @classmethod
+    def da_file(cls, percorso: Optional[str] = None) -> 'MatcherParoleChiave':
+        percorso = percorso or DIZIONARIO_FILE_DEFAULT
+        with open(percorso, 'r', encoding='utf-8') as f:
+            dizionario = json.load(f)
+        matcher = cls(dizionario)
+        logger.info(f"🔑 Dizionario parole chiave: {sum(len(p) for p in matcher._pesi.values())} parole da {percorso}")
+        return matcher
+
+    def punteggi(self, descrizione: str, tipo: str) -> Dict[str, float]:
+        """Punteggio di ogni categoria con almeno una parola trovata"""
+        regex = self._regex.get(tipo)
+        if regex is None:
+            return {}
+
+        pesi = self._pesi[tipo]
+        punteggi: Dict[str, float] = {}
+        for match in regex.finditer(normalizza_descrizione(descrizione)):
+            for categoria, peso in pesi[match.group(0)]:
+                punteggi[categoria] = punteggi.get(categoria, 0) + peso
+        return punteggi
+
+    def categorizza(self, descrizione: str, tipo: str) -> str:
+        punteggi = self.punteggi(descrizione, tipo)
+        if not punteggi:
+            return self.default.get(tipo, 'Varie')
+        ordine = self._ordine[tipo]
+        return max(punteggi, key=lambda categoria: (punteggi[categoria], -ordine[categoria]))
+
+
+# Test rapido: python parole_chiave.py
+if __name__ == "__main__":
+    import random
+    import string
+    import time
+
+    matcher = MatcherParoleChiave.da_file()
+    for descrizione, tipo in [('Spesa benzina Q8', 'spesa'), ('pizzeria da Mario', 'spesa'),
+                              ('barbiere', 'spesa'), ('caffè al bar', 'spesa'),
+                              ('busta paga ottobre', 'ricavo'), ('venduto bici su Subito', 'ricavo')]:
+        print(f"  - {descrizione}: {matcher.categorizza(descrizione, tipo)} {matcher.punteggi(descrizione, tipo)}")
+
+    # Il costo non cresce con il dizionario: 10 vs 5000 parole per categoria
+    random.seed(42)
+    testo = 'pagamento pos esercente 4471 milano caffè'
+    for n in (10, 5000):
+        dizionario = {'spesa': {f'Cat{c}': {
+            ''.join(random.choices(string.ascii_lowercase, k=random.randint(4, 12))): 1 for _ in range(n)
+        } for c in range(7)}}
+        dizionario['spesa']['Cat0']['caffè'] = 2
+        grande = MatcherParoleChiave(dizionario)
+        ripetizioni = 20000
+        inizio = time.perf_counter()
+        for _ in range(ripetizioni):
+            grande.categorizza(testo, 'spesa')
+        durata = (time.perf_counter() - inizio) / ripetizioni * 1e6
+        print(f"⚡ {7 * n:>6} parole: {durata:.2f} µs per descrizione")
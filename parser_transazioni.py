@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+✍️ Parser delle Transazioni in Linguaggio Naturale
+⚡ Una sola scansione del messaggio: importo, valuta, verbo, data e descrizione
+"""
+
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+# Un'unica regex con gruppi nominati: finditer() scorre il testo una volta sola
+_TOKEN = re.compile(r"""
+    (?P<verbo>\b(?:ho\s+)?(?P<azione>speso|pagato|ricevuto|guadagnato|incassato)\b)
+  | (?P<relativa>\b(?:oggi|ieri|altroieri|l'altro\s+ieri)\b)
+  | (?P<data>(?<![\w.,/-])(?:\d{4}-\d{1,2}-\d{1,2}|\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?)(?![\w/-]))
+  | (?P<importo>
+        (?:(?P<pre>[€$]|\beur(?:o)?\b)\s*)?
+        (?<![\w.,])(?P<numero>\d+(?:[.,]\d{3})*(?:[.,]\d+)?)(?![\w.,]\d)
+        (?:\s*(?P<post>[€$]|\beur(?:o|i)?\b))?
+    )
+""", re.IGNORECASE | re.VERBOSE)
+
+_CONNETTIVO = re.compile(r'^(?:per|da|di|in|al|alla)\s+', re.IGNORECASE)
+
+_TIPO_VERBO = {'speso': 'spesa', 'pagato': 'spesa',
+               'ricevuto': 'ricavo', 'guadagnato': 'ricavo', 'incassato': 'ricavo'}
+
+_GIORNI_FA = {'oggi': 0, 'ieri': 1, 'altroieri': 2}
+
+
+def converti_importo(numero: str) -> float:
+    """
+    Interpreta separatori italiani e inglesi:
+    1.234,56 / 1,234.56 → 1234.56; 12,50 → 12.5; 1.500 → 1500
+    """
+    ultimo = max(numero.rfind('.'), numero.rfind(','))
+    if ultimo < 0:
+        return float(numero)
+
+    separatore = numero[ultimo]
+    altri = set(numero[:ultimo]) & ({'.', ','} - {separatore})
+    cifre_dopo = len(numero) - ultimo - 1
+
+    # Se c'è un solo tipo di separatore ripetuto, o seguito da 3 cifre, sono migliaia
+    if not altri and (numero.count(separatore) > 1 or cifre_dopo == 3):
+        return float(numero.replace(separatore, ''))
+    intero = numero[:ultimo].replace('.', '').replace(',', '')
+    return float(f"{intero}.{numero[ultimo + 1:]}")
+
+
+def _converti_data(testo: str, oggi: date) -> Optional[date]:
+    parti = [int(p) for p in re.split(r'[/-]', testo)]
+    try:
+        if parti[0] > 31:  # ISO: yyyy-mm-dd
+            return date(parti[0], parti[1], parti[2])
+        anno = oggi.year
+        if len(parti) == 3:
+            anno = parti[2] + 2000 if parti[2] < 100 else parti[2]
+        return date(anno, parti[1], parti[0])
+    except ValueError:
+        return None
+
+
+def parse(testo: str, oggi: Optional[date] = None) -> Optional[dict]:
+    """
+    Estrae una transazione da un messaggio, mantenendo le maiuscole originali.
+
+    Restituisce {'importo', 'descrizione', 'data' (YYYY-MM-DD o None),
+    'tipo' (dal verbo, o None)} oppure None se il messaggio non è una transazione.
+    L'importo è quello con valuta, dopo il verbo, oppure a inizio/fine messaggio.
+    """
+    oggi = oggi or datetime.now().date()
+    testo = testo.strip()
+
+    tipo = None
+    data = None
+    importi = []               # (match, con_valuta, dopo_verbo)
+    rimossi: List[tuple] = []  # span da togliere dalla descrizione
+    fine_verbo = -1
+
+    for match in _TOKEN.finditer(testo):
+        gruppo = match.lastgroup
+        if gruppo == 'verbo':
+            tipo = tipo or _TIPO_VERBO[match.group('azione').lower()]
+            fine_verbo = match.end()
+            rimossi.append(match.span())
+        elif gruppo == 'relativa':
+            if data is None:
+                chiave = re.sub(r"l'|\s+", '', match.group(0).lower())
+                data = oggi - timedelta(days=_GIORNI_FA[chiave])
+                rimossi.append(match.span())
+        elif gruppo == 'data':
+            convertita = _converti_data(match.group(0), oggi)
+            if data is None and convertita is not None:
+                data = convertita
+                rimossi.append(match.span())
+        else:
+            con_valuta = bool(match.group('pre') or match.group('post'))
+            dopo_verbo = fine_verbo >= 0 and not testo[fine_verbo:match.start()].strip()
+            importi.append((match, con_valuta, dopo_verbo))
+
+    if not importi:
+        return None
+
+    # Scelta dell'importo: valuta > dopo il verbo > a fine messaggio > a inizio messaggio
+    scelto = next((m for m, valuta, _ in importi if valuta), None) \
+        or next((m for m, _, verbo in importi if verbo), None)
+    if scelto is None:
+        ultimo, primo = importi[-1][0], importi[0][0]
+        if _vuoto(testo, ultimo.end(), len(testo), rimossi):
+            scelto = ultimo
+        elif _vuoto(testo, 0, primo.start(), rimossi):
+            scelto = primo
+        else:
+            return None
+
+    importo = converti_importo(scelto.group('numero'))
+    if importo <= 0:
+        return None
+
+    # "12 per pranzo", "ho ricevuto 50 da nonna": il connettivo dopo l'importo non è descrizione
+    in_testa = _vuoto(testo, 0, scelto.start(), rimossi)
+    rimossi.append(scelto.span())
+    descrizione = _testo_senza(testo, rimossi)
+    if in_testa:
+        descrizione = _CONNETTIVO.sub('', descrizione, count=1)
+    descrizione = descrizione.strip(' .,;:!-')
+    if not descrizione:
+        return None
+
+    return {
+        'importo': importo,
+        'descrizione': descrizione,
+        'data': data.strftime("%Y-%m-%d") if data else None,
+        'tipo': tipo,
+    }
+
+
+def _testo_senza(testo: str, span: List[tuple], inizio: int = 0, fine: Optional[int] = None) -> str:
+    """testo[inizio:fine] senza gli span indicati, con spazi compattati"""
+    fine = len(testo) if fine is None else fine
+    pezzi = []
+    for a, b in sorted(span):
+        if b <= inizio:
+            continue
+        if a >= fine:
+            break
+        pezzi.append(testo[inizio:a])
+        inizio = max(inizio, b)
+    if inizio < fine:
+        pezzi.append(testo[inizio:fine])
+    return ' '.join(''.join(pezzi).split())
+
+
+def _vuoto(testo: str, inizio: int, fine: int, span: List[tuple]) -> bool:
+    """True se in testo[inizio:fine] resta solo punteggiatura dopo aver tolto gli span"""
+    return not _testo_senza(testo, span, inizio, fine).strip(' .,;:!-')
+
+
+# Micro-benchmark: python parser_transazioni.py
+if __name__ == "__main__":
+    import time
+
+    esempi = [
+        "15.50 benzina", "€25 spesa Supermercato", "ho speso 12 per pranzo", "cinema 8,50",
+        "1.234,56 affitto", "ho ricevuto 1500€ da Nonna", "Esselunga 45,30 ieri",
+        "12/10 cena da Mario 60 euro", "2024-03-01 bolletta Enel 80", "buongiorno",
+        "regalo 1.000.000", "1,000,000 lotteria",
+    ]
+    for esempio in esempi:
+        print(f"  - {esempio!r}: {parse(esempio)}")
+
+    n = 20000
+    inizio = time.perf_counter()
+    for i in range(n):
+        parse(esempi[i % len(esempi)])
+    print(f"⚡ Parse medio: {(time.perf_counter() - inizio) / n * 1e6:.1f} µs per messaggio")
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+📈 Previsioni Online delle Spese
+⚡ Holt (livello + trend) per categoria e totale, aggiornato in O(1) a ogni inserimento
+"""
+
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+# Parametri di smoothing (sovrascrivibili da ambiente)
+ALPHA_DEFAULT = float(os.getenv('PREVISIONI_ALPHA', '0.5'))
+BETA_DEFAULT = float(os.getenv('PREVISIONI_BETA', '0.2'))
+
+TOTALE = '__totale__'
+
+Mese = Tuple[int, int]
+
+
+def _indice(mese: Mese) -> int:
+    return mese[0] * 12 + mese[1] - 1
+
+
+class HoltMensile:
+    """Stato di Holt di una serie mensile: livello, trend, ultimo mese incorporato"""
+
+    __slots__ = ('livello', 'trend', 'ultimo')
+
+    def __init__(self):
+        self.livello: Optional[float] = None
+        self.trend = 0.0
+        self.ultimo: Optional[int] = None
+
+    def osserva(self, indice: int, valore: float, alpha: float, beta: float):
+        """Incorpora il totale di un mese chiuso (i mesi saltati valgono 0)"""
+        if self.livello is None:
+            self.livello, self.ultimo = valore, indice
+            return
+        while self.ultimo < indice:
+            self.ultimo += 1
+            x = valore if self.ultimo == indice else 0.0
+            precedente = self.livello
+            self.livello = alpha * x + (1 - alpha) * (self.livello + self.trend)
+            self.trend = beta * (self.livello - precedente) + (1 - beta) * self.trend
+
+    def previsione(self, indice: int) -> Optional[float]:
+        if self.livello is None:
+            return None
+        return max(0.0, self.livello + self.trend * (indice - self.ultimo))
+
+
+class PrevisoreOnline:
+    """
+    Previsione del totale mensile delle spese, per categoria e complessiva.
+
+    Gli importi del mese in corso (e successivi) si accumulano in O(1); quando
+    il calendario passa al mese dopo, i mesi chiusi aggiornano lo stato di Holt
+    di ogni serie. Un inserimento in un mese già chiuso non può essere applicato
+    in modo incrementale: lo stato viene ricostruito dal rollup mensile
+    (aggregati, mai lo storico delle transazioni).
+    """
+
+    def __init__(self, alpha: Optional[float] = None, beta: Optional[float] = None):
+        self.alpha = alpha if alpha is not None else ALPHA_DEFAULT
+        self.beta = beta if beta is not None else BETA_DEFAULT
+
+        self._serie: Dict[str, HoltMensile] = {}
+        self._aperti: Dict[int, Dict[str, float]] = {}  # mese aperto → {categoria: totale}
+        self._primo_aperto: Optional[int] = None
+        self._lock = threading.Lock()
+
+        # Contatori
+        self.aggiornamenti = 0
+        self.ricostruzioni = 0
+
+    def _chiudi_fino(self, indice_corrente: int):
+        """Incorpora nello stato tutti i mesi aperti precedenti al mese corrente"""
+        for indice in sorted(i for i in self._aperti if i < indice_corrente):
+            totali = self._aperti.pop(indice)
+            # Le serie senza importi nel mese osservano 0 (vale anche per quelle nuove)
+            for categoria in set(self._serie) | set(totali):
+                self._serie.setdefault(categoria, HoltMensile()).osserva(
+                    indice, totali.get(categoria, 0.0), self.alpha, self.beta
+                )
+        # Mesi chiusi senza alcuna spesa dopo l'ultimo osservato: valgono 0 per ogni serie
+        ultimo_chiuso = indice_corrente - 1
+        for serie in self._serie.values():
+            if serie.ultimo is not None and serie.ultimo < ultimo_chiuso:
+                serie.osserva(ultimo_chiuso, 0.0, self.alpha, self.beta)
+        self._primo_aperto = indice_corrente if self._primo_aperto is None \
+            else max(self._primo_aperto, indice_corrente)
+
+    def aggiorna(self, record: dict, oggi: Optional[datetime] = None) -> bool:
+        """
+        Incorpora una transazione. Restituisce False se riguarda un mese già
+        chiuso (il chiamante deve ricostruire lo stato dal rollup).
+        """
+        if (record.get('tipo') or 'spesa') != 'spesa':
+            return True
+
+        data = pd.Timestamp(record['data'])
+        indice = _indice((data.year, data.month))
+        oggi = oggi or datetime.now()
+
+        with self._lock:
+            self._chiudi_fino(_indice((oggi.year, oggi.month)))
+            if indice < self._primo_aperto:
+                return False
+
+            totali = self._aperti.setdefault(indice, {})
+            importo = float(record['importo'])
+            totali[record['categoria']] = totali.get(record['categoria'], 0.0) + importo
+            totali[TOTALE] = totali.get(TOTALE, 0.0) + importo
+            self.aggiornamenti += 1
+            return True
+
+    def ricostruisci(self, rollup: pd.DataFrame, oggi: Optional[datetime] = None):
+        """Ricalcola lo stato dalle celle del rollup mensile (solo tipo 'spesa')"""
+        oggi = oggi or datetime.now()
+        with self._lock:
+            self._serie = {}
+            self._aperti = {}
+            self._primo_aperto = None
+
+            if not rollup.empty:
+                spese = rollup[rollup['tipo'] == 'spesa']
+                for (anno, mese), celle in spese.groupby(['anno', 'mese']):
+                    totali = dict(zip(celle['categoria'], celle['somma'].astype(float)))
+                    totali[TOTALE] = float(celle['somma'].sum())
+                    self._aperti[_indice((int(anno), int(mese)))] = totali
+
+            self._chiudi_fino(_indice((oggi.year, oggi.month)))
+            self.ricostruzioni += 1
+
+    def previsione(self, mese: Optional[Mese] = None, oggi: Optional[datetime] = None) -> Dict[str, float]:
+        """Totale previsto per categoria (e '__totale__') nel mese indicato (default: il prossimo)"""
+        oggi = oggi or datetime.now()
+        corrente = _indice((oggi.year, oggi.month))
+        obiettivo = _indice(mese) if mese else corrente + 1
+
+        with self._lock:
+            self._chiudi_fino(corrente)
+            previsioni = {}
+            for categoria, serie in self._serie.items():
+                valore = serie.previsione(obiettivo)
+                if valore is not None:
+                    previsioni[categoria] = valore
+            return previsioni
+
+
+# Test rapido: python previsioni_online.py
+if __name__ == "__main__":
+    import random
+    import time
+
+    random.seed(42)
+    previsore = PrevisoreOnline()
+    previsore.ricostruisci(pd.DataFrame(columns=['anno', 'mese', 'tipo', 'categoria', 'somma']),
+                           oggi=datetime(2025, 1, 1))
+
+    # 12 mesi vissuti in tempo reale: trend crescente su Casa, stabile su Alimentari
+    for mese in range(1, 13):
+        for giorno in range(1, 29):
+            categoria = random.choice(['Casa', 'Alimentari'])
+            base = 20 + mese * 2 if categoria == 'Casa' else 15
+            previsore.aggiorna({'data': f"2025-{mese:02d}-{giorno:02d}", 'categoria': categoria,
+                                'importo': random.uniform(0.5, 1.5) * base, 'tipo': 'spesa'},
+                               oggi=datetime(2025, mese, giorno))
+
+    oggi = datetime(2025, 12, 28)
+    print(f"🔮 Previsione gennaio 2026: "
+          f"{ {k: round(v) for k, v in previsore.previsione(oggi=oggi).items()} }")
+
+    n = 100000
+    record = {'data': '2025-12-10', 'categoria': 'Svago', 'importo': 10.0, 'tipo': 'spesa'}
+    inizio = time.perf_counter()
+    for _ in range(n):
+        previsore.aggiorna(record, oggi)
+    print(f"⚡ Aggiornamento medio: {(time.perf_counter() - inizio) / n * 1e6:.2f} µs")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+♻️ Registro di Istanze per Chiave con Limite LRU
+🧹 Le istanze meno usate escono dal registro e liberano memoria e connessioni
+"""
+
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+# Utenti (partizioni) trattenuti in memoria per processo, sovrascrivibile da ambiente
+CAPACITA_DEFAULT = int(os.getenv('PARTIZIONI_MAX', '256'))
+
+V = TypeVar('V')
+
+
+class RegistroLRU(Generic[V]):
+    """
+    Un'istanza per chiave, creata al primo uso, con al massimo `capacita`
+    istanze trattenute dal registro.
+
+    Quando una chiave esce per LRU si chiama `rilascia` sull'istanza, che
+    deve liberarne dataset e connessioni lasciandola utilizzabile (si
+    ricaricano al prossimo accesso). Finché qualcuno tiene ancora un
+    riferimento all'istanza uscita, ottieni() restituisce quella stessa
+    istanza invece di crearne una seconda per la stessa chiave.
+
+    La creazione avviene fuori dal lock del registro, con un lock per
+    chiave: caricare lo storico di un utente nuovo blocca solo chi chiede
+    lo stesso utente.
+    """
+
+    def __init__(self, capacita: Optional[int] = None, rilascia: Optional[Callable[[V], None]] = None):
+        self.capacita = max(1, capacita or CAPACITA_DEFAULT)
+        self.rilascia = rilascia
+        self._voci: "OrderedDict[Hashable, V]" = OrderedDict()
+        self._in_uso: "weakref.WeakValueDictionary[Hashable, V]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._in_creazione: Dict[Hashable, threading.Lock] = {}
+
+        # Contatori
+        self.create = 0
+        self.uscite = 0
+
+    def ottieni(self, chiave: Hashable, crea: Callable[[], V]) -> V:
+        """Istanza per `chiave`; `crea` viene chiamata una sola volta, fuori dal lock del registro"""
+        with self._lock:
+            valore, uscite = self._registra(chiave)
+            if valore is None:
+                lock_chiave = self._in_creazione.setdefault(chiave, threading.Lock())
+
+        if valore is None:
+            with lock_chiave:
+                # Chi attendeva sulla stessa chiave trova l'istanza appena registrata
+                with self._lock:
+                    valore, uscite = self._registra(chiave)
+                if valore is None:
+                    nuovo = crea()
+                    with self._lock:
+                        self.create += 1
+                        self._in_creazione.pop(chiave, None)
+                        valore, uscite = self._registra(chiave, nuovo)
+
+        # Fuori dal lock: rilasciare può prendere i lock delle istanze
+        for uscita in uscite:
+            self.rilascia(uscita)
+        return valore
+
+    def _registra(self, chiave: Hashable, nuovo: Optional[V] = None) -> Tuple[Optional[V], List[V]]:
+        """Porta `chiave` in testa all'LRU (con `nuovo` se non esiste); con self._lock"""
+        valore = self._voci.get(chiave)
+        if valore is not None:
+            self._voci.move_to_end(chiave)
+            return valore, []
+
+        valore = self._in_uso.get(chiave)
+        if valore is None:
+            valore = nuovo
+        if valore is None:
+            return None, []
+        self._voci[chiave] = valore
+        self._in_uso[chiave] = valore
+        return valore, self._libera()
+
+    def _libera(self) -> List[V]:
+        uscite = []
+        while len(self._voci) > self.capacita:
+            _, uscita = self._voci.popitem(last=False)
+            self.uscite += 1
+            if self.rilascia is not None:
+                uscite.append(uscita)
+        return uscite
+
+    def valori(self) -> List[V]:
+        with self._lock:
+            return list(self._voci.values())
+
+    def __len__(self) -> int:
+        return len(self._voci)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+🧮 Rollup Mensile delle Transazioni
+📦 Aggregati (anno, mese, tipo, categoria) → somma/conteggio/min/max
+"""
+
+import pandas as pd
+from typing import Dict, Optional, Tuple
+
+# Colonne esposte da rollup() di ogni backend
+COLONNE_ROLLUP = ['anno', 'mese', 'tipo', 'categoria', 'somma', 'conteggio', 'minimo', 'massimo']
+
+
+class RollupMensile:
+    """
+    Rollup materializzato in memoria (usato dal backend CSV).
+
+    aggiorna() costa O(1) per insert; ricostruisci() rifà tutto da un
+    DataFrame. `versione` indica la versione del dataset da cui deriva.
+    """
+
+    def __init__(self):
+        self.celle: Dict[Tuple[int, int, str, str], list] = {}
+        self.prima_data: Optional[pd.Timestamp] = None
+        self.ultima_data: Optional[pd.Timestamp] = None
+        self.versione: Optional[int] = None
+
+    def aggiorna(self, record: dict):
+        """Incorpora un singolo record"""
+        data = pd.Timestamp(record['data'])
+        importo = float(record['importo'])
+        chiave = (data.year, data.month, record.get('tipo') or 'spesa', record['categoria'])
+
+        cella = self.celle.get(chiave)
+        if cella is None:
+            self.celle[chiave] = [importo, 1, importo, importo]
+        else:
+            cella[0] += importo
+            cella[1] += 1
+            cella[2] = min(cella[2], importo)
+            cella[3] = max(cella[3], importo)
+
+        if self.prima_data is None or data < self.prima_data:
+            self.prima_data = data
+        if self.ultima_data is None or data > self.ultima_data:
+            self.ultima_data = data
+
+    def ricostruisci(self, df: pd.DataFrame, versione: Optional[int] = None):
+        """Ricalcola tutte le celle da un dataset completo"""
+        self.celle = {}
+        self.prima_data = self.ultima_data = None
+        self.versione = versione
+
+        if df.empty:
+            return
+
+        tipo = df['tipo'].fillna('spesa') if 'tipo' in df.columns else 'spesa'
+        gruppi = df.assign(anno=df['data'].dt.year, mese=df['data'].dt.month, tipo=tipo).groupby(
+            ['anno', 'mese', 'tipo', 'categoria']
+        )['importo'].agg(['sum', 'count', 'min', 'max'])
+
+        for (anno, mese, tipo, categoria), riga in gruppi.iterrows():
+            self.celle[(int(anno), int(mese), tipo, categoria)] = [
+                float(riga['sum']), int(riga['count']), float(riga['min']), float(riga['max'])
+            ]
+
+        self.prima_data = df['data'].min()
+        self.ultima_data = df['data'].max()
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Celle del rollup nel formato COLONNE_ROLLUP"""
+        righe = [chiave + tuple(valori) for chiave, valori in self.celle.items()]
+        return pd.DataFrame(righe, columns=COLONNE_ROLLUP)
+
+    def totali_per_categoria(self, anno: int, mese: int, tipo: Optional[str] = None) -> Dict[str, float]:
+        totali: Dict[str, float] = {}
+        for (a, m, t, categoria), (somma, _, _, _) in self.celle.items():
+            if a == anno and m == mese and (tipo is None or t == tipo):
+                totali[categoria] = totali.get(categoria, 0) + somma
+        return totali
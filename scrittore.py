@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+✍️ Scrittore Unico del Ledger
+📦 Coda degli inserimenti con group commit: una scrittura durevole per gruppo
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from typing import Dict, List, Optional, Tuple
+
+from metriche import SCRITTURA_RIGHE, SCRITTURA_SECONDI
+
+logger = logging.getLogger(__name__)
+
+# Configurazione (sovrascrivibile da ambiente)
+FINESTRA_MS_DEFAULT = float(os.getenv('LEDGER_BATCH_MS', '2'))
+MAX_BATCH_DEFAULT = int(os.getenv('LEDGER_BATCH_MAX', '256'))
+
+
+class ScrittoreLedger:
+    """
+    Unico scrittore dei ledger del processo.
+
+    Gli handler accodano i record con salva(); un task sull'event loop li
+    raccoglie per `finestra_ms` dal primo arrivo (al massimo `max_batch`) e
+    scrive ogni partizione con un solo aggiungi_batch: un fsync o una
+    transazione per gruppo invece che per riga. Le scritture avvengono una
+    alla volta in un thread dedicato, e mentre un gruppo è su disco il
+    successivo si riempie. Ogni chiamante riceve la conferma solo quando la
+    sua riga è durevole.
+    """
+
+    def __init__(self, finestra_ms: Optional[float] = None, max_batch: Optional[int] = None):
+        self.finestra = (finestra_ms if finestra_ms is not None else FINESTRA_MS_DEFAULT) / 1000
+        self.max_batch = max_batch or MAX_BATCH_DEFAULT
+
+        self._coda: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ledger-writer')
+
+        # Contatori
+        self.gruppi = 0
+        self.righe = 0
+
+    def _avvia(self):
+        # Coda creata una volta per loop: un task ripartito riprende i record già accodati
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._coda = asyncio.Queue()
+            self._loop = loop
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._ciclo())
+
+    async def salva(self, manager, record: dict) -> bool:
+        """
+        Salva un record nella partizione di `manager` (uno SpeseManager).
+
+        Equivale a manager.aggiungi_transazione, ma passa dalla coda: True
+        quando la riga è durevole e previsioni/statistiche sono aggiornate.
+        """
+        self._avvia()
+        future = asyncio.get_running_loop().create_future()
+        self._coda.put_nowait((manager, record, future))
+        try:
+            await future
+            return True
+        except Exception as e:
+            logger.error(f"❌ Errore salvataggio record: {e}")
+            return False
+
+    async def _ciclo(self):
+        while True:
+            gruppo = [await self._coda.get()]
+            try:
+                if self.finestra > 0:
+                    await asyncio.sleep(self.finestra)
+                while len(gruppo) < self.max_batch and not self._coda.empty():
+                    gruppo.append(self._coda.get_nowait())
+                await self._scrivi_gruppo(gruppo)
+            except asyncio.CancelledError:
+                self._risolvi(gruppo, RuntimeError("scrittore del ledger fermato"))
+                raise
+            except Exception as e:
+                # Il ciclo non deve morire: il gruppo fallisce, i successivi proseguono
+                logger.error(f"❌ Errore nello scrittore del ledger: {e}")
+                self._risolvi(gruppo, e)
+
+    @staticmethod
+    def _risolvi(voci: list, errore: Optional[BaseException] = None):
+        """Risolve le future ancora in attesa (chiamante cancellato: già risolta)"""
+        for _, _, future in voci:
+            if future.done():
+                continue
+            if errore is None:
+                future.set_result(None)
+            else:
+                future.set_exception(errore)
+
+    async def _scrivi_gruppo(self, gruppo: List[Tuple[object, dict, asyncio.Future]]):
+        """Una scrittura per partizione; ogni future si risolve con l'esito della sua"""
+        partizioni: Dict[int, Tuple[object, list]] = {}
+        for manager, record, future in gruppo:
+            partizioni.setdefault(id(manager.storage), (manager.storage, []))[1].append((manager, record, future))
+
+        loop = asyncio.get_running_loop()
+        for storage, voci in partizioni.values():
+            inizio = time.perf_counter()
+            try:
+                await loop.run_in_executor(self._thread, self._scrivi, storage, voci)
+                errore = None
+            except Exception as e:
+                errore = e
+            self._risolvi(voci, errore)
+            SCRITTURA_SECONDI.osserva(time.perf_counter() - inizio, storage.nome)
+            SCRITTURA_RIGHE.osserva(len(voci), storage.nome)
+
+    def _scrivi(self, storage, voci: list):
+        """Nel thread dello scrittore: group commit e aggiornamenti in memoria"""
+        with ExitStack() as lock:
+            # Come SpeseManager._salva_record: scrittura e aggiornamenti sotto il lock dei modelli
+            for manager in {id(manager): manager for manager, _, _ in voci}.values():
+                lock.enter_context(manager.lock_modelli)
+
+            storage.aggiungi_batch([record for _, record, _ in voci])
+            self.gruppi += 1
+            self.righe += len(voci)
+            for manager, record, _ in voci:
+                try:
+                    manager.registra_salvataggio(record)
+                except Exception as e:
+                    # La riga è già durevole: previsioni/statistiche si riallineano alla ricostruzione
+                    logger.warning(f"⚠️ Aggiornamento dopo il salvataggio fallito: {e}")
+
+    def chiudi(self):
+        """Attende la scrittura in corso e ferma il thread dello scrittore"""
+        self._thread.shutdown(wait=True)
+
+
+# Burst test: python scrittore.py [inserimenti] [backend]
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    from spese_manager import SpeseManager
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    backend = sys.argv[2] if len(sys.argv) > 2 else 'csv'
+
+    async def burst(salva, manager) -> float:
+        inizio = time.perf_counter()
+        esiti = await asyncio.gather(*[
+            salva(manager, manager.crea_record(f'caffè {i}', 'Ristorazione', 1.5, note='burst'))
+            for i in range(n)
+        ])
+        assert all(esiti)
+        return time.perf_counter() - inizio
+
+    with tempfile.TemporaryDirectory() as cartella:
+        os.chdir(cartella)
+        logging.disable(logging.INFO)
+
+        # Prima: una scrittura (fsync o transazione) per insert, dal pool di thread degli handler
+        manager = SpeseManager('spese.csv', 'config.json', 'backup', backend=backend, user_id=1)
+        pool = ThreadPoolExecutor(max_workers=8)
+
+        async def diretto(manager, record):
+            return await asyncio.get_running_loop().run_in_executor(pool, manager._salva_record, record)
+
+        durata = asyncio.run(burst(diretto, manager))
+        print(f"🐢 Insert diretti ({backend}): {n / durata:.0f} insert/s")
+
+        scrittore = ScrittoreLedger()
+        manager = SpeseManager('spese.csv', 'config.json', 'backup', backend=backend, user_id=2)
+        durata = asyncio.run(burst(scrittore.salva, manager))
+        scrittore.chiudi()
+        print(f"⚡ Group commit ({backend}): {n / durata:.0f} insert/s, "
+              f"{scrittore.righe / scrittore.gruppi:.1f} righe per scrittura")
+
+        righe = len(manager.get_dataframe())
+        print(f"✅ Righe nella partizione: {righe}/{n}")
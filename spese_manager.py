@@ -7,12 +7,17 @@
 import pandas as pd
 import json
 import os
+import threading
 from datetime import datetime, timedelta
 import shutil
 from typing import Dict, List, Optional, Tuple
 import logging
 import requests
 
+from storage import apri_storage
+from previsioni_online import PrevisoreOnline
+from anomalie import StatisticheCategorie
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -22,11 +27,28 @@ class SpeseManager:
     def __init__(self, 
                  csv_file: str = "spese.csv",
                  config_file: str = "config.json",
-                 backup_dir: str = "backup"):
+                 backup_dir: str = "backup",
+                 backend: Optional[str] = None,
+                 user_id: Optional[int] = None):
         
         self.csv_file = csv_file
         self.config_file = config_file
         self.backup_dir = backup_dir
+        self.user_id = user_id
+        
+        # Partizione dati dell'utente (csv append-only o sqlite), condivisa nel processo
+        self.storage = apri_storage(csv_file, backend, user_id)
+        
+        # Previsioni online per categoria: costruite dal rollup al primo uso, poi O(1) per insert
+        self._previsore: Optional[PrevisoreOnline] = None
+        
+        # Media/varianza per categoria (Welford) per segnalare anomalie all'inserimento
+        self._statistiche: Optional[StatisticheCategorie] = None
+        
+        # Un lock per creare, aggiornare (anche dal thread dello scrittore) e azzerare i due modelli;
+        # chi scrive lo tiene anche durante la scrittura, così un modello costruito in parallelo
+        # vede la riga nei dati o nell'aggiornamento, mai in entrambi
+        self.lock_modelli = threading.RLock()
         
         # Crea directory backup se non esiste
         os.makedirs(backup_dir, exist_ok=True)
@@ -41,13 +63,7 @@ class SpeseManager:
         self.config = self._load_config()
         
     def _init_files(self):
-        """Inizializza file CSV e config se non esistono"""
-        if not os.path.exists(self.csv_file):
-            # Crea CSV con header
-            df = pd.DataFrame(columns=['data', 'nome_spesa', 'categoria', 'importo', 'note'])
-            df.to_csv(self.csv_file, index=False)
-            logger.info(f"✅ Creato {self.csv_file}")
-        
+        """Inizializza file config se non esiste (il ledger è gestito dallo storage)"""
         if not os.path.exists(self.config_file):
             # Crea config default
             default_config = {
@@ -86,9 +102,11 @@ class SpeseManager:
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             
-            # Backup CSV
-            backup_csv = f"{self.backup_dir}/spese_backup_{timestamp}.csv"
-            shutil.copy2(self.csv_file, backup_csv)
+            # Backup ledger
+            estensione = 'db' if self.storage.nome == 'sqlite' else 'csv'
+            suffisso = f"_{self.user_id}" if self.user_id is not None else ""
+            backup_dati = f"{self.backup_dir}/spese_backup{suffisso}_{timestamp}.{estensione}"
+            self.storage.backup(backup_dati)
             
             # Backup config
             backup_config = f"{self.backup_dir}/config_backup_{timestamp}.json"
@@ -123,25 +141,32 @@ class SpeseManager:
             True se salvata con successo
         """
         try:
-            if data is None:
-                data = datetime.now().strftime("%Y-%m-%d")
-            
-            # Crea nuovo record
-            nuovo_record = {
-                'data': data,
-                'nome_transazione': nome_transazione,
-                'categoria': categoria,
-                'importo': importo,
-                'tipo': tipo,
-                'note': note
-            }
-            
-            return self._salva_record(nuovo_record)
+            return self._salva_record(self.crea_record(nome_transazione, categoria, importo, tipo, note, data))
             
         except Exception as e:
             logger.error(f"Errore aggiunta transazione: {e}")
             return False
-
+    
+    @staticmethod
+    def crea_record(nome_transazione: str, 
+                    categoria: str, 
+                    importo: float, 
+                    tipo: str = 'spesa',
+                    note: str = "",
+                    data: Optional[str] = None) -> dict:
+        """Record del ledger (data di default: oggi), da salvare qui o tramite ScrittoreLedger"""
+        if data is None:
+            data = datetime.now().strftime("%Y-%m-%d")
+        
+        return {
+            'data': data,
+            'nome_transazione': nome_transazione,
+            'categoria': categoria,
+            'importo': importo,
+            'tipo': tipo,
+            'note': note
+        }
+    
     def aggiungi_spesa(self, 
                        nome_spesa: str, 
                        categoria: str, 
@@ -161,57 +186,85 @@ class SpeseManager:
         )
     
     def _salva_record(self, record: dict) -> bool:
-        """Salva un record nel CSV"""
+        """Salva un record tramite il backend di storage"""
         try:
-            # Leggi CSV esistente
-            if os.path.exists(self.csv_file):
-                df = pd.read_csv(self.csv_file)
-            else:
-                # Crea nuovo CSV con header aggiornato
-                df = pd.DataFrame(columns=['data', 'nome_transazione', 'categoria', 'importo', 'tipo', 'note'])
-            
-            # Aggiungi nuovo record
-            df = pd.concat([df, pd.DataFrame([record])], ignore_index=True)
-            
-            # Salva CSV
-            df.to_csv(self.csv_file, index=False)
-            
-            tipo_display = "ricavo" if record['tipo'] == 'ricavo' else "spesa"
-            logger.info(f"💰 {tipo_display.title()} aggiunt{'o' if tipo_display == 'ricavo' else 'a'}: €{record['importo']:.2f} - {record['nome_transazione']}")
+            with self.lock_modelli:
+                self.storage.aggiungi(record)
+                self.registra_salvataggio(record)
             return True
             
         except Exception as e:
             logger.error(f"❌ Errore salvataggio record: {e}")
             return False
     
+    def importa_transazioni(self, df: pd.DataFrame) -> int:
+        """
+        Salva in un solo commit le transazioni di un import massivo
+        
+        Args:
+            df: Righe con le colonne del ledger (data in formato YYYY-MM-DD)
+        
+        Returns:
+            Numero di transazioni salvate
+        """
+        with self.lock_modelli:
+            self.storage.aggiungi_dataframe(df)
+            
+            # Troppe righe per gli aggiornamenti O(1): previsioni e statistiche ripartono dai dati
+            self._previsore = None
+            self._statistiche = None
+        
+        logger.info(f"📥 Importate {len(df)} transazioni")
+        return len(df)
+    
+    def registra_salvataggio(self, record: dict):
+        """Aggiorna previsioni e statistiche dopo che il record è stato scritto"""
+        with self.lock_modelli:
+            if self._previsore is not None and not self._previsore.aggiorna(record):
+                # Inserimento in un mese già chiuso: si riparte dagli aggregati
+                self._previsore.ricostruisci(self.storage.rollup_mensile())
+            
+            if self._statistiche is not None:
+                self._statistiche.aggiorna(record)
+        
+        tipo_display = "ricavo" if record['tipo'] == 'ricavo' else "spesa"
+        logger.info(f"💰 {tipo_display.title()} aggiunt{'o' if tipo_display == 'ricavo' else 'a'}: €{record['importo']:.2f} - {record['nome_transazione']}")
+    
+    def compatta(self) -> bool:
+        """Compatta il ledger (snapshot CSV o checkpoint WAL)"""
+        return self.storage.compatta()
+    
+    def get_dataframe(self) -> pd.DataFrame:
+        """Restituisce tutte le transazioni dalla cache condivisa"""
+        return self.storage.get_dataframe()
+    
     def get_spese_mese(self, anno: int = None, mese: int = None) -> pd.DataFrame:
         """Ottiene spese di un mese specifico"""
         try:
-            df = pd.read_csv(self.csv_file)
-            df['data'] = pd.to_datetime(df['data'])
-            
             if anno is None:
                 anno = datetime.now().year
             if mese is None:
                 mese = datetime.now().month
             
-            # Filtra per mese/anno
-            mask = (df['data'].dt.year == anno) & (df['data'].dt.month == mese)
-            return df[mask]
+            return self.storage.transazioni_mese(anno, mese)
             
         except Exception as e:
             logger.error(f"❌ Errore lettura spese: {e}")
             return pd.DataFrame()
     
-    def get_totale_per_categoria(self, anno: int = None, mese: int = None) -> Dict[str, float]:
-        """Ottiene totale spese per categoria in un mese"""
-        df = self.get_spese_mese(anno, mese)
-        
-        if df.empty:
+    def get_totale_per_categoria(self, anno: int = None, mese: int = None, tipo: Optional[str] = None) -> Dict[str, float]:
+        """Ottiene totale transazioni per categoria in un mese (opzionalmente di un solo tipo)"""
+        try:
+            if anno is None:
+                anno = datetime.now().year
+            if mese is None:
+                mese = datetime.now().month
+            
+            return self.storage.totali_per_categoria(anno, mese, tipo)
+            
+        except Exception as e:
+            logger.error(f"❌ Errore totali categoria: {e}")
             return {}
-        
-        totali = df.groupby('categoria')['importo'].sum().to_dict()
-        return totali
     
     def verifica_budget(self, anno: int = None, mese: int = None) -> Dict:
         """
@@ -220,7 +273,7 @@ class SpeseManager:
         Returns:
             Dict con budget, spese, differenze e alert
         """
-        totali_categoria = self.get_totale_per_categoria(anno, mese)
+        totali_categoria = self.get_totale_per_categoria(anno, mese, tipo='spesa')
         budget_mensile = self.config.get('budget_mensile', {})
         
         risultato = {
@@ -254,40 +307,123 @@ class SpeseManager:
         
         return risultato
     
+    def get_bilancio_mese(self, anno: int = None, mese: int = None) -> Dict:
+        """
+        Entrate vs uscite di un mese, calcolate dal rollup mensile
+        
+        Returns:
+            Dict con entrate, uscite, bilancio e numero transazioni
+        """
+        if anno is None:
+            anno = datetime.now().year
+        if mese is None:
+            mese = datetime.now().month
+        
+        rollup = self.storage.rollup_mensile()
+        celle = rollup[(rollup['anno'] == anno) & (rollup['mese'] == mese)]
+        
+        entrate = celle.loc[celle['tipo'] == 'ricavo', 'somma'].sum()
+        uscite = celle.loc[celle['tipo'] == 'spesa', 'somma'].sum()
+        
+        return {
+            'mese': f"{anno}-{mese:02d}",
+            'entrate': float(entrate),
+            'uscite': float(uscite),
+            'bilancio': float(entrate - uscite),
+            'transazioni': int(celle['conteggio'].sum())
+        }
+    
     def get_statistiche_generali(self) -> Dict:
-        """Ottiene statistiche generali sui dati"""
+        """Ottiene statistiche generali dal rollup mensile (indipendente dal numero di transazioni)"""
         try:
-            df = pd.read_csv(self.csv_file)
-            df['data'] = pd.to_datetime(df['data'])
+            rollup = self.storage.rollup_mensile()
+            spese = rollup[rollup['tipo'] == 'spesa']
+            da, a = self.storage.periodo()
+            
+            conteggio_spese = spese['conteggio'].sum()
             
             # Statistiche base
             stats = {
-                'totale_records': len(df),
+                'totale_records': int(rollup['conteggio'].sum()),
                 'periodo': {
-                    'da': df['data'].min().strftime("%Y-%m-%d") if not df.empty else None,
-                    'a': df['data'].max().strftime("%Y-%m-%d") if not df.empty else None
+                    'da': da.strftime("%Y-%m-%d") if da is not None else None,
+                    'a': a.strftime("%Y-%m-%d") if a is not None else None
                 },
-                'spesa_totale': df['importo'].sum(),
-                'spesa_media': df['importo'].mean(),
+                'spesa_totale': float(spese['somma'].sum()),
+                'spesa_media': float(spese['somma'].sum() / conteggio_spese) if conteggio_spese else 0.0,
                 'categoria_piu_costosa': None,
                 'mese_piu_costoso': None
             }
             
-            if not df.empty:
+            if not spese.empty:
                 # Categoria più costosa
-                cat_totali = df.groupby('categoria')['importo'].sum()
+                cat_totali = spese.groupby('categoria')['somma'].sum()
                 stats['categoria_piu_costosa'] = cat_totali.idxmax()
                 
                 # Mese più costoso
-                df['anno_mese'] = df['data'].dt.to_period('M')
-                mese_totali = df.groupby('anno_mese')['importo'].sum()
-                stats['mese_piu_costoso'] = str(mese_totali.idxmax())
+                mese_totali = spese.groupby(['anno', 'mese'])['somma'].sum()
+                anno_max, mese_max = mese_totali.idxmax()
+                stats['mese_piu_costoso'] = f"{anno_max}-{mese_max:02d}"
             
             return stats
             
         except Exception as e:
             logger.error(f"❌ Errore statistiche: {e}")
             return {}
+    
+    def ricostruisci_rollup(self):
+        """Ricalcola da zero gli aggregati mensili (es. dopo modifiche manuali ai dati)"""
+        with self.lock_modelli:
+            self.storage.ricostruisci_rollup()
+            self._previsore = None
+            self._statistiche = None
+
+    def previsione_online(self, anno: int = None, mese: int = None) -> Dict[str, float]:
+        """
+        Spesa prevista per categoria (Holt, aggiornato a ogni transazione)
+
+        Returns:
+            Dict categoria → importo previsto, più la chiave TOTALE; vuoto senza storico
+        """
+        try:
+            with self.lock_modelli:
+                if self._previsore is None:
+                    previsore = PrevisoreOnline()
+                    previsore.ricostruisci(self.storage.rollup_mensile())
+                    self._previsore = previsore
+                previsore = self._previsore
+
+            obiettivo = (anno, mese) if anno is not None and mese is not None else None
+            return previsore.previsione(obiettivo)
+
+        except Exception as e:
+            logger.error(f"❌ Errore previsione online: {e}")
+            return {}
+
+    def valuta_anomalia(self, categoria: str, importo: float) -> Optional[Dict]:
+        """
+        Confronta un importo con lo storico della sua categoria
+        
+        Va chiamata prima di salvare la transazione: le statistiche includono
+        ogni riga salvata, e un importo già incorporato sposta media e
+        deviazione verso di sé (con pochi campioni non risulterebbe mai anomalo).
+        
+        Returns:
+            Dict con media e deviazioni se l'importo è anomalo, altrimenti None
+        """
+        try:
+            with self.lock_modelli:
+                if self._statistiche is None:
+                    statistiche = StatisticheCategorie()
+                    statistiche.ricostruisci(self.get_dataframe())
+                    self._statistiche = statistiche
+                statistiche = self._statistiche
+            
+            return statistiche.valuta(categoria, importo)
+        
+        except Exception as e:
+            logger.error(f"❌ Errore valutazione anomalia: {e}")
+            return None
 
     def check_openai_credit(self) -> Dict:
         """
@@ -436,4 +572,16 @@ if __name__ == "__main__":
         print(f"💰 Spese questo mese: €{budget_info['totale_spese']:.2f}")
     
     else:
-        print("❌ Errore nell'aggiunta della spesa")
\ No newline at end of file
+        print("❌ Errore nell'aggiunta della spesa")
+    
+    # Anomalia con pochi campioni: il verdetto si calcola prima di salvare la riga
+    import tempfile
+    with tempfile.TemporaryDirectory() as cartella:
+        prova = SpeseManager(os.path.join(cartella, 'spese.csv'), os.path.join(cartella, 'config.json'),
+                             os.path.join(cartella, 'backup'), user_id=1)
+        for _ in range(4):
+            prova.aggiungi_spesa("Caffè", "Ristorazione", 2.0)
+        anomalia = prova.valuta_anomalia("Ristorazione", 500.0)
+        assert anomalia is not None and anomalia['rapporto'] == 250.0, anomalia
+        prova.aggiungi_spesa("Cena di gala", "Ristorazione", 500.0)
+        print(f"✅ Anomalia su 4 campioni rilevata prima del salvataggio: rapporto {anomalia['rapporto']:.0f}x")
\ No newline at end of file
@@ -0,0 +1,756 @@
+#!/usr/bin/env python3
+"""
+💾 Backend di Storage per il Ledger Transazioni
+🔌 CSV append-only (default) oppure SQLite in WAL con indici
+👤 Dati partizionati per utente Telegram
+"""
+
+import pandas as pd
+import csv
+import io
+import os
+import sqlite3
+import threading
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from dataset_cache import COLONNE, DatasetCacheSQLite, get_cache
+from registro_lru import RegistroLRU
+from rollup import COLONNE_ROLLUP, RollupMensile
+
+logger = logging.getLogger(__name__)
+
+# Configurazione backend (sovrascrivibile da ambiente)
+BACKEND_DEFAULT = os.getenv('STORAGE_BACKEND', 'csv')
+SQLITE_DB_DEFAULT = os.getenv('SQLITE_DB', 'spese.db')
+# Utente Telegram a cui assegnare lo storico precedente al partizionamento (vuoto = nessuno)
+LEGACY_USER_ID_DEFAULT = int(os.getenv('LEGACY_USER_ID') or 0) or None
+
+
+def _intervallo_mese(anno: int, mese: int) -> Tuple[str, str]:
+    """Estremi [inizio, fine) di un mese in formato ISO, per filtri su indice"""
+    inizio = f"{anno:04d}-{mese:02d}-01"
+    fine = f"{anno + 1:04d}-01-01" if mese == 12 else f"{anno:04d}-{mese + 1:02d}-01"
+    return inizio, fine
+
+
+def _sincronizza_cartella(percorso: str):
+    """Rende durevoli le rename nella cartella che contiene `percorso`"""
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(percorso)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class StorageCSV:
+    """
+    Ledger su file CSV in modalità append-only.
+
+    Ogni insert accoda una sola riga (O_APPEND + fsync); compatta() riscrive
+    periodicamente uno snapshot pulito in modo atomico.
+    """
+
+    nome = 'csv'
+
+    def __init__(self, csv_file: str = "spese.csv", compatta_ogni: int = 5000):
+        self.csv_file = csv_file
+
+        cartella = os.path.dirname(csv_file)
+        if cartella:
+            os.makedirs(cartella, exist_ok=True)
+
+        # Log append-only: compattazione ogni N inserimenti (0 = solo manuale)
+        self.compatta_ogni = compatta_ogni
+        self._append_dal_compattamento = 0
+        self._write_lock = threading.Lock()
+
+        # Dataset in memoria condiviso con analytics e AI
+        self.cache = get_cache(csv_file)
+
+        # Aggregati mensili per /budget, /bilancio, /stats
+        self.rollup = RollupMensile()
+        self._rollup_lock = threading.RLock()
+
+        self._init_file()
+
+    def _init_file(self):
+        if not os.path.exists(self.csv_file):
+            # Crea CSV con header
+            df = pd.DataFrame(columns=COLONNE)
+            df.to_csv(self.csv_file, index=False)
+            logger.info(f"✅ Creato {self.csv_file}")
+        else:
+            # Recupera eventuale scrittura interrotta e migra header legacy
+            self._ripara_coda()
+            if self._leggi_header() != COLONNE:
+                self.compatta()
+
+    def aggiungi(self, record: dict):
+        """
+        Accoda un record al CSV
+
+        Scrive una sola riga con O_APPEND + fsync: il costo non dipende dalla
+        dimensione dello storico e un crash può al massimo lasciare una riga
+        troncata in coda, rimossa da _ripara_coda all'avvio.
+        """
+        self.aggiungi_batch([record])
+
+    def aggiungi_batch(self, records: List[dict]):
+        """
+        Accoda più record con una sola scrittura e un solo fsync (group commit)
+
+        Al ritorno tutte le righe sono durevoli; un crash a metà lascia al più
+        l'ultima riga troncata, come per il singolo insert.
+        """
+        if not records:
+            return
+        blocco = b''.join(self._serializza_riga(record) for record in records)
+
+        with self._write_lock:
+            self._accoda(blocco, len(records))
+            versioni = self.cache.registra_append(records, len(blocco))
+
+            # Aggiornamento O(1) per record del rollup se era allineato alla versione precedente
+            with self._rollup_lock:
+                if versioni is not None and self.rollup.versione == versioni[0]:
+                    for record in records:
+                        self.rollup.aggiorna(record)
+                    self.rollup.versione = versioni[1]
+
+        if self.compatta_ogni and self._append_dal_compattamento >= self.compatta_ogni:
+            self.compatta()
+
+    def aggiungi_dataframe(self, df: pd.DataFrame):
+        """
+        Import massivo: tutte le righe (colonne COLONNE) in un solo append + fsync
+
+        La cache legge la coda appena scritta alla prossima lettura e il
+        rollup si ricostruisce, invece di aggiornarli riga per riga.
+        """
+        if df.empty:
+            return
+        blocco = df[COLONNE].to_csv(index=False, header=False, lineterminator='\n').encode('utf-8')
+
+        with self._write_lock:
+            self._accoda(blocco, len(df))
+
+        if self.compatta_ogni and self._append_dal_compattamento >= self.compatta_ogni:
+            self.compatta()
+
+    def sostituisci_con_aggiunta(self, df: pd.DataFrame):
+        """
+        Come aggiungi_dataframe, ma le righe compaiono tutte o nessuna
+
+        File attuale e nuove righe vanno su un temporaneo che sostituisce il
+        CSV con un solo os.replace: un crash lascia il file com'era prima o
+        con tutte le righe, mai con una parte.
+        """
+        blocco = df[COLONNE].to_csv(index=False, header=False, lineterminator='\n').encode('utf-8')
+
+        with self._write_lock:
+            tmp_file = f"{self.csv_file}.tmp"
+            with open(self.csv_file, 'rb') as origine, open(tmp_file, 'wb') as f:
+                f.write(origine.read())
+                f.write(blocco)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.csv_file)
+            self.cache.invalida()
+            _sincronizza_cartella(self.csv_file)
+            self._append_dal_compattamento += len(df)
+
+    def _accoda(self, blocco: bytes, righe: int):
+        """Scrive il blocco in coda al file e lo rende durevole (con _write_lock)"""
+        fd = os.open(self.csv_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            scritti = 0
+            while scritti < len(blocco):
+                scritti += os.write(fd, blocco[scritti:])
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._append_dal_compattamento += righe
+
+    @staticmethod
+    def _serializza_riga(record: dict) -> bytes:
+        """Serializza un record come riga CSV (con newline finale)"""
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerow([record.get(col, '') for col in COLONNE])
+        return buffer.getvalue().encode('utf-8')
+
+    def _leggi_header(self) -> List[str]:
+        """Legge la riga di header del CSV"""
+        with open(self.csv_file, 'r', newline='', encoding='utf-8') as f:
+            return next(csv.reader(f), [])
+
+    def _ripara_coda(self):
+        """Tronca un'eventuale ultima riga incompleta lasciata da un crash"""
+        with open(self.csv_file, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            dimensione = f.tell()
+            if dimensione == 0:
+                return
+
+            f.seek(dimensione - 1)
+            if f.read(1) == b'\n':
+                return
+
+            # Cerca all'indietro l'ultimo newline completo
+            blocco = 4096
+            fine = dimensione
+            while fine > 0:
+                inizio = max(0, fine - blocco)
+                f.seek(inizio)
+                pos = f.read(fine - inizio).rfind(b'\n')
+                if pos >= 0:
+                    f.truncate(inizio + pos + 1)
+                    break
+                fine = inizio
+            else:
+                # Solo header senza newline finale: lo terminiamo
+                f.seek(0, os.SEEK_END)
+                f.write(b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+                return
+
+            f.flush()
+            os.fsync(f.fileno())
+            logger.warning(f"🩹 Rimossa riga incompleta in coda a {self.csv_file}")
+
+    def compatta(self) -> bool:
+        """
+        Compatta il log in uno snapshot pulito
+
+        Riordina per data le righe accodate, migra header legacy
+        (nome_spesa, tipo mancante) e sostituisce il file in modo atomico
+        (scrittura su file temporaneo + fsync + os.replace). I campi si
+        leggono e riscrivono come testo ('007', 'NA' restano tali); prima
+        della sostituzione le righe del nuovo file vengono confrontate con
+        quelle grezze dell'originale.
+        """
+        try:
+            with self._write_lock:
+                df = pd.read_csv(self.csv_file, dtype=str, keep_default_na=False)
+
+                if 'nome_spesa' in df.columns and 'nome_transazione' not in df.columns:
+                    df = df.rename(columns={'nome_spesa': 'nome_transazione'})
+                if 'tipo' not in df.columns:
+                    df['tipo'] = 'spesa'
+                for col in COLONNE:
+                    if col not in df.columns:
+                        df[col] = ''
+
+                df = df[COLONNE]
+                # Date illeggibili (NaT) in fondo, nell'ordine originale: nessuna riga si perde
+                ordine = pd.to_datetime(df['data'], errors='coerce', format='ISO8601')
+                df = (df.assign(_ordine=ordine)
+                      .sort_values('_ordine', kind='stable', na_position='last')
+                      .drop(columns='_ordine'))
+
+                tmp_file = f"{self.csv_file}.tmp"
+                with open(tmp_file, 'w', newline='', encoding='utf-8') as f:
+                    df.to_csv(f, index=False, lineterminator='\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                if self._righe_grezze(tmp_file) != self._righe_grezze(self.csv_file):
+                    os.remove(tmp_file)
+                    raise RuntimeError("la riscrittura altererebbe le righe, file lasciato invariato")
+                os.replace(tmp_file, self.csv_file)
+                self.cache.invalida()
+                _sincronizza_cartella(self.csv_file)
+
+                self._append_dal_compattamento = 0
+
+            logger.info(f"🗜️ Compattato {self.csv_file}: {len(df)} records")
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Errore compattazione: {e}")
+            return False
+
+    @staticmethod
+    def _righe_grezze(percorso: str) -> Counter:
+        """Righe del CSV come testo dei campi COLONNE (header legacy migrato), con molteplicità"""
+        with open(percorso, 'r', newline='', encoding='utf-8') as f:
+            righe = Counter()
+            for riga in csv.DictReader(f, restval=''):
+                if 'nome_transazione' not in riga:
+                    riga['nome_transazione'] = riga.get('nome_spesa', '')
+                riga.setdefault('tipo', 'spesa')
+                righe[tuple(riga.get(col) or '' for col in COLONNE)] += 1
+            return righe
+
+    def get_dataframe(self) -> pd.DataFrame:
+        return self.cache.get_dataframe()
+
+    def transazioni_mese(self, anno: int, mese: int) -> pd.DataFrame:
+        df = self.get_dataframe()
+        mask = (df['data'].dt.year == anno) & (df['data'].dt.month == mese)
+        return df[mask]
+
+    def _rollup_aggiornato(self) -> RollupMensile:
+        """Rollup allineato al dataset corrente (ricostruito solo se i dati sono cambiati altrove)"""
+        with self._rollup_lock:
+            versione, df = self.cache.snapshot()
+            if self.rollup.versione != versione:
+                self.rollup.ricostruisci(df, versione)
+            return self.rollup
+
+    def ricostruisci_rollup(self):
+        with self._rollup_lock:
+            versione, df = self.cache.snapshot()
+            self.rollup.ricostruisci(df, versione)
+
+    def rilascia(self):
+        """Libera dataset e rollup in memoria (si ricostruiscono al prossimo accesso)"""
+        self.cache.invalida()
+        with self._rollup_lock:
+            self.rollup = RollupMensile()
+
+    def totali_per_categoria(self, anno: int, mese: int, tipo: Optional[str] = None) -> Dict[str, float]:
+        return self._rollup_aggiornato().totali_per_categoria(anno, mese, tipo)
+
+    def rollup_mensile(self) -> pd.DataFrame:
+        return self._rollup_aggiornato().to_dataframe()
+
+    def periodo(self) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        rollup = self._rollup_aggiornato()
+        return rollup.prima_data, rollup.ultima_data
+
+    def backup(self, destinazione: str):
+        """Copia coerente del ledger in destinazione"""
+        with self._write_lock:
+            with open(self.csv_file, 'rb') as src, open(destinazione, 'wb') as dst:
+                dst.write(src.read())
+
+
+class DatabaseSQLite:
+    """
+    File SQLite condiviso da tutte le partizioni utente.
+
+    Gestisce schema, WAL, connessioni per-thread e lock di scrittura;
+    le query con scope utente stanno in StorageSQLite.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS transazioni (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL,
+            nome_transazione TEXT NOT NULL,
+            categoria TEXT NOT NULL,
+            importo REAL NOT NULL,
+            tipo TEXT NOT NULL DEFAULT 'spesa',
+            note TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS idx_transazioni_user_data
+            ON transazioni (user_id, data);
+        CREATE INDEX IF NOT EXISTS idx_transazioni_user_categoria
+            ON transazioni (user_id, categoria);
+        CREATE TABLE IF NOT EXISTS meta (
+            chiave TEXT PRIMARY KEY,
+            valore TEXT
+        );
+        CREATE TABLE IF NOT EXISTS rollup_mensile (
+            user_id INTEGER NOT NULL,
+            anno INTEGER NOT NULL,
+            mese INTEGER NOT NULL,
+            tipo TEXT NOT NULL,
+            categoria TEXT NOT NULL,
+            somma REAL NOT NULL,
+            conteggio INTEGER NOT NULL,
+            minimo REAL NOT NULL,
+            massimo REAL NOT NULL,
+            PRIMARY KEY (user_id, anno, mese, tipo, categoria)
+        );
+    """
+
+    UPSERT_ROLLUP = """
+        INSERT INTO rollup_mensile (user_id, anno, mese, tipo, categoria, somma, conteggio, minimo, massimo)
+        VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)
+        ON CONFLICT (user_id, anno, mese, tipo, categoria) DO UPDATE SET
+            somma = somma + excluded.somma,
+            conteggio = conteggio + 1,
+            minimo = MIN(minimo, excluded.minimo),
+            massimo = MAX(massimo, excluded.massimo)
+    """
+
+    def __init__(self, db_file: str = "spese.db"):
+        self.db_file = db_file
+        self._locale = threading.local()
+        self.write_lock = threading.Lock()
+
+        # Connessioni per thread: quelle dei thread terminati si chiudono alla prossima apertura
+        self._connessioni: Dict[int, sqlite3.Connection] = {}
+        self._connessioni_lock = threading.Lock()
+
+        conn = self.conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        conn.commit()
+
+        # Database creato prima del rollup: lo materializza una volta
+        if not conn.execute("SELECT 1 FROM meta WHERE chiave = 'rollup_mensile'").fetchone():
+            with self.write_lock, conn:
+                self._ricostruisci_rollup(conn)
+                conn.execute("INSERT INTO meta (chiave, valore) VALUES ('rollup_mensile', ?)",
+                             (datetime.now().isoformat(),))
+
+    def conn(self) -> sqlite3.Connection:
+        """Connessione per-thread (sqlite3 non condivide connessioni tra thread)"""
+        conn = getattr(self._locale, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            # FULL: in WAL ogni commit fa fsync del log prima di tornare, così chi riceve
+            # l'ack (ScrittoreLedger) ha una riga durevole anche dopo un calo di corrente
+            conn.execute("PRAGMA synchronous=FULL")
+            self._locale.conn = conn
+            with self._connessioni_lock:
+                vivi = {thread.ident for thread in threading.enumerate()}
+                for ident in [i for i in self._connessioni if i not in vivi]:
+                    self._connessioni.pop(ident).close()
+                vecchia = self._connessioni.get(threading.get_ident())
+                if vecchia is not None:  # ident riusato da un nuovo thread
+                    vecchia.close()
+                self._connessioni[threading.get_ident()] = conn
+        return conn
+
+    @staticmethod
+    def _ricostruisci_rollup(conn: sqlite3.Connection, user_id: Optional[int] = None):
+        """Ricalcola il rollup (di un utente o di tutti) dentro la transazione corrente"""
+        filtro, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+        conn.execute(f"DELETE FROM rollup_mensile {filtro}", params)
+        conn.execute(f"""
+            INSERT INTO rollup_mensile (user_id, anno, mese, tipo, categoria, somma, conteggio, minimo, massimo)
+            SELECT user_id, CAST(substr(data, 1, 4) AS INTEGER), CAST(substr(data, 6, 2) AS INTEGER),
+                   tipo, categoria, SUM(importo), COUNT(*), MIN(importo), MAX(importo)
+            FROM transazioni {filtro}
+            GROUP BY 1, 2, 3, 4, 5
+        """, params)
+
+    def ricostruisci_rollup(self, user_id: Optional[int] = None):
+        with self.write_lock, self.conn() as conn:
+            self._ricostruisci_rollup(conn, user_id)
+
+    def compatta(self) -> bool:
+        """Checkpoint del WAL nel database principale"""
+        try:
+            self.conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Errore checkpoint SQLite: {e}")
+            return False
+
+    def backup(self, destinazione: str):
+        """Backup online tramite l'API di backup di SQLite"""
+        dst = sqlite3.connect(destinazione)
+        try:
+            self.conn().backup(dst)
+        finally:
+            dst.close()
+
+    def importa_csv(self, csv_file: str, user_id: int = 0, chunksize: int = 50000) -> int:
+        """
+        Migrazione one-shot da un ledger CSV
+
+        Eseguita una sola volta per file (flag in tabella meta), a blocchi
+        e in un'unica transazione. Le righe vengono assegnate a user_id.
+
+        Returns:
+            Numero di righe importate (0 se già migrato)
+        """
+        conn = self.conn()
+        chiave = f"migrazione_csv:{os.path.abspath(csv_file)}"
+        if conn.execute("SELECT 1 FROM meta WHERE chiave = ?", (chiave,)).fetchone():
+            return 0
+        if not os.path.exists(csv_file):
+            return 0
+
+        importate = 0
+        with self.write_lock, conn:
+            for chunk in leggi_csv_legacy(csv_file, chunksize):
+                chunk['user_id'] = user_id
+                righe = chunk[['user_id'] + COLONNE].itertuples(index=False, name=None)
+                conn.executemany(
+                    "INSERT INTO transazioni (user_id, data, nome_transazione, categoria, importo, tipo, note) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", righe
+                )
+                importate += len(chunk)
+
+            self._ricostruisci_rollup(conn, user_id)
+            conn.execute(
+                "INSERT INTO meta (chiave, valore) VALUES (?, ?)",
+                (chiave, datetime.now().isoformat())
+            )
+
+        logger.info(f"📦 Migrati {importate} records da {csv_file} a {self.db_file}")
+        return importate
+
+    def assegna_legacy(self, user_id: int) -> int:
+        """
+        Sposta le righe legacy (user_id 0) sull'utente indicato, una sola volta
+
+        Returns:
+            Numero di righe assegnate (0 se già fatto)
+        """
+        conn = self.conn()
+        with self.write_lock, conn:
+            if conn.execute("SELECT 1 FROM meta WHERE chiave = 'legacy_assegnato'").fetchone():
+                return 0
+            assegnate = conn.execute(
+                "UPDATE transazioni SET user_id = ? WHERE user_id = 0", (user_id,)
+            ).rowcount
+            self._ricostruisci_rollup(conn, 0)
+            self._ricostruisci_rollup(conn, user_id)
+            conn.execute("INSERT INTO meta (chiave, valore) VALUES ('legacy_assegnato', ?)", (str(user_id),))
+        return assegnate
+
+
+class StorageSQLite:
+    """
+    Partizione di un utente nel ledger SQLite (WAL mode).
+
+    Filtri per mese e totali per categoria sono aggregati SQL sugli indici
+    (user_id, data) e (user_id, categoria): ogni query tocca solo le righe
+    dell'utente e non serve caricarle tutte in pandas per rispondere a /budget.
+    """
+
+    nome = 'sqlite'
+
+    def __init__(self, db: DatabaseSQLite, user_id: Optional[int] = None):
+        self.db = db
+        self.db_file = db.db_file
+        self.user_id = int(user_id) if user_id is not None else 0
+
+        # Dataset in memoria per analytics e AI (sincronizzato per rowid)
+        self.cache = DatasetCacheSQLite(db.db_file, self.user_id)
+
+    def aggiungi(self, record: dict):
+        """Inserisce un record e aggiorna il rollup nella stessa transazione"""
+        self.aggiungi_batch([record])
+
+    def aggiungi_batch(self, records: List[dict]):
+        """Inserisce più record e i relativi aggiornamenti del rollup in una sola transazione"""
+        righe, rollup = [], []
+        for record in records:
+            importo = float(record['importo'])
+            tipo = record.get('tipo') or 'spesa'
+            anno, mese = int(record['data'][:4]), int(record['data'][5:7])
+            righe.append((self.user_id, record['data'], record['nome_transazione'], record['categoria'],
+                          importo, tipo, record.get('note') or ''))
+            rollup.append((self.user_id, anno, mese, tipo, record['categoria'], importo, importo, importo))
+
+        with self.db.write_lock:
+            conn = self.db.conn()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO transazioni (user_id, data, nome_transazione, categoria, importo, tipo, note) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", righe
+                )
+                conn.executemany(DatabaseSQLite.UPSERT_ROLLUP, rollup)
+
+    def aggiungi_dataframe(self, df: pd.DataFrame):
+        """Import massivo in una sola transazione, con ricostruzione del rollup dell'utente"""
+        if df.empty:
+            return
+        righe = df[COLONNE].assign(user_id=self.user_id)[['user_id'] + COLONNE]
+
+        with self.db.write_lock:
+            conn = self.db.conn()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO transazioni (user_id, data, nome_transazione, categoria, importo, tipo, note) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", righe.itertuples(index=False, name=None)
+                )
+                DatabaseSQLite._ricostruisci_rollup(conn, self.user_id)
+
+    def compatta(self) -> bool:
+        return self.db.compatta()
+
+    def get_dataframe(self) -> pd.DataFrame:
+        return self.cache.get_dataframe()
+
+    def transazioni_mese(self, anno: int, mese: int) -> pd.DataFrame:
+        inizio, fine = _intervallo_mese(anno, mese)
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(COLONNE)} FROM transazioni "
+            "WHERE user_id = ? AND data >= ? AND data < ? ORDER BY data",
+            self.db.conn(), params=(self.user_id, inizio, fine)
+        )
+        df['data'] = pd.to_datetime(df['data'])
+        return df
+
+    def totali_per_categoria(self, anno: int, mese: int, tipo: Optional[str] = None) -> Dict[str, float]:
+        query = ("SELECT categoria, SUM(somma) FROM rollup_mensile "
+                 "WHERE user_id = ? AND anno = ? AND mese = ?")
+        params = [self.user_id, anno, mese]
+        if tipo is not None:
+            query += " AND tipo = ?"
+            params.append(tipo)
+        query += " GROUP BY categoria"
+        return {categoria: totale for categoria, totale in self.db.conn().execute(query, params)}
+
+    def rollup_mensile(self) -> pd.DataFrame:
+        return pd.read_sql_query(
+            f"SELECT {', '.join(COLONNE_ROLLUP)} FROM rollup_mensile WHERE user_id = ?",
+            self.db.conn(), params=(self.user_id,)
+        )
+
+    def periodo(self) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        # MIN/MAX sull'indice (user_id, data): O(log n)
+        da, a = self.db.conn().execute(
+            "SELECT MIN(data), MAX(data) FROM transazioni WHERE user_id = ?", (self.user_id,)
+        ).fetchone()
+        return (pd.Timestamp(da) if da else None, pd.Timestamp(a) if a else None)
+
+    def ricostruisci_rollup(self):
+        self.db.ricostruisci_rollup(self.user_id)
+
+    def rilascia(self):
+        """Libera dataset e connessione della cache (riaperti al prossimo accesso)"""
+        self.cache.chiudi()
+
+    def backup(self, destinazione: str):
+        self.db.backup(destinazione)
+
+
+def leggi_csv_legacy(csv_file: str, chunksize: int = 50000):
+    """Blocchi di un ledger CSV con le colonne attuali (header legacy migrato, date ISO)"""
+    for chunk in pd.read_csv(csv_file, chunksize=chunksize):
+        if 'nome_spesa' in chunk.columns and 'nome_transazione' not in chunk.columns:
+            chunk = chunk.rename(columns={'nome_spesa': 'nome_transazione'})
+        if 'tipo' not in chunk.columns:
+            chunk['tipo'] = 'spesa'
+        if 'note' not in chunk.columns:
+            chunk['note'] = ''
+        chunk['data'] = pd.to_datetime(chunk['data']).dt.strftime('%Y-%m-%d')
+        chunk['note'] = chunk['note'].fillna('').astype(str)
+        yield chunk
+
+
+def percorso_partizione(csv_file: str, user_id: Optional[int]) -> str:
+    """
+    Percorso del CSV di un utente: spese.csv → spese_utenti/<user_id>.csv
+
+    user_id None indica il ledger globale legacy (il file stesso).
+    """
+    if user_id is None:
+        return csv_file
+    base, estensione = os.path.splitext(csv_file)
+    return os.path.join(f"{base}_utenti", f"{int(user_id)}{estensione or '.csv'}")
+
+
+def assegna_legacy(csv_file: str, storage, user_id: int) -> int:
+    """
+    Assegna lo storico precedente al partizionamento all'utente LEGACY_USER_ID
+
+    Con CSV le righe di `csv_file` vengono accodate alla partizione
+    dell'utente (il file globale resta come copia), con SQLite le righe
+    user_id 0 passano all'utente. Avviene una sola volta: un marker accanto
+    al CSV globale o un flag nella tabella meta (nella stessa transazione).
+
+    Con CSV il marker si scrive prima della partizione e ne registra la
+    dimensione di partenza; la partizione cambia poi con un solo os.replace.
+    Se dopo un crash la partizione ha ancora quella dimensione, la
+    sostituzione non è avvenuta e si ripete; altrimenti è già completa.
+
+    Returns:
+        Numero di righe assegnate (0 se già fatto o se non c'è storico)
+    """
+    if isinstance(storage, StorageSQLite):
+        assegnate = storage.db.assegna_legacy(user_id)
+    else:
+        marker = f"{csv_file}.assegnato"
+        if not os.path.exists(csv_file):
+            return 0
+        dimensione = os.path.getsize(storage.csv_file)
+        if os.path.exists(marker):
+            with open(marker, encoding='utf-8') as f:
+                campi = f.read().split()
+            if len(campi) < 3 or int(campi[2]) != dimensione:
+                return 0
+
+        blocchi = list(leggi_csv_legacy(csv_file))
+        storico = pd.concat(blocchi, ignore_index=True) if blocchi else pd.DataFrame(columns=COLONNE)
+        tmp_marker = f"{marker}.tmp"
+        with open(tmp_marker, 'w', encoding='utf-8') as f:
+            # Senza righe da assegnare non c'è sostituzione da verificare: marker definitivo
+            f.write(f"{user_id} {datetime.now().isoformat()}"
+                    + (f" {dimensione}" if len(storico) else "") + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_marker, marker)
+        _sincronizza_cartella(marker)
+
+        if len(storico):
+            storage.sostituisci_con_aggiunta(storico)
+        assegnate = len(storico)
+
+    if assegnate:
+        logger.info(f"📦 Storico legacy ({assegnate} records) assegnato all'utente {user_id}")
+    return assegnate
+
+
+# Registro process-wide: un backend per partizione (LRU), un database per file
+_storages: RegistroLRU = RegistroLRU(rilascia=lambda storage: storage.rilascia())
+_databases: Dict[str, DatabaseSQLite] = {}
+_storages_lock = threading.Lock()
+
+
+def apri_storage(csv_file: str = "spese.csv",
+                 backend: Optional[str] = None,
+                 user_id: Optional[int] = None,
+                 db_file: Optional[str] = None):
+    """
+    Restituisce il backend condiviso per la partizione di un utente
+
+    Il backend si sceglie con STORAGE_BACKEND=csv|sqlite. Con CSV ogni utente
+    ha il proprio file, con SQLite le righe sono filtrate per user_id sugli
+    indici. Al primo avvio SQLite il CSV globale esistente viene migrato
+    come partizione legacy (user_id 0); con LEGACY_USER_ID lo storico passa
+    a quell'utente alla prima apertura della sua partizione. Restano in
+    memoria al più PARTIZIONI_MAX backend, gli altri liberano dataset e
+    connessioni.
+    """
+    backend = (backend or BACKEND_DEFAULT).lower()
+    if backend not in ('csv', 'sqlite'):
+        raise ValueError(f"Backend storage non supportato: {backend}")
+
+    if backend == 'csv':
+        percorso = os.path.abspath(percorso_partizione(csv_file, user_id))
+    else:
+        percorso = os.path.abspath(db_file or SQLITE_DB_DEFAULT)
+
+    def crea():
+        if backend == 'csv':
+            storage = StorageCSV(percorso_partizione(csv_file, user_id))
+        else:
+            with _storages_lock:
+                db = _databases.get(percorso)
+                if db is None:
+                    db = _databases[percorso] = DatabaseSQLite(percorso)
+                    db.importa_csv(csv_file)
+            storage = StorageSQLite(db, user_id)
+        if user_id is not None and user_id == LEGACY_USER_ID_DEFAULT:
+            assegna_legacy(csv_file, storage, user_id)
+        return storage
+
+    return _storages.ottieni((backend, percorso, user_id), crea)
+
+
+# Migrazione manuale: python storage.py [spese.csv] [spese.db] [user_id]
+if __name__ == "__main__":
+    import sys
+
+    csv_file = sys.argv[1] if len(sys.argv) > 1 else "spese.csv"
+    db_file = sys.argv[2] if len(sys.argv) > 2 else SQLITE_DB_DEFAULT
+    user_id = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    print(f"📦 Migrazione {csv_file} → {db_file} (user {user_id})...")
+    importate = DatabaseSQLite(db_file).importa_csv(csv_file, user_id)
+    print(f"✅ Importati {importate} records" if importate else "ℹ️ Nessun record da importare (già migrato?)")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+🪝 Ricezione degli Update Telegram via Webhook
+🔌 Servita dal server di health (stessa porta), inoltra gli update all'Application
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import os
+import re
+import signal
+from typing import Mapping, Optional
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Configurazione (sovrascrivibile da ambiente)
+MODALITA_DEFAULT = os.getenv('TELEGRAM_MODALITA', 'polling').lower()  # polling | webhook
+WEBHOOK_URL_DEFAULT = os.getenv('WEBHOOK_URL', '')                   # URL pubblico di base
+WEBHOOK_PATH_DEFAULT = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET_DEFAULT = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_MAX_BYTE = 1024 * 1024
+
+INTESTAZIONE_SEGRETO = 'X-Telegram-Bot-Api-Secret-Token'
+SEGRETO_VALIDO = re.compile(r'[A-Za-z0-9_-]{1,256}')  # caratteri ammessi da setWebhook
+
+
+class RicevitoreWebhook:
+    """
+    Riceve i POST di Telegram dal thread del server HTTP e li accoda all'Application.
+
+    ricevi() valida percorso, segreto e JSON, poi consegna l'update alla
+    update_queue sull'event loop del bot e risponde subito: Telegram aspetta
+    una risposta rapida, l'elaborazione avviene come per il polling. Finché
+    l'Application non è collegata (avvio, arresto) risponde 503 e Telegram
+    ritenterà la consegna. Il segreto è obbligatorio: ogni POST senza
+    l'intestazione corrispondente viene rifiutato con 403.
+    """
+
+    def __init__(self, percorso: Optional[str] = None, segreto: Optional[str] = None):
+        self.percorso = '/' + (percorso or WEBHOOK_PATH_DEFAULT).strip('/')
+        self.segreto = segreto if segreto is not None else WEBHOOK_SECRET_DEFAULT
+        # Senza segreto chiunque conosca il percorso potrebbe inviare update falsi
+        if not SEGRETO_VALIDO.fullmatch(self.segreto):
+            raise ValueError("WEBHOOK_SECRET mancante o non valido: 1-256 caratteri tra A-Z, a-z, 0-9, _ e -")
+        self._app = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Contatori
+        self.ricevuti = 0
+        self.rifiutati = 0
+
+    def collega(self, app, loop: asyncio.AbstractEventLoop):
+        self._app, self._loop = app, loop
+
+    def scollega(self):
+        self._app = self._loop = None
+
+    def gestisce(self, percorso: str) -> bool:
+        return percorso.split('?', 1)[0].rstrip('/') == self.percorso
+
+    def ricevi(self, intestazioni: Mapping[str, str], corpo: bytes) -> int:
+        """Status HTTP della consegna (200 accodato, 4xx rifiutato, 503 bot non pronto)"""
+        if not hmac.compare_digest(
+                intestazioni.get(INTESTAZIONE_SEGRETO, '').encode(), self.segreto.encode()):
+            self.rifiutati += 1
+            return 403
+
+        app, loop = self._app, self._loop
+        if app is None or loop is None or loop.is_closed():
+            return 503
+
+        try:
+            update = Update.de_json(json.loads(corpo), app.bot)
+        except Exception as e:
+            logger.warning(f"🪝 Update non valido: {e}")
+            self.rifiutati += 1
+            return 400
+
+        asyncio.run_coroutine_threadsafe(app.update_queue.put(update), loop)
+        self.ricevuti += 1
+        return 200
+
+
+async def esegui_webhook(app, ricevitore: RicevitoreWebhook, url_base: Optional[str] = None,
+                         stop: Optional[asyncio.Event] = None):
+    """
+    Ciclo di vita dell'Application in modalità webhook (al posto di run_polling).
+
+    Registra il webhook su Telegram, collega il ricevitore al loop corrente
+    ed elabora gli update fino a SIGINT/SIGTERM (o finché `stop` non è impostato).
+    """
+    url_base = (url_base if url_base is not None else WEBHOOK_URL_DEFAULT).rstrip('/')
+    if not url_base:
+        raise ValueError("WEBHOOK_URL mancante: serve l'URL pubblico del bot")
+
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for segnale in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(segnale, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    await app.initialize()
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        await app.bot.set_webhook(
+            url=url_base + ricevitore.percorso,
+            secret_token=ricevitore.segreto,
+            allowed_updates=['message'],
+        )
+        logger.info(f"🪝 Webhook registrato su {url_base}{ricevitore.percorso}")
+
+        await app.start()
+        ricevitore.collega(app, loop)
+        await stop.wait()
+    finally:
+        ricevitore.scollega()
+        if app.running:
+            await app.stop()
+        await app.shutdown()